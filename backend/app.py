@@ -1,22 +1,35 @@
 from flask import Flask, jsonify
-from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-from mongoengine import connect
 from config import Config
+from commands import db_cli
+from cache import cache
+from metrics import metrics
+from content_encoding import compression
+from ratelimit import limiter
+from serializers import FastJSONProvider
+from db import init_db, ping, pool_metrics
+from tokens import TokenManager, TokenUser, claims_cache, revocations
+import snapshots
 
 from routes.auth import auth
 from routes.students import students
 from routes.medicines import medicines
 from routes.treatments import treatments
+from routes.stats import stats
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # orjson ถ้าติดตั้งไว้ (fallback เป็น json ของ standard library)
 app.config.from_object(Config)
 
-CORS(app)
-jwt = JWTManager(app)  # เก็บ JWTManager ไว้ในตัวแปร
+CORS(app, expose_headers=['X-Next-Cursor', 'ETag'])
+cache.init_app(app)
+metrics.init_app(app)  # METRICS_ENABLED=1: latency, คำสั่ง MongoDB และเวลา serialize ที่ /metrics
+compression.init_app(app)  # gzip/br/zstd ตาม Accept-Encoding
+limiter.init_app(app)  # RATE_LIMIT_ENABLED=1: token bucket ต่อ IP / ผู้ใช้ ตอบ 429 + Retry-After
+jwt = TokenManager(app)  # JWTManager ที่ cache claims ของ token ที่ตรวจแล้ว
 
-# เชื่อมต่อ MongoDB ด้วย mongoengine โดยตรง
-connect(host=app.config["MONGODB_SETTINGS"]["host"])
+# เชื่อมต่อ MongoDB ด้วย mongoengine (lazy จึง fork-safe สำหรับ gunicorn)
+init_db(app)
 
 # JWT Error Handlers - เพิ่มส่วนนี้
 @jwt.unauthorized_loader
@@ -35,17 +48,45 @@ def expired_token_callback(jwt_header, jwt_payload):
 def revoked_token_callback(jwt_header, jwt_payload):
     return jsonify({'error': 'Token ถูกยกเลิกแล้ว'}), 401
 
+# ตรวจ token ที่ logout แล้วจากรายการใน memory (sync กับ MongoDB ทุก JWT_REVOCATION_SYNC_SECONDS)
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return revocations.is_revoked(jwt_payload['jti'])
+
+# current_user สร้างจาก claims ใน token ไม่ต้อง query User
+@jwt.user_lookup_loader
+def user_lookup_callback(jwt_header, jwt_payload):
+    return TokenUser(id=jwt_payload['sub'], username=jwt_payload.get('username'))
+
 # ลงทะเบียน Blueprints
 app.register_blueprint(auth, url_prefix='/api')
 app.register_blueprint(students, url_prefix='/api')
 app.register_blueprint(medicines, url_prefix='/api')
 app.register_blueprint(treatments, url_prefix='/api')
+app.register_blueprint(stats, url_prefix='/api')
+
+# คำสั่ง CLI: flask --app app db sync-indexes
+app.cli.add_command(db_cli)
 
 # Route หลักสำหรับทดสอบ
 @app.route('/')
 def home():
     return jsonify({'message': 'Hospital API is running!', 'version': '1.0'})
 
+# Liveness: process ยังตอบ request ได้ (ไม่แตะฐานข้อมูล)
+@app.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+# Readiness: พร้อมรับ traffic เมื่อเชื่อมต่อ MongoDB ได้
+@app.route('/readyz')
+def readyz():
+    try:
+        ping()
+    except Exception as e:
+        return jsonify({'status': 'unavailable', 'error': str(e)}), 503
+    return jsonify({'status': 'ready'})
+
 # Route สำหรับดู routes ทั้งหมด (เพื่อ debug)
 @app.route('/debug/routes')
 def show_routes():
@@ -58,5 +99,41 @@ def show_routes():
         })
     return {'routes': routes}
 
+# Route สำหรับดูสถิติ cache (hit/miss) เพื่อ monitoring
+@app.route('/debug/cache')
+def show_cache_stats():
+    return jsonify(cache.stats())
+
+# Route สำหรับดูจำนวน response ที่บีบอัด, byte ก่อน/หลังบีบอัด และ hit ของ cache ที่บีบอัดไว้แล้ว
+@app.route('/debug/compression')
+def show_compression_stats():
+    return jsonify(compression.stats())
+
+# Route สำหรับดูการตั้งค่า rate limit และจำนวน bucket ที่ worker นี้เก็บไว้
+@app.route('/debug/ratelimit')
+def show_ratelimit_stats():
+    return jsonify(limiter.stats())
+
+# Route สำหรับดูจำนวน token ใน cache และจำนวน token ที่ถูกยกเลิกที่ worker นี้รู้จัก
+@app.route('/debug/tokens')
+def show_token_stats():
+    return jsonify({'cached_claims': len(claims_cache), 'revoked': len(revocations)})
+
+# Route สำหรับรอให้งาน sync ชื่อใน Treatment ที่ค้างอยู่ใน worker นี้ทำเสร็จ (ใช้ในการทดสอบแทนการ poll)
+@app.route('/debug/snapshots')
+def drain_snapshot_sync():
+    snapshots.drain()
+    return jsonify({'mode': app.config.get('SNAPSHOT_SYNC', 'background'), 'pending': 0})
+
+# Route สำหรับดูการใช้งาน MongoDB connection pool (ใช้ปรับ MONGO_MAX_POOL_SIZE)
+@app.route('/debug/pool')
+def show_pool_stats():
+    return jsonify({
+        'max_pool_size': app.config.get('MONGO_MAX_POOL_SIZE'),
+        'read_preference': app.config.get('MONGO_READ_PREFERENCE'),
+        'servers': pool_metrics.stats()
+    })
+
+# สำหรับพัฒนาเท่านั้น production ใช้ gunicorn: gunicorn -c gunicorn.conf.py app:app
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
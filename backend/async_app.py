@@ -0,0 +1,456 @@
+"""
+ASGI app แบบ async (ทางเลือก) ใช้ Quart + Motor สำหรับ route อ่านข้อมูลที่ถูกเรียกบ่อย
+route อื่นทั้งหมด (เขียนข้อมูล, auth, stats, debug) ส่งต่อให้ Flask app เดิมผ่าน WsgiToAsgi
+จึงมี path และรูปแบบ JSON เหมือนกันทุก route
+
+    pip install -r requirements-async.txt
+    hypercorn 'async_app:create_app()' --bind 0.0.0.0:5000 --workers 4
+    uvicorn --factory async_app:create_app --host 0.0.0.0 --port 5000 --workers 4
+"""
+import re
+from datetime import datetime
+from functools import wraps
+
+import jwt
+from asgiref.wsgi import WsgiToAsgi
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from quart import Quart, Blueprint, Response, request, jsonify, current_app, g, make_response, stream_with_context
+from quart.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
+
+from config import Config
+from models import Student, Medicine, Treatment, CollectionVersion, RevokedToken, normalize_search_text
+from cache import cache, key_for, MISSING
+from etag import collection_names, versions_from, request_etag, not_modified, tag_response, document_etag
+from db import client_options, read_preference, event_listeners
+from tokens import revocations, access_claims, TokenRevoked
+from ratelimit import limiter
+from content_encoding import compression
+from pagination import PaginationError, parse_page_args, encode_cursor, project
+from streaming import NDJSON_MIMETYPE, wants_stream
+from serializers import FastJSONMixin, student_dict, medicine_dict
+from routes.students import STUDENT_FIELDS
+from routes.medicines import MEDICINE_FIELDS, rank_search_results
+from routes.treatments import (
+    TREATMENT_FIELDS, snapshot_misses, treatments_to_dicts, history_query, history_page, history_to_dict
+)
+
+api = Blueprint('async_api', __name__)
+
+
+def db():
+    return current_app.extensions['motor_db']
+
+
+def collection(model):
+    return db()[model._get_collection_name()]
+
+
+def read_collection(model):
+    """collection สำหรับ route ที่อ่านอย่างเดียว ใช้ MONGO_READ_PREFERENCE (อาจอ่านจาก secondary)"""
+    return collection(model).with_options(read_preference=read_preference(current_app.config))
+
+
+# ---------- JWT / ETag / cache: ส่วน I/O ด้วย Motor ส่วนตรวจสอบใช้ tokens, etag และ cache ร่วมกับ Flask app ----------
+
+async def sync_revocations():
+    """sync รายการ token ที่ถูกยกเลิกด้วย Motor ถ้าถึงเวลา (เทียบเท่า revocations.sync() ของ Flask app)"""
+    since = revocations.begin_sync()
+    if since is MISSING:
+        return
+    started = datetime.utcnow()
+    try:
+        cursor = collection(RevokedToken).find(*revocations.sync_query(since))
+        rows = [(doc['_id'], doc['expires_at']) async for doc in cursor]
+    except Exception:
+        revocations.abort_sync()
+        raise
+    revocations.finish_sync(rows, started)
+
+
+def bearer_token():
+    header = request.headers.get('Authorization', '')
+    return header[len('Bearer '):] if header.startswith('Bearer ') else None
+
+
+def jwt_required(view):
+    """ตรวจ access token แบบเดียวกับ flask_jwt_extended (HS256, header Authorization: Bearer, token ที่ logout แล้ว)"""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        token = bearer_token()
+        if token is None:
+            return jsonify({'error': 'ต้องมี Authorization token'}), 401
+        await sync_revocations()
+        try:
+            g.jwt = access_claims(token, current_app.config)
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Token หมดอายุแล้ว'}), 401
+        except TokenRevoked:
+            return jsonify({'error': 'Token ถูกยกเลิกแล้ว'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Token ไม่ถูกต้อง'}), 401
+        return await view(*args, **kwargs)
+    return wrapper
+
+
+async def read_versions(*models):
+    """version ของ collection (เทียบเท่า etag.collection_versions) เก็บไว้ใน g ให้ cached_by_id ใช้เป็น key"""
+    names = collection_names(*models)
+    docs = await read_collection(CollectionVersion).find({'_id': {'$in': names}}).to_list(None)
+    g.collection_versions = dict(versions_from(names, docs))
+    return g.collection_versions
+
+
+def conditional(*models):
+    """ETag จาก CollectionVersion และตอบ 304 เมื่อ If-None-Match ตรงกัน (เหมือน etag.conditional)"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            versions = await read_versions(*models)
+            etag = g.etag = request_etag(versions.items(), request)
+            if not_modified(request, etag):
+                return tag_response(Response('', 304), etag)
+            return tag_response(await make_response(await view(*args, **kwargs)), etag)
+        return wrapper
+    return decorator
+
+
+def request_key():
+    return key_for(request, g.get('etag'))
+
+
+async def cached_by_id(namespace, model, to_dict, ids):
+    """
+    เหมือน get_students_by_id / get_medicines_by_id: อ่านจาก cache ก่อน ที่เหลือดึงด้วย $in ครั้งเดียว (to_dict รับ raw document)
+    key ตาม version ของ collection ที่ conditional อ่านไว้ (อ่านเองถ้า route ไม่มี @conditional ของ model นี้)
+    """
+    name = model._get_collection_name()
+    versions = g.get('collection_versions') or {}
+    version = versions[name] if name in versions else (await read_versions(model))[name]
+    found, missing = cache.lookup_many(namespace, {str(i) for i in ids}, version)
+    if missing:
+        object_ids = [ObjectId(key) for key in missing if ObjectId.is_valid(key)]
+        loaded = {str(doc['_id']): to_dict(doc) async for doc in read_collection(model).find({'_id': {'$in': object_ids}})}
+        cache.set_many(namespace, loaded, version=version)
+        found.update(loaded)
+    return found
+
+
+# ---------- pagination / streaming บน Motor cursor ----------
+
+def _db_field(name):
+    return '_id' if name == 'id' else name
+
+
+def keyset_cursor(model, key, field_map, after=None, fields=None, limit=None):
+    """cursor ของ keyset pagination แบบเดียวกับ pagination.paginate"""
+    projection = None
+    if fields:
+        projection = {_db_field(field_map[f]): 1 for f in fields}
+        projection[_db_field(key)] = 1
+    query = {_db_field(key): {'$gt': after}} if after is not None else {}
+    cursor = read_collection(model).find(query, projection).sort(_db_field(key), 1)
+    if limit is not None:
+        cursor = cursor.limit(limit + 1)
+    else:
+        cursor = cursor.batch_size(current_app.config.get('STREAM_BATCH_SIZE', 500))
+    return cursor
+
+
+async def paginate(model, key, field_map, limit, after, fields):
+    docs = await keyset_cursor(model, key, field_map, after, fields, limit).to_list(None)
+    if limit is None or len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1][_db_field(key)])
+
+
+def page_response(data, next_cursor):
+    response = jsonify(data)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+def ndjson_response(rows):
+    """rows เป็น async iterator ของ dict ส่งออกทีละบรรทัด"""
+    @stream_with_context
+    async def generate():
+        dumps = current_app.json.dumps
+        async for row in rows:
+            yield (dumps(row) + '\n').encode('utf-8')
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+
+# ---------- Students ----------
+
+@api.route('/students', methods=['GET'])
+@jwt_required
+@conditional(Student)
+async def get_students():
+    try:
+        limit, after, fields = parse_page_args(request.args, current_app.config, STUDENT_FIELDS, 'student_id')
+    except PaginationError as pe:
+        return jsonify({'error': str(pe)}), 400
+    if wants_stream(request):
+        cursor = keyset_cursor(Student, 'student_id', STUDENT_FIELDS, after, fields)
+        return ndjson_response(project(student_dict(doc), fields) async for doc in cursor)
+
+    page = cache.get('students:list', request_key())
+    if page is MISSING:
+        docs, next_cursor = await paginate(Student, 'student_id', STUDENT_FIELDS, limit, after, fields)
+        page = {'items': [project(student_dict(doc), fields) for doc in docs], 'next_cursor': next_cursor}
+        cache.set('students:list', request_key(), page)
+    return page_response(page['items'], page['next_cursor'])
+
+
+@api.route('/students/<student_id>', methods=['GET'])
+@jwt_required
+async def get_student(student_id):
+    # ETag คือ "<id>-<version>" ของเอกสาร เหมือน routes.students.get_student (ใช้เป็น If-Match ของ PUT/DELETE ได้)
+    student = (await cached_by_id('students', Student, student_dict, [student_id])).get(student_id)
+    if not student:
+        return jsonify({'error': 'Student not found'}), 404
+    response = jsonify(student)
+    response.set_etag(document_etag(student['id'], student['version']))
+    return await response.make_conditional(request)
+
+
+# ---------- Medicines ----------
+
+@api.route('/medicines', methods=['GET'])
+@jwt_required
+@conditional(Medicine)
+async def get_medicines():
+    try:
+        limit, after, fields = parse_page_args(request.args, current_app.config, MEDICINE_FIELDS, 'id')
+    except PaginationError as pe:
+        return jsonify({'error': str(pe)}), 400
+    if wants_stream(request):
+        cursor = keyset_cursor(Medicine, 'id', MEDICINE_FIELDS, after, fields)
+        return ndjson_response(project(medicine_dict(doc), fields) async for doc in cursor)
+
+    page = cache.get('medicines:list', request_key())
+    if page is MISSING:
+        docs, next_cursor = await paginate(Medicine, 'id', MEDICINE_FIELDS, limit, after, fields)
+        page = {'items': [project(medicine_dict(doc), fields) for doc in docs], 'next_cursor': next_cursor}
+        cache.set('medicines:list', request_key(), page)
+    return page_response(page['items'], page['next_cursor'])
+
+
+@api.route('/medicines/search', methods=['GET'])
+@jwt_required
+@conditional(Medicine)
+async def search_medicines():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter "q" is required'}), 400
+
+    mode = request.args.get('mode', 'prefix')
+    if mode not in ('prefix', 'substring'):
+        return jsonify({'error': 'mode must be "prefix" or "substring"'}), 400
+
+    limit = request.args.get('limit')
+    if limit is not None or mode == 'prefix':
+        try:
+            limit = int(limit or current_app.config.get('SEARCH_DEFAULT_LIMIT', 20))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        if limit <= 0:
+            return jsonify({'error': 'limit must be greater than 0'}), 400
+        limit = min(limit, current_app.config.get('PAGE_MAX_LIMIT', 1000))
+
+    results = cache.get('medicines:list', request_key())
+    if results is not MISSING:
+        return jsonify(results)
+
+    if mode == 'substring':
+        cursor = read_collection(Medicine).find({'$or': [
+            {'name': {'$regex': query, '$options': 'i'}},
+            {'brand': {'$regex': query, '$options': 'i'}}
+        ]})
+        if limit:
+            cursor = cursor.limit(limit)
+        results = [medicine_dict(doc) async for doc in cursor]
+    else:
+        q = normalize_search_text(query)
+        factor = current_app.config.get('SEARCH_CANDIDATE_FACTOR', 5)
+        prefix = re.compile('^' + re.escape(q))
+        fields = {'name': 1, 'brand': 1, 'stock': 1}
+        # ชื่อที่ตรงกัน/ขึ้นต้นด้วย q ก่อน แล้วจึงเติมจาก search_keys เหมือน Flask app
+        candidates = await read_collection(Medicine).find({'search_name': prefix}, fields).sort('search_name', 1).limit(limit).to_list(None)
+        if len(candidates) < limit:
+            rest = read_collection(Medicine).find(
+                {'search_keys': prefix, '_id': {'$nin': [doc['_id'] for doc in candidates]}}, fields
+            ).limit(limit * factor)
+            candidates += await rest.to_list(None)
+        results = [medicine_dict(doc) for doc in rank_search_results(candidates, q, limit)]
+    cache.set('medicines:list', request_key(), results)
+    return jsonify(results)
+
+
+# ---------- Treatments ----------
+
+async def render_treatments(docs):
+    student_ids, medicine_ids = snapshot_misses(docs)
+    students_by_id = await cached_by_id('students', Student, student_dict, student_ids) if student_ids else {}
+    medicines_by_id = await cached_by_id('medicines', Medicine, medicine_dict, medicine_ids) if medicine_ids else {}
+    return treatments_to_dicts(docs, students_by_id, medicines_by_id)
+
+
+@api.route('/treatments', methods=['GET'])
+@jwt_required
+@conditional(Treatment, Student, Medicine)
+async def get_treatments():
+    try:
+        limit, after, fields = parse_page_args(request.args, current_app.config, TREATMENT_FIELDS, 'id')
+    except PaginationError as pe:
+        return jsonify({'error': str(pe)}), 400
+    if wants_stream(request):
+        async def rows():
+            batch_size = current_app.config.get('STREAM_BATCH_SIZE', 500)
+            cursor = keyset_cursor(Treatment, 'id', {}, after)
+            while True:
+                docs = await cursor.to_list(batch_size)
+                if not docs:
+                    return
+                for t in await render_treatments(docs):
+                    yield project(t, fields)
+        return ndjson_response(rows())
+
+    docs, next_cursor = await paginate(Treatment, 'id', TREATMENT_FIELDS, limit, after, None)
+    return page_response([project(t, fields) for t in await render_treatments(docs)], next_cursor)
+
+
+@api.route('/treated_students', methods=['GET'])
+@jwt_required
+@conditional(Treatment, Student)
+async def get_treated_students():
+    student_ids = await read_collection(Treatment).distinct('student')
+    students_by_id = {
+        doc['_id']: doc
+        async for doc in read_collection(Student).find({'_id': {'$in': student_ids}}, {'name': 1, 'student_id': 1})
+    }
+    return jsonify([
+        {'id': str(sid), 'name': students_by_id[sid].get('name'), 'student_id': students_by_id[sid].get('student_id')}
+        for sid in student_ids if sid in students_by_id
+    ]), 200
+
+
+@api.route('/treatment_history/<student_id>', methods=['GET'])
+@jwt_required
+@conditional(Treatment, Student, Medicine)
+async def treatment_history(student_id):
+    doc = await collection(Student).find_one({'student_id': student_id}, {'name': 1, 'student_id': 1})
+    if not doc:
+        return jsonify({'error': 'Student not found'}), 404
+    student = Student._from_son(doc)
+
+    try:
+        limit, pipeline = history_query(request.args, current_app.config)
+    except PaginationError as pe:
+        return jsonify({'error': str(pe)}), 400
+    query = {'student': student.id}
+    docs = await read_collection(Treatment).aggregate([{'$match': query}] + pipeline).to_list(None)
+    rows, next_cursor = history_page(docs, limit)
+    # treatment_count มีทุกหน้า เหมือน routes.treatments.treatment_history
+    count = await read_collection(Treatment).count_documents(query)
+
+    _, medicine_ids = snapshot_misses(rows)
+    medicines_by_id = await cached_by_id('medicines', Medicine, medicine_dict, medicine_ids) if medicine_ids else {}
+    return jsonify(history_to_dict(student, count, rows, next_cursor, medicines_by_id)), 200
+
+
+# ---------- app factory ----------
+
+class FastJSONProvider(FastJSONMixin, DefaultJSONProvider):
+    """JSON provider ของ Quart ที่ใช้ orjson แบบเดียวกับ Flask app (serializers.FastJSONProvider)"""
+
+
+class Dispatcher:
+    """
+    ASGI app ที่ส่ง GET/HEAD ของ route ที่ Quart รองรับไปยัง async_app
+    request อื่นทั้งหมด (รวม OPTIONS preflight ของ CORS) ไปยัง Flask app ผ่าน WsgiToAsgi (thread pool)
+    """
+
+    def __init__(self, async_app, wsgi_app):
+        self.async_app = async_app
+        self.wsgi_app = WsgiToAsgi(wsgi_app)
+        self.adapter = async_app.url_map.bind('')
+
+    def handles(self, scope):
+        if scope['method'] not in ('GET', 'HEAD'):
+            return False
+        try:
+            self.adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return False
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self.handles(scope):
+            return await self.async_app(scope, receive, send)
+        return await self.wsgi_app(scope, receive, send)
+
+
+def create_app(wsgi_app=None):
+    if wsgi_app is None:
+        from app import app as wsgi_app
+
+    app = Quart(__name__, static_folder=None)
+    app.config.from_object(Config)
+    app.json = FastJSONProvider(app)
+    app.register_blueprint(api, url_prefix='/api')
+
+    @app.before_serving
+    async def connect_motor():
+        # สร้าง client ใน event loop ของ worker แต่ละตัว (หลัง fork)
+        client = AsyncIOMotorClient(event_listeners=event_listeners(), **client_options(app.config))
+        app.extensions['motor_client'] = client
+        app.extensions['motor_db'] = client.get_default_database()
+
+    @app.after_serving
+    async def close_motor():
+        app.extensions['motor_client'].close()
+
+    url_adapter = wsgi_app.url_map.bind('localhost')
+
+    @app.before_request
+    async def rate_limit():
+        # limiter เดียวกับ Flask app (cost ตาม endpoint ของ Flask เช่น medicines.search_medicines)
+        if not limiter.enabled or request.method == 'OPTIONS':
+            return None
+        try:
+            endpoint, _ = url_adapter.match(request.path, request.method)
+        except HTTPException:
+            return None
+        if limiter.cost_for(endpoint) <= 0:
+            return None
+        identity = None
+        token = bearer_token()
+        if token is not None:
+            try:
+                identity = access_claims(token, current_app.config).get('sub')
+            except jwt.InvalidTokenError:
+                identity = None
+        rejected = limiter.reject(endpoint, request.remote_addr, request.headers.get('X-Forwarded-For'), identity)
+        if rejected:
+            body, headers = rejected
+            return jsonify(body), 429, headers
+        return None
+
+    @app.after_request
+    async def compress(response):
+        # ค่าตั้งและ cache เดียวกับ Flask app (compression.init_app ถูกเรียกตอน import app)
+        return await compression.compress_async(response, request)
+
+    @app.after_request
+    async def cors_headers(response):
+        # เหมือน CORS(app, expose_headers=[...]) ของ Flask app
+        if request.headers.get('Origin'):
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            response.headers['Access-Control-Expose-Headers'] = 'ETag, X-Next-Cursor'
+        return response
+
+    return Dispatcher(app, wsgi_app)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+เปรียบเทียบ Flask (gunicorn gthread) กับ async_app (Quart + Motor) ที่ความพร้อมกันหลายระดับ
+
+    GUNICORN_BIND=0.0.0.0:5000 gunicorn -c gunicorn.conf.py app:app
+    hypercorn 'async_app:create_app()' --bind 0.0.0.0:5001 --workers 4
+    python bench/async_bench.py --sync-url http://localhost:5000 --async-url http://localhost:5001
+
+ทั้งสอง server ต้องใช้ฐานข้อมูลเดียวกัน ผลลัพธ์คือ requests/second และ p95 ของแต่ละระดับ
+"""
+
+import argparse
+import json
+
+from load_test import DEFAULT_ENDPOINTS, get_token, run, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Side-by-side concurrency benchmark: sync Flask vs async Quart/Motor.')
+    parser.add_argument('--sync-url', default='http://localhost:5000')
+    parser.add_argument('--async-url', default='http://localhost:5001')
+    parser.add_argument('--levels', default='8,32,128', help='Comma-separated concurrency levels.')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per level and server.')
+    parser.add_argument('--endpoint', action='append', dest='endpoints', help='GET path to hit (repeatable).')
+    parser.add_argument('--username', default='loadtest')
+    parser.add_argument('--password', default='loadtest-password')
+    parser.add_argument('--json', dest='json_out', help='Also write the results to this file.')
+    args = parser.parse_args()
+
+    servers = {'sync': args.sync_url.rstrip('/'), 'async': args.async_url.rstrip('/')}
+    tokens = {name: get_token(url, args.username, args.password) for name, url in servers.items()}
+    endpoints = args.endpoints or DEFAULT_ENDPOINTS
+
+    results = []
+    print(f"{'concurrency':>11} {'server':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for level in (int(n) for n in args.levels.split(',')):
+        row = {'concurrency': level}
+        for name, url in servers.items():
+            samples, wall = run(url, endpoints, tokens[name], level, args.duration)
+            total = summarize(samples, wall)['total']
+            row[name] = total
+            print(f"{level:>11} {name:>6} {total['rps']:>9} {total['p50_ms']:>9} "
+                  f"{total['p95_ms']:>9} {total['p99_ms']:>9} {total['errors']:>7}")
+        if row['sync']['rps']:
+            print(f"{'':>11} {'gain':>6} {row['async']['rps'] / row['sync']['rps']:>8.2f}x")
+        results.append(row)
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+วัดขนาดที่ส่งจริง (bytes on wire) และ CPU ที่ใช้บีบอัดของแต่ละ encoding กับ response ขนาดใหญ่
+
+1. body ของ GET /api/students, /api/medicines, /api/treatments (ไม่มี limit) และ /api/treatments?stream=1
+   บีบอัดด้วยทุก encoding ที่ติดตั้งไว้ (gzip เสมอ, br ถ้ามี brotli, zstd ถ้ามี zstandard) หลายระดับ
+   รายงานขนาด, อัตราส่วน และ CPU ms ต่อ response (time.process_time, median)
+2. ยิง request จริงผ่าน app ด้วย Accept-Encoding แต่ละแบบ: ครั้งแรก (บีบอัดใหม่) เทียบกับครั้งถัดไป
+   (ได้จาก cache ตาม ETag)
+
+    python bench/compression_bench.py --backend mongomock
+    python bench/compression_bench.py --backend mongod --mongo-uri mongodb://localhost:27017/hospital_bench
+
+ใช้ start_app / seed ของ bench/suite.py (ฐานข้อมูลจะถูกล้างแล้วสร้างข้อมูลใหม่)
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+from suite import start_app, seed
+
+LEVELS = {'gzip': [1, 6, 9], 'br': [1, 4, 9, 11], 'zstd': [1, 3, 9, 19]}
+PATHS = ['/api/students', '/api/medicines', '/api/treatments', '/api/treatments?stream=1']
+
+
+def cpu_ms(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        samples.append((time.process_time() - start) * 1000)
+    return result, statistics.median(samples)
+
+
+def wall_ms(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
+
+
+def login(client):
+    credentials = {'username': 'bench', 'password': 'bench-password'}
+    client.post('/api/register', json=credentials)
+    token = client.post('/api/login', json=credentials).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def fetch(client, path, headers):
+    # อ่าน body ให้ครบก่อน request ถัดไป (response แบบ stream สร้าง body ตอนถูกอ่าน)
+    response = client.get(path, headers=headers)
+    response.get_data()
+    return response
+
+
+def codec_table(bodies, repeat):
+    from content_encoding import CODECS
+
+    print(f'\nEncoding cost, median of {repeat} (CPU ms per response)')
+    print(f"{'response':<28}{'encoding':<10}{'level':>6}{'bytes':>11}{'ratio':>8}{'cpu ms':>9}{'MB/s':>8}")
+    for path, body in bodies.items():
+        print(f"{path:<28}{'identity':<10}{'':>6}{len(body):>11}{1:>8.3f}{0:>9.1f}{'':>8}")
+        for encoding, levels in LEVELS.items():
+            if encoding not in CODECS:
+                continue
+            compress = CODECS[encoding][0]
+            for level in levels:
+                compressed, ms = cpu_ms(lambda: compress(body, level), repeat)
+                speed = len(body) / 1e6 / (ms / 1000) if ms else float('inf')
+                print(f'{"":<28}{encoding:<10}{level:>6}{len(compressed):>11}'
+                      f'{len(compressed) / len(body):>8.3f}{ms:>9.1f}{speed:>8.0f}')
+
+
+def http_table(client, headers, repeat):
+    from content_encoding import CODECS, compression
+
+    print(f'\nThrough the app, median of {repeat} (ms, bytes on wire = body after Content-Encoding)')
+    print(f"{'response':<28}{'encoding':<10}{'bytes':>11}{'first':>9}{'cached':>9}")
+    for path in PATHS:
+        for encoding in ['identity'] + [e for e in compression.encodings if e in CODECS]:
+            request_headers = {**headers, 'Accept-Encoding': encoding}
+            if compression.cache is not None:
+                compression.cache.clear()
+            response, first = wall_ms(lambda: fetch(client, path, request_headers), 1)
+            response, cached = wall_ms(lambda: fetch(client, path, request_headers), repeat)
+            assert response.status_code == 200, response.status_code
+            assert response.headers.get('Content-Encoding', 'identity') == encoding, response.headers
+            print(f'{path:<28}{encoding:<10}{len(response.data):>11}{first:>9.1f}{cached:>9.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Response compression benchmark (bytes on wire and CPU).')
+    parser.add_argument('--backend', choices=['mongomock', 'mongod'], default='mongomock')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/hospital_bench',
+                        help='Database to (re)create when --backend mongod.')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--medicines', type=int, default=200)
+    parser.add_argument('--treatments', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (median is reported).')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    # วัดการบีบอัด ไม่ใช่ cache ของข้อมูล (cache ของ response ที่บีบอัดแล้วยังเปิดอยู่)
+    os.environ['CACHE_BACKEND'] = 'none'
+    os.environ['COMPRESSION_ENABLED'] = '1'
+    app = start_app(args.backend, args.mongo_uri)
+    from content_encoding import CODECS
+    missing = [name for name in ('br', 'zstd') if name not in CODECS]
+    if missing:
+        print(f"note: {', '.join(missing)} skipped (pip install brotli zstandard)")
+
+    print(f'Seeding {args.students} students, {args.medicines} medicines, {args.treatments} treatments ...')
+    seed(args.students, args.medicines, args.treatments, 180, random.Random(args.seed))
+
+    client = app.test_client()
+    headers = login(client)
+    bodies = {}
+    for path in PATHS:
+        response = client.get(path, headers={**headers, 'Accept-Encoding': 'identity'})
+        assert response.status_code == 200, response.status_code
+        bodies[path] = response.data
+    codec_table(bodies, args.repeat)
+    http_table(client, headers, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Load test สำหรับเปรียบเทียบ throughput ของ server แต่ละแบบ เช่น
+
+    # development server เดิม (process เดียว)
+    python app.py
+    python bench/load_test.py --url http://localhost:5000
+
+    # gunicorn gthread
+    GUNICORN_WORKERS=4 GUNICORN_THREADS=8 gunicorn -c gunicorn.conf.py app:app
+    python bench/load_test.py --url http://localhost:5000
+
+ยิง request พร้อมกันตามจำนวน --concurrency เป็นเวลา --duration วินาที
+แล้วรายงาน requests/second และ latency p50/p95/p99 ของแต่ละ endpoint
+"""
+
+import argparse
+import json
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_ENDPOINTS = [
+    '/api/students',
+    '/api/medicines',
+    '/api/treatments?limit=50',
+    '/api/medicines/search?q=para',
+    '/healthz',
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def get_token(base_url, username, password):
+    """สมัครผู้ใช้สำหรับ load test (ถ้ายังไม่มี) แล้ว login เอา access token"""
+    requests.post(f'{base_url}/api/register', json={'username': username, 'password': password}, timeout=10)
+    response = requests.post(f'{base_url}/api/login', json={'username': username, 'password': password}, timeout=10)
+    response.raise_for_status()
+    return response.json()['access_token']
+
+
+def worker(base_url, endpoints, token, deadline, results, offset):
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    i = offset
+    while time.perf_counter() < deadline:
+        path = endpoints[i % len(endpoints)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = session.get(base_url + path, timeout=30)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        results[path].append((elapsed, ok))
+
+
+def run(base_url, endpoints, token, concurrency, duration):
+    results = defaultdict(list)
+    per_thread = [defaultdict(list) for _ in range(concurrency)]
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for n in range(concurrency):
+            pool.submit(worker, base_url, endpoints, token, deadline, per_thread[n], n)
+    wall = time.perf_counter() - started
+    for partial in per_thread:
+        for path, samples in partial.items():
+            results[path].extend(samples)
+    return results, wall
+
+
+def summarize(results, wall):
+    report = {'endpoints': {}, 'total': {}}
+    all_latencies = []
+    total_errors = 0
+    for path, samples in sorted(results.items()):
+        latencies = [ms for ms, _ in samples]
+        errors = sum(1 for _, ok in samples if not ok)
+        all_latencies.extend(latencies)
+        total_errors += errors
+        report['endpoints'][path] = {
+            'requests': len(samples),
+            'errors': errors,
+            'rps': round(len(samples) / wall, 1),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'mean_ms': round(statistics.mean(latencies), 2) if latencies else 0.0,
+        }
+    report['total'] = {
+        'requests': len(all_latencies),
+        'errors': total_errors,
+        'rps': round(len(all_latencies) / wall, 1),
+        'p50_ms': round(percentile(all_latencies, 50), 2),
+        'p95_ms': round(percentile(all_latencies, 95), 2),
+        'p99_ms': round(percentile(all_latencies, 99), 2),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{'endpoint':40} {'req':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for path, row in report['endpoints'].items():
+        print(f"{path:40} {row['requests']:>7} {row['errors']:>5} {row['rps']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+    total = report['total']
+    print(f"{'TOTAL':40} {total['requests']:>7} {total['errors']:>5} {total['rps']:>8} "
+          f"{total['p50_ms']:>8} {total['p95_ms']:>8} {total['p99_ms']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load test for the Hospital API.')
+    parser.add_argument('--url', default='http://localhost:5000', help='Base URL of the running API.')
+    parser.add_argument('--concurrency', type=int, default=32, help='Number of concurrent clients.')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run.')
+    parser.add_argument('--endpoint', action='append', dest='endpoints', help='GET path to hit (repeatable).')
+    parser.add_argument('--username', default='loadtest')
+    parser.add_argument('--password', default='loadtest-password')
+    parser.add_argument('--json', dest='json_out', help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    token = get_token(base_url, args.username, args.password)
+    results, wall = run(base_url, args.endpoints or DEFAULT_ENDPOINTS, token, args.concurrency, args.duration)
+    report = summarize(results, wall)
+    report['config'] = {'url': base_url, 'concurrency': args.concurrency, 'duration': args.duration}
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+วัด throughput และ latency ของ POST /api/login เมื่อมีคน login พร้อมกัน (เช่น ช่วงเปลี่ยนเวร)
+
+    python bench/login_bench.py --url http://localhost:5000 --concurrency 32 --duration 20
+
+เทียบค่า PASSWORD_HASH_METHOD / PASSWORD_HASH_WORKERS ต่าง ๆ ได้โดย restart server แล้วรันซ้ำ
+ผู้ใช้ที่สร้างไว้ก่อนจะถูก rehash ตอน login ครั้งแรกหลังเปลี่ยนค่า จึงควรรัน --warmup ก่อนวัดผล
+"""
+
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from load_test import percentile
+
+
+def ensure_users(base_url, count, password):
+    users = [f'loginbench{i}' for i in range(count)]
+    for username in users:
+        requests.post(f'{base_url}/api/register', json={'username': username, 'password': password}, timeout=30)
+    return users
+
+
+def worker(base_url, users, password, deadline, offset):
+    session = requests.Session()
+    samples = []
+    i = offset
+    while time.perf_counter() < deadline:
+        username = users[i % len(users)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            status = session.post(f'{base_url}/api/login', json={'username': username, 'password': password}, timeout=60).status_code
+        except requests.RequestException:
+            status = 'error'
+        samples.append(((time.perf_counter() - start) * 1000, status))
+    return samples
+
+
+def run(base_url, users, password, concurrency, duration):
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker, base_url, users, password, deadline, n) for n in range(concurrency)]
+        samples = [sample for future in futures for sample in future.result()]
+    return samples, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent login benchmark for the Hospital API.')
+    parser.add_argument('--url', default='http://localhost:5000', help='Base URL of the running API.')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run.')
+    parser.add_argument('--users', type=int, default=50, help='Number of distinct accounts to log in with.')
+    parser.add_argument('--password', default='loginbench-password')
+    parser.add_argument('--warmup', action='store_true', help='Log every user in once first (triggers any rehash).')
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    users = ensure_users(base_url, args.users, args.password)
+    if args.warmup:
+        for username in users:
+            requests.post(f'{base_url}/api/login', json={'username': username, 'password': args.password}, timeout=60)
+
+    samples, wall = run(base_url, users, args.password, args.concurrency, args.duration)
+    ok = [ms for ms, status in samples if status == 200]
+    statuses = Counter(status for _, status in samples)
+    print(f'logins: {len(samples)} in {wall:.1f}s  ({len(ok) / wall:.1f} successful/s)')
+    print(f'status: {dict(statuses)}')
+    print(f'latency ms  p50={percentile(ok, 50):.1f}  p95={percentile(ok, 95):.1f}  p99={percentile(ok, 99):.1f}  max={max(ok, default=0):.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+วัดเวลาแปลงผลลัพธ์ของ list endpoint ขนาดใหญ่ (ค่าเริ่มต้น 10,000 แถว) เป็น JSON
+
+1. แยกขั้นตอน: อ่านเป็น Document + student_to_dict/med_to_dict (วิธีเดิม) เทียบกับ as_pymongo() + serializers
+   และ json ของ standard library (DefaultJSONProvider เดิม) เทียบกับ FastJSONProvider (orjson)
+2. ทั้ง request: GET /api/students, /api/medicines, /api/treatments แบบไม่มี limit และปิด cache
+   เทียบ JSON provider ทั้งสองแบบ
+
+    python bench/serialize_bench.py --backend mongomock
+    python bench/serialize_bench.py --backend mongod --mongo-uri mongodb://localhost:27017/hospital_bench --rows 10000
+
+ใช้ start_app / seed ของ bench/suite.py (ฐานข้อมูลจะถูกล้างแล้วสร้างข้อมูลใหม่)
+กับ mongomock เวลาส่วนใหญ่ของ request คือการ copy เอกสารใน mongomock เอง
+ตัวเลขของทั้ง request จึงควรดูจาก --backend mongod
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+import requests
+
+from load_test import get_token
+from suite import start_app, seed, serve
+
+
+def timed(fn, repeat):
+    """คืนค่า (ผลลัพธ์ครั้งสุดท้าย, median ms)"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
+
+
+def stages(app, repeat):
+    from flask.json.provider import DefaultJSONProvider
+    from models import Student, Medicine
+    from routes.students import student_to_dict
+    from routes.medicines import med_to_dict
+    from serializers import FastJSONProvider, student_dict, medicine_dict
+
+    stdlib, fast = DefaultJSONProvider(app), FastJSONProvider(app)
+    cases = [
+        ('students', Student, 'student_id', student_to_dict, student_dict),
+        ('medicines', Medicine, 'id', med_to_dict, medicine_dict),
+    ]
+    rows = []
+    with app.app_context():
+        for name, model, key, document_builder, raw_builder in cases:
+            # queryset ใหม่ทุกครั้ง (queryset เดิมจะคืนผลลัพธ์ที่ cache ไว้)
+            docs, fetch_documents = timed(lambda: list(model.objects.order_by(key)), repeat)
+            raw, fetch_raw = timed(lambda: list(model.objects.order_by(key).as_pymongo()), repeat)
+            data, build_documents = timed(lambda: [document_builder(d) for d in docs], repeat)
+            _, build_raw = timed(lambda: [raw_builder(d) for d in raw], repeat)
+            _, encode_stdlib = timed(lambda: stdlib.dumps(data), repeat)
+            _, encode_fast = timed(lambda: fast.dumps(data), repeat)
+            rows.append((name, len(data), fetch_documents + build_documents + encode_stdlib,
+                         fetch_raw + build_raw + encode_fast, {
+                             'fetch': (fetch_documents, fetch_raw),
+                             'build': (build_documents, build_raw),
+                             'encode': (encode_stdlib, encode_fast),
+                         }))
+    return rows
+
+
+def endpoints(app, base_url, token, repeat):
+    from flask.json.provider import DefaultJSONProvider
+    from serializers import FastJSONProvider
+
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    results = []
+    for path in ('/api/students', '/api/medicines', '/api/treatments'):
+        timings = {}
+        for label, provider in (('stdlib', DefaultJSONProvider(app)), ('fast', FastJSONProvider(app))):
+            app.json = provider
+            response = session.get(f'{base_url}{path}', timeout=300)
+            response.raise_for_status()
+            _, timings[label] = timed(lambda: session.get(f'{base_url}{path}', timeout=300).content, repeat)
+        results.append((path, len(response.json()), len(response.content), timings['stdlib'], timings['fast']))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON serialization benchmark for large list endpoints.')
+    parser.add_argument('--backend', choices=['mongomock', 'mongod'], default='mongomock')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/hospital_bench',
+                        help='Database to (re)create when --backend mongod.')
+    parser.add_argument('--rows', type=int, default=10000, help='Students, medicines and treatments to seed.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (median is reported).')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    # วัดการแปลงข้อมูลทุกครั้ง ไม่ใช่การอ่านจาก cache
+    os.environ['CACHE_BACKEND'] = 'none'
+    app = start_app(args.backend, args.mongo_uri)
+    from serializers import orjson
+    if orjson is None:
+        print('warning: orjson is not installed, FastJSONProvider falls back to the standard library')
+
+    print(f'Seeding {args.rows} students, medicines and treatments ...')
+    seed(args.rows, args.rows, args.rows, 180, random.Random(args.seed))
+
+    print(f'\nStages, median of {args.repeat} (ms): document+stdlib -> raw+fast')
+    print(f"{'collection':<12}{'rows':>7}{'fetch':>20}{'build':>20}{'encode':>20}{'total':>20}{'speedup':>9}")
+    for name, count, before, after, parts in stages(app, args.repeat):
+        cells = ''.join(f'{f"{a:.1f} -> {b:.1f}":>20}' for a, b in parts.values())
+        print(f"{name:<12}{count:>7}{cells}{f'{before:.1f} -> {after:.1f}':>20}{before / after:>8.2f}x")
+
+    base_url = serve(app)
+    token = get_token(base_url, 'bench', 'bench-password')
+    print(f'\nGET without limit, median of {args.repeat} (ms)')
+    print(f"{'endpoint':<18}{'rows':>7}{'bytes':>11}{'stdlib':>10}{'fast':>10}{'speedup':>9}")
+    for path, count, size, stdlib_ms, fast_ms in endpoints(app, base_url, token, args.repeat):
+        print(f'{path:<18}{count:>7}{size:>11}{stdlib_ms:>10.1f}{fast_ms:>10.1f}{stdlib_ms / fast_ms:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
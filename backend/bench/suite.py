@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite ที่ทำซ้ำได้: สร้างข้อมูลตัวอย่างตามขนาดที่กำหนด รัน app ใน process นี้
+แล้วยิงทุก endpoint พร้อมกัน รายงาน requests/second และ p50/p95/p99 แยกตาม route
+
+    # ไม่ต้องมี mongod (ใช้ mongomock ต้อง pip install mongomock)
+    python bench/suite.py --backend mongomock
+
+    # mongod ในเครื่อง (ฐานข้อมูลนี้จะถูกล้างแล้วสร้างข้อมูลใหม่)
+    python bench/suite.py --backend mongod --mongo-uri mongodb://localhost:27017/hospital_bench
+
+    # CI: เทียบกับ bench/baseline.json และ exit 1 ถ้า p95 ของ route ที่ติดตามช้าลงเกิน --tolerance
+    python bench/suite.py --backend mongomock --check
+
+    # บันทึกผลเป็น baseline ใหม่ (แยกตาม backend)
+    python bench/suite.py --backend mongomock --write-baseline
+
+--check และ --write-baseline (หรือ --isolate) วัดทีละ route จนได้อย่างน้อย --min-samples request
+(ไม่เกิน --max-duration วินาทีต่อ route): ถ้ารันปนกัน route ที่ช้า (aggregate ของ mongomock ถือ GIL)
+ทำให้ route อื่นได้แค่ไม่กี่ request และ p95 ขึ้นกับว่า request ไปชนกับ route ไหน
+route ที่ติดตามแต่มี sample ไม่ถึง --min-samples (ทั้งใน baseline หรือรอบนี้) ถือว่า --check ไม่ผ่าน
+
+ข้อมูลสร้างจาก --seed จึงได้ชุดเดิมทุกครั้ง: นักเรียนบางคนมาห้องพยาบาลบ่อยกว่าคนอื่น
+และยาบางตัวถูกจ่ายบ่อยกว่าตัวอื่น (การกระจายแบบ Zipf) ใบรับการรักษาแต่ละใบมียา 0-3 รายการ
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from load_test import get_token, summarize, print_report
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+DEPARTMENTS = ['Software Engineering', 'Computer Science', 'Mechanical', 'Electrical',
+               'Civil', 'Chemical', 'Business', 'Medicine']
+SYMPTOMS = ['ปวดหัว', 'ไข้', 'ปวดท้อง', 'ไอ', 'เจ็บคอ', 'ผื่นคัน', 'เวียนหัว', 'ท้องเสีย', 'บาดแผล', 'ปวดกล้ามเนื้อ']
+MEDICINE_NAMES = ['Paracetamol', 'Ibuprofen', 'Antacid', 'Loperamide', 'Cetirizine', 'Loratadine',
+                  'Dextromethorphan', 'Amoxicillin', 'Povidone', 'Oral Rehydration', 'Aspirin', 'Diclofenac']
+BRANDS = ['Tylenol', 'Sara', 'Nurofen', 'Gaviscon', 'Zyrtec', 'Betadine', 'GPO', 'Bayer']
+
+# route ที่ใช้ตัดสิน regression ใน --check (list, search, history, create)
+CHECKED_ROUTES = ['list_students', 'list_medicines', 'list_treatments', 'search_medicines',
+                  'treatment_history', 'create_treatment']
+# route ที่ไม่รันกับ mongomock: /stats/dashboard ใช้ $trim ที่ mongomock ยังไม่รองรับ
+# และ aggregate ของ /stats/* ทำใน Python ทั้ง collection ใช้เวลาหลายวินาทีโดยถือ GIL ไว้ ทำให้ route อื่นช้าตามไปด้วย
+MONGOMOCK_SKIPPED = {'stats_dashboard', 'stats_visits_per_day', 'stats_top_medicines'}
+
+
+def zipf_weights(n, s=1.0):
+    return [1 / (rank + 1) ** s for rank in range(n)]
+
+
+# ---------- server ----------
+
+def start_app(backend, mongo_uri):
+    """import app แล้วเชื่อมต่อกับ mongomock หรือ mongod ที่กำหนด คืนค่า Flask app"""
+    os.environ.setdefault('SECRET_KEY', 'bench-secret-key')
+    os.environ.setdefault('JWT_SECRET_KEY', 'bench-jwt-secret-key-for-hs256-32b')
+    # ชื่อที่เปลี่ยนใน benchmark ต้องเห็นผลทันที ไม่รอ background thread
+    os.environ.setdefault('SNAPSHOT_SYNC', 'inline')
+    sys.path.insert(0, BACKEND_DIR)
+
+    from mongoengine import connect, disconnect
+    from app import app
+    from db import init_db
+
+    app.config['MONGODB_SETTINGS'] = {**app.config['MONGODB_SETTINGS'], 'host': mongo_uri}
+    if backend == 'mongomock':
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("--backend mongomock requires the 'mongomock' package (pip install mongomock)")
+        _patch_mongomock_bulk(mongomock)
+        disconnect()
+        connect(host=mongo_uri, mongo_client_class=mongomock.MongoClient)
+    else:
+        init_db(app)
+    return app
+
+
+def _patch_mongomock_bulk(mongomock):
+    # pymongo >= 4.11 ส่ง sort ให้ UpdateOne ใน bulk_write ซึ่ง mongomock 4.x ยังไม่รับ
+    builder = mongomock.collection.BulkOperationBuilder
+    add_update = builder.add_update
+
+    def patched(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+    builder.add_update = patched
+
+
+def serve(app):
+    """รัน app ด้วย werkzeug แบบ threaded บน port ว่าง คืนค่า base URL"""
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+# ---------- ข้อมูลตัวอย่าง ----------
+
+def seed(students, medicines, treatments, days, rng, batch_size=1000):
+    """ล้าง collection แล้วสร้างข้อมูลใหม่ คืนค่า ([(id, student_id), ...], medicine_ids)"""
+    from models import Student, Medicine, Treatment, TreatmentRollup, CollectionVersion, search_keys_for, normalize_search_text
+    from etag import bump_version
+    import rollups
+
+    # drop แล้วสร้าง index หลังใส่ข้อมูลเสร็จ (เร็วกว่าตรวจ unique index ทีละเอกสาร)
+    models = [Student, Medicine, Treatment, TreatmentRollup, CollectionVersion]
+    for model in models:
+        model._get_collection().drop()
+
+    def insert(model, docs):
+        collection = model._get_collection()
+        for i in range(0, len(docs), batch_size):
+            collection.insert_many([doc.to_mongo() for doc in docs[i:i + batch_size]], ordered=False)
+
+    now = datetime.utcnow()
+    student_docs = [
+        Student(student_id=f'BENCH{i:06d}', name=f'Bench Student {i}', age=rng.randint(18, 25),
+                department=rng.choice(DEPARTMENTS), Grade_level=rng.randint(1, 4), updated_at=now)
+        for i in range(students)
+    ]
+    medicine_docs = []
+    for i in range(medicines):
+        name = f'{MEDICINE_NAMES[i % len(MEDICINE_NAMES)]} {i // len(MEDICINE_NAMES) + 1}'
+        brand = rng.choice(BRANDS)
+        medicine_docs.append(Medicine(name=name, brand=brand, stock=10 ** 9, updated_at=now,
+                                      search_keys=search_keys_for(name, brand), search_name=normalize_search_text(name)))
+    insert(Student, student_docs)
+    insert(Medicine, medicine_docs)
+    # to_mongo ไม่กำหนด _id ให้ อ่านกลับมาเพื่อใช้อ้างอิง
+    student_docs = list(Student.objects.order_by('student_id'))
+    medicine_docs = list(Medicine.objects.order_by('id'))
+
+    student_weights = zipf_weights(len(student_docs), 0.8)
+    medicine_weights = zipf_weights(len(medicine_docs), 1.0)
+    treatment_docs = []
+    rollup_counts = Counter()
+    for _ in range(treatments):
+        student = rng.choices(student_docs, student_weights)[0]
+        count = rng.choices([0, 1, 2, 3], [0.2, 0.45, 0.25, 0.1])[0]
+        meds = list({m.id: m for m in rng.choices(medicine_docs, medicine_weights, k=count)}.values())
+        date = now - timedelta(days=rng.random() * days)
+        treatment_docs.append(Treatment(
+            student=student, symptoms=rng.choice(SYMPTOMS), medicines=meds, date=date, updated_at=now,
+            student_name=student.name, student_code=student.student_id,
+            medicine_snapshots=[{'id': m.id, 'name': m.name} for m in meds]
+        ))
+        # rollup คำนวณจากข้อมูลที่สร้างเลย (ผลเท่ากับ rollups.rebuild() แต่ไม่ต้อง aggregate ทั้ง collection)
+        rollup_counts.update(rollups.contributions(student.department, date, [m.id for m in meds]))
+    insert(Treatment, treatment_docs)
+    insert(TreatmentRollup, [
+        TreatmentRollup(day=day, department=department, medicine=medicine, count=n)
+        for (day, department, medicine), n in rollup_counts.items()
+    ])
+
+    for model in models:
+        model.ensure_indexes()
+    bump_version(Student, Medicine, Treatment)
+    return [(str(s.id), s.student_id) for s in student_docs], [str(m.id) for m in medicine_docs]
+
+
+# ---------- scenarios ----------
+
+def scenarios(students, medicine_ids):
+    """(ชื่อ route, น้ำหนัก, method, สร้าง path, สร้าง body) น้ำหนักใกล้เคียงการใช้งานจริง: อ่านมากกว่าเขียน"""
+    student_weights = zipf_weights(len(students), 0.8)
+    prefixes = sorted({name[:n].lower() for name in MEDICINE_NAMES for n in (2, 4)})
+
+    def some_student(rng):
+        """(ObjectId, รหัสนักเรียน) ของนักเรียนที่มาบ่อยมีโอกาสถูกเลือกมากกว่า"""
+        return rng.choices(students, student_weights)[0]
+
+    return [
+        ('list_students', 10, 'GET', lambda rng: '/api/students?limit=50', None),
+        ('get_student', 8, 'GET', lambda rng: f'/api/students/{some_student(rng)[0]}', None),
+        ('list_medicines', 10, 'GET', lambda rng: '/api/medicines?limit=50', None),
+        ('search_medicines', 15, 'GET', lambda rng: f'/api/medicines/search?q={rng.choice(prefixes)}', None),
+        ('list_treatments', 10, 'GET', lambda rng: '/api/treatments?limit=50', None),
+        ('treated_students', 3, 'GET', lambda rng: '/api/treated_students', None),
+        ('treatment_history', 15, 'GET', lambda rng: f'/api/treatment_history/{some_student(rng)[1]}', None),
+        ('stats_visits_per_day', 2, 'GET', lambda rng: '/api/stats/visits_per_day', None),
+        ('stats_top_medicines', 2, 'GET', lambda rng: '/api/stats/top_medicines', None),
+        ('stats_dashboard', 2, 'GET', lambda rng: '/api/stats/dashboard', None),
+        ('create_treatment', 8, 'POST', lambda rng: '/api/treatments', lambda rng: {
+            'student_id': some_student(rng)[1],
+            'symptoms': rng.choice(SYMPTOMS),
+            'medicine_ids': rng.sample(medicine_ids, rng.randint(0, min(2, len(medicine_ids)))),
+        }),
+        ('update_student', 3, 'PUT', lambda rng: f'/api/students/{some_student(rng)[0]}',
+         lambda rng: {'age': rng.randint(18, 25)}),
+    ]
+
+
+def worker(base_url, token, routes, deadline, results, seed_value, done):
+    rng = random.Random(seed_value)
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    weights = [weight for _, weight, *_ in routes]
+    while time.perf_counter() < deadline and not done():
+        name, _, method, path, body = rng.choices(routes, weights)[0]
+        url = base_url + path(rng)
+        payload = body(rng) if body else None
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, json=payload, timeout=30)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        results[name].append(((time.perf_counter() - start) * 1000, ok))
+
+
+def drive(base_url, token, routes, concurrency, duration, seed_value, min_samples=None):
+    """ยิง routes พร้อมกัน concurrency thread เป็นเวลา duration วินาที (หรือจนได้ min_samples request)"""
+    per_thread = [defaultdict(list) for _ in range(concurrency)]
+    deadline = time.perf_counter() + duration
+
+    def done():
+        return min_samples is not None and sum(len(s) for p in per_thread for s in list(p.values())) >= min_samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for n in range(concurrency):
+            pool.submit(worker, base_url, token, routes, deadline, per_thread[n], seed_value + n, done)
+    wall = time.perf_counter() - started
+    results = defaultdict(list)
+    for partial in per_thread:
+        for name, samples in partial.items():
+            results[name].extend(samples)
+    return results, wall
+
+
+def drive_isolated(base_url, token, routes, args):
+    """วัดทีละ route จนได้ args.min_samples request (ไม่เกิน args.max_duration วินาที) คืนค่า report"""
+    results = defaultdict(list)
+    endpoints = {}
+    wall = 0.0
+    for route in routes:
+        if args.warmup:
+            drive(base_url, token, [route], args.concurrency, args.warmup, args.seed)
+        partial, elapsed = drive(base_url, token, [route], args.concurrency, args.max_duration, args.seed,
+                                 args.min_samples)
+        print(f'  {route[0]}: {sum(len(s) for s in partial.values())} requests in {elapsed:.1f}s')
+        # rps ของแต่ละ route คิดจากเวลาของรอบที่วัด route นั้น
+        endpoints.update(summarize(partial, elapsed)['endpoints'])
+        for name, samples in partial.items():
+            results[name].extend(samples)
+        wall += elapsed
+    report = summarize(results, wall)
+    report['endpoints'] = endpoints
+    return report
+
+
+# ---------- baseline ----------
+
+def compare(report, baseline, tolerance, min_delta_ms, min_samples):
+    """คืนค่ารายการ regression ของ route ใน CHECKED_ROUTES เทียบ p95 กับ baseline"""
+    regressions = []
+    print(f"\n{'route':24} {'base p95':>9} {'now p95':>9} {'change':>8} {'samples':>13}")
+    for name in CHECKED_ROUTES:
+        now = report['endpoints'].get(name)
+        base = baseline.get('endpoints', {}).get(name)
+        if now is None or base is None:
+            continue
+        change = (now['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        slower = now['p95_ms'] > base['p95_ms'] * (1 + tolerance) and now['p95_ms'] - base['p95_ms'] > min_delta_ms
+        flag = ''
+        if slower:
+            flag = '  REGRESSION'
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {now['p95_ms']}ms")
+        if now['errors']:
+            flag += f"  {now['errors']} errors"
+            regressions.append(f"{name}: {now['errors']} errors")
+        # p95 จาก sample ไม่กี่ตัวคือค่าของ request ที่ช้าที่สุดหนึ่งหรือสองตัว เทียบกันไม่ได้
+        if min(base['requests'], now['requests']) < min_samples:
+            flag += '  TOO FEW SAMPLES'
+            regressions.append(f"{name}: {base['requests']} baseline / {now['requests']} samples (need {min_samples})")
+        samples = f"{base['requests']}/{now['requests']}"
+        print(f"{name:24} {base['p95_ms']:>9} {now['p95_ms']:>9} {change:>+8.0%} {samples:>13}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seeded, reproducible benchmark of every Hospital API route.')
+    parser.add_argument('--backend', choices=['mongomock', 'mongod'], default='mongomock')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/hospital_bench',
+                        help='Database to seed (dropped first). With mongomock only the name is used.')
+    # ค่าเริ่มต้นเหมาะกับ mongomock (scan ทุก query) กับ mongod ใช้ขนาดจริงได้ เช่น --treatments 200000
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--medicines', type=int, default=100)
+    parser.add_argument('--treatments', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=180, help='Spread treatment dates over this many days.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to measure.')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds to run before measuring.')
+    parser.add_argument('--route', action='append', dest='routes', help='Only run these routes (repeatable).')
+    parser.add_argument('--isolate', action='store_true',
+                        help='Measure one route at a time (implied by --check and --write-baseline).')
+    parser.add_argument('--min-samples', type=int, default=200,
+                        help='Requests per route when isolated; --check fails below this.')
+    parser.add_argument('--max-duration', type=float, default=120,
+                        help='Seconds per route at most when isolated.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--write-baseline', action='store_true', help='Store this run as the baseline for --backend.')
+    parser.add_argument('--check', action='store_true', help='Exit 1 if a checked route regressed against the baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown for --check (0.25 = 25%%).')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='Ignore p95 changes smaller than this.')
+    parser.add_argument('--json', dest='json_out', help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = start_app(args.backend, args.mongo_uri)
+    print(f'Seeding {args.students} students, {args.medicines} medicines, {args.treatments} treatments ...')
+    started = time.perf_counter()
+    students, medicine_ids = seed(args.students, args.medicines, args.treatments, args.days, rng)
+    print(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+    base_url = serve(app)
+    token = get_token(base_url, 'bench', 'bench-password')
+    routes = scenarios(students, medicine_ids)
+    if args.backend == 'mongomock':
+        routes = [r for r in routes if r[0] not in MONGOMOCK_SKIPPED]
+    if args.routes:
+        routes = [r for r in routes if r[0] in args.routes]
+
+    args.isolate = args.isolate or args.check or args.write_baseline
+    if args.isolate:
+        report = drive_isolated(base_url, token, routes, args)
+    else:
+        if args.warmup:
+            drive(base_url, token, routes, args.concurrency, args.warmup, args.seed)
+        results, wall = drive(base_url, token, routes, args.concurrency, args.duration, args.seed)
+        report = summarize(results, wall)
+    config_keys = ('backend', 'students', 'medicines', 'treatments', 'seed', 'concurrency', 'isolate')
+    config_keys += ('min_samples', 'max_duration') if args.isolate else ('duration',)
+    report['config'] = {key: getattr(args, key) for key in config_keys}
+    print_report(report)
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.write_baseline:
+        baselines[args.backend] = {'config': report['config'], 'endpoints': report['endpoints']}
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline for {args.backend} written to {args.baseline}')
+
+    if args.check:
+        baseline = baselines.get(args.backend)
+        if baseline is None:
+            sys.exit(f'No {args.backend} baseline in {args.baseline}; run with --write-baseline first')
+        if baseline['config'] != report['config']:
+            print(f"warning: baseline was recorded with {baseline['config']}")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms, args.min_samples)
+        if regressions:
+            print('\nRegressions:\n  ' + '\n  '.join(regressions))
+            sys.exit(1)
+        print('\nNo regressions')
+
+
+if __name__ == '__main__':
+    main()
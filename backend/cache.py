@@ -0,0 +1,243 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, g
+
+MISSING = object()
+
+
+class MemoryBackend:
+    """Cache ใน process แบบ TTL + LRU (ค่าเริ่มต้น)"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def get_version(self, name):
+        return self._versions.get(name, 0)
+
+    def bump_version(self, name):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            return self._versions[name]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """Cache ที่แชร์กันระหว่าง worker ผ่าน Redis (ต้องติดตั้ง package redis)"""
+
+    def __init__(self, url, prefix='hospital:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return MISSING if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        self._client.set(self.prefix + key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys))
+
+    def get_version(self, name):
+        return int(self._client.get(f'{self.prefix}version:{name}') or 0)
+
+    def bump_version(self, name):
+        return self._client.incr(f'{self.prefix}version:{name}')
+
+    def clear(self):
+        for key in self._client.scan_iter(f'{self.prefix}*'):
+            self._client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(f'{self.prefix}*'))
+
+
+class NullBackend:
+    """ปิด cache (CACHE_BACKEND=none)"""
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def get_version(self, name):
+        return 0
+
+    def bump_version(self, name):
+        return 0
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class Cache:
+    """
+    Read-through cache แบ่งตาม namespace เช่น 'medicines' (key = id ของเอกสาร)
+    และ 'medicines:list' (key = query string ของ list/search)
+    invalidate(namespace) เพิ่ม version ของ namespace ทำให้ key เดิมทั้งหมดใช้ไม่ได้ทันที
+    ค่าที่เก็บต้องแปลงเป็น JSON ได้ (เพื่อใช้กับ Redis ได้ด้วย)
+    """
+
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        name = app.config.get('CACHE_BACKEND', 'memory')
+        if name == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+        elif name in ('none', 'null', ''):
+            self.backend = NullBackend()
+        else:
+            self.backend = MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 10000))
+        self.ttl = app.config.get('CACHE_TTL', 60)
+        app.extensions['cache'] = self
+
+    def _key(self, namespace, key, version=None):
+        namespace_version = self.backend.get_version(namespace)
+        if version is not None:
+            return f'{namespace}:{namespace_version}@{version}:{key}'
+        return f'{namespace}:{namespace_version}:{key}'
+
+    def _count(self, counter, namespace, n=1):
+        with self._lock:
+            counter[namespace] = counter.get(namespace, 0) + n
+
+    def get(self, namespace, key, version=None):
+        value = self.backend.get(self._key(namespace, key, version))
+        self._count(self.misses if value is MISSING else self.hits, namespace)
+        return value
+
+    def set(self, namespace, key, value, ttl=None, version=None):
+        self.backend.set(self._key(namespace, key, version), value, ttl or self.ttl)
+
+    def get_or_set(self, namespace, key, loader, ttl=None):
+        value = self.get(namespace, key)
+        if value is MISSING:
+            value = loader()
+            self.set(namespace, key, value, ttl)
+        return value
+
+    def get_many(self, namespace, keys, loader, ttl=None, version=None):
+        """
+        ดึงหลาย key พร้อมกัน key ที่ไม่มีใน cache จะถูกโหลดด้วย loader(missing_keys)
+        ครั้งเดียว (loader คืนค่า dict key -> value)
+        version (เช่น version ของ collection ใน MongoDB) เป็นส่วนหนึ่งของ key: ค่าที่เก็บไว้ก่อน
+        การเขียนครั้งล่าสุดจะไม่ถูกใช้อีก แม้ worker ที่เขียนจะเป็น worker อื่น
+        """
+        found, missing = self.lookup_many(namespace, keys, version)
+        if missing:
+            loaded = loader(missing)
+            self.set_many(namespace, loaded, ttl, version)
+            found.update(loaded)
+        return found
+
+    def lookup_many(self, namespace, keys, version=None):
+        """ส่วนอ่านของ get_many: คืนค่า (dict ของ key ที่พบ, list ของ key ที่ต้องโหลด) ใช้กับ loader แบบ async ใน async_app"""
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.backend.get(self._key(namespace, key, version))
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self._count(self.hits, namespace, len(found))
+        self._count(self.misses, namespace, len(missing))
+        return found, missing
+
+    def set_many(self, namespace, values, ttl=None, version=None):
+        for key, value in values.items():
+            self.set(namespace, key, value, ttl, version)
+
+    def delete(self, namespace, *keys):
+        self.backend.delete(*(self._key(namespace, key) for key in keys))
+
+    def invalidate(self, namespace):
+        self.backend.bump_version(namespace)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': sum(self.hits.values()),
+            'misses': sum(self.misses.values()),
+            'namespaces': {
+                ns: {'hits': self.hits.get(ns, 0), 'misses': self.misses.get(ns, 0)} for ns in namespaces
+            }
+        }
+
+
+def request_key():
+    """
+    key ของ list query จาก path และ query string (เรียงลำดับพารามิเตอร์แล้ว)
+    ถ้า route ใช้ @conditional จะต่อท้ายด้วย ETag ซึ่งมาจาก version ของ collection ใน MongoDB
+    ทำให้ cache ของแต่ละ worker ไม่คืนข้อมูลเก่าหลังจาก worker อื่นเขียนข้อมูล
+    """
+    return key_for(request, g.get('etag'))
+
+
+def key_for(req, etag=None):
+    """request_key ของ request ใดก็ได้ (Flask หรือ Quart) และ ETag ที่ให้มา"""
+    args = '&'.join(f'{k}={v}' for k, v in sorted(req.args.items(multi=True)))
+    key = f'{req.path}?{args}'
+    return f'{key}#{etag}' if etag else key
+
+
+cache = Cache()
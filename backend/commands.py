@@ -0,0 +1,164 @@
+import sys
+from datetime import datetime, timedelta
+
+import click
+from bson import ObjectId
+from flask.cli import AppGroup
+from pymongo import UpdateOne
+
+from models import User, RevokedToken, Student, Medicine, Treatment, TreatmentRollup, search_keys_for, normalize_search_text
+import rollups
+import snapshots
+from routes.students import RosterError, read_roster, roster_format, import_students
+
+# คำสั่งดูแลฐานข้อมูล: flask --app app db <command>
+db_cli = AppGroup('db', help='MongoDB maintenance commands.')
+
+MODELS = [User, RevokedToken, Student, Medicine, Treatment, TreatmentRollup]
+
+
+def _query_plans():
+    """
+    Query หลักที่ API ใช้ จับคู่กับ index ที่ควรรองรับ
+    (model, คำอธิบาย, explain command)
+    """
+    now = datetime.utcnow()
+    treatment = Treatment._get_collection_name()
+    student = Student._get_collection_name()
+    medicine = Medicine._get_collection_name()
+    return [
+        (Treatment, 'treatment_history: student, newest first',
+         {'find': treatment, 'filter': {'student': ObjectId()}, 'sort': {'date': -1}}),
+        (Treatment, 'treated_students: distinct student',
+         {'distinct': treatment, 'key': 'student', 'query': {}}),
+        (Treatment, 'date range (last 30 days)',
+         {'find': treatment, 'filter': {'date': {'$gte': now - timedelta(days=30), '$lt': now}}}),
+        (Student, 'get_students: order by student_id',
+         {'find': student, 'filter': {}, 'sort': {'student_id': 1}}),
+        (Student, 'department + grade level',
+         {'find': student, 'filter': {'department': '', 'Grade_level': 0}}),
+        (Medicine, 'medicine by name',
+         {'find': medicine, 'filter': {'name': ''}}),
+        (Medicine, 'search_medicines: name prefix',
+         {'find': medicine, 'filter': {'search_name': {'$regex': '^para'}}, 'sort': {'search_name': 1}}),
+        (Medicine, 'search_medicines: prefix search',
+         {'find': medicine, 'filter': {'search_keys': {'$regex': '^para'}}}),
+    ]
+
+
+def _plan_indexes(plan):
+    """ดึงชื่อ index (หรือ COLLSCAN) ทั้งหมดจาก winningPlan"""
+    found = []
+    if isinstance(plan, dict):
+        if plan.get('stage') == 'COLLSCAN':
+            found.append('COLLSCAN')
+        if 'indexName' in plan:
+            found.append(plan['indexName'])
+        for value in plan.values():
+            found.extend(_plan_indexes(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            found.extend(_plan_indexes(value))
+    return found
+
+
+@db_cli.command('sync-indexes')
+@click.option('--explain/--no-explain', default=True, help='Explain the main API queries after syncing.')
+@click.option('--check', is_flag=True, help='Exit with status 1 if any main query needs a collection scan.')
+def sync_indexes(explain, check):
+    """Build the indexes declared in models.py (in the background) and report which queries use them."""
+    for model in MODELS:
+        model.ensure_indexes()
+        collection = model._get_collection()
+        click.echo(f'{collection.name}:')
+        for name, info in collection.index_information().items():
+            keys = ', '.join(f'{field} {direction}' for field, direction in info['key'])
+            click.echo(f'  {name}  ({keys})')
+
+    if not explain:
+        return
+
+    scans = 0
+    click.echo('\nQuery plans:')
+    for model, description, command in _query_plans():
+        db = model._get_db()
+        result = db.command('explain', command, verbosity='queryPlanner')
+        indexes = _plan_indexes(result.get('queryPlanner', {}).get('winningPlan', {}))
+        if not indexes or 'COLLSCAN' in indexes:
+            scans += 1
+        click.echo(f"  [{model.__name__}] {description}: {', '.join(indexes) or 'unknown'}")
+
+    if check and scans:
+        click.echo(f'\n{scans} queries need a collection scan', err=True)
+        sys.exit(1)
+
+
+@db_cli.command('backfill-search-keys')
+@click.option('--batch-size', default=1000, show_default=True)
+def backfill_search_keys(batch_size):
+    """Recompute Medicine.search_keys and search_name for every medicine (needed once for data saved before prefix search)."""
+    collection = Medicine._get_collection()
+    updated = 0
+    ops = []
+    for doc in collection.find({}, {'name': 1, 'brand': 1}).batch_size(batch_size):
+        ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {
+            'search_keys': search_keys_for(doc.get('name'), doc.get('brand')),
+            'search_name': normalize_search_text(doc.get('name'))
+        }}))
+        if len(ops) >= batch_size:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+    click.echo(f'Updated search keys on {updated} medicines')
+
+
+@db_cli.command('backfill-snapshots')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--all', 'refresh_all', is_flag=True, help='Refresh every treatment, not only those without snapshots.')
+def backfill_snapshots(batch_size, refresh_all):
+    """
+    Store student name/department and medicine name snapshots on treatments saved before the snapshot fields existed.
+    Run rebuild-rollups afterwards: rollups are keyed by the stored student_department.
+    """
+    updated = snapshots.backfill(batch_size, only_missing=not refresh_all)
+    click.echo(f'Updated snapshots on {updated} treatments')
+
+
+@db_cli.command('import-students')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'xlsx']), help='Default: from the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True)
+def import_students_file(path, fmt, chunk_size):
+    """Create or update students from a CSV or XLSX roster (upsert on student_id)."""
+    with open(path, 'rb') as f:
+        try:
+            rows = read_roster(f, roster_format(path, None, fmt))
+        except RosterError as e:
+            raise click.ClickException(str(e))
+        for progress in import_students(rows, chunk_size):
+            for error in progress.get('errors', []):
+                click.echo(f"  row {error['row']}: {error['error']}", err=True)
+            if not progress.get('done'):
+                click.echo(f"  {progress['processed']} rows processed")
+    click.echo(f"Imported {progress['processed']} rows: {progress['created']} created, {progress['updated']} updated, "
+               f"{progress['unchanged']} unchanged, {progress['failed']} failed")
+    if progress['failed']:
+        sys.exit(1)
+
+
+@db_cli.command('rebuild-rollups')
+@click.option('--verify', 'verify_only', is_flag=True, help='Only compare stored rollups with the raw treatments.')
+def rebuild_rollups(verify_only):
+    """Recompute the daily treatment rollups from scratch, or verify them against the raw data."""
+    if not verify_only:
+        rows = rollups.rebuild()
+        click.echo(f'Rebuilt {rows} rollup rows')
+
+    mismatches = rollups.verify()
+    for (day, department, medicine), have, want in mismatches[:50]:
+        click.echo(f"  {day:%Y-%m-%d} department={department} medicine={medicine or 'visits'}: stored {have}, expected {want}")
+    if mismatches:
+        click.echo(f'{len(mismatches)} rollup rows differ from the raw treatments', err=True)
+        sys.exit(1)
+    click.echo('Rollups match the raw treatments')
@@ -19,6 +19,125 @@ class Config:
     else:
         mongo_uri = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/{MONGO_DB}"
 
+    # Connection pool และ timeout ของ MongoClient (มิลลิวินาที, ว่างไว้ = ค่าเริ่มต้นของ pymongo)
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_MAX_IDLE_TIME_MS = os.getenv('MONGO_MAX_IDLE_TIME_MS') or None
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS') or None
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+    MONGO_SOCKET_TIMEOUT_MS = os.getenv('MONGO_SOCKET_TIMEOUT_MS') or None
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    # การบีบอัดข้อมูลระหว่าง app กับ MongoDB เช่น "zstd,snappy,zlib" (zstd ต้องติดตั้ง zstandard, snappy ต้องติดตั้ง python-snappy)
+    MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS') or None
+
     MONGODB_SETTINGS = {
-        'host': mongo_uri
+        'host': mongo_uri,
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': MONGO_MAX_IDLE_TIME_MS and int(MONGO_MAX_IDLE_TIME_MS),
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS and int(MONGO_WAIT_QUEUE_TIMEOUT_MS),
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'socketTimeoutMS': MONGO_SOCKET_TIMEOUT_MS and int(MONGO_SOCKET_TIMEOUT_MS),
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'compressors': MONGO_COMPRESSORS,
     }
+
+    # readPreference ของ endpoint ที่อ่านอย่างเดียว (list, search, history, stats)
+    # primary (ค่าเริ่มต้น), primaryPreferred, secondary, secondaryPreferred หรือ nearest
+    # การเขียนและการอ่านตาม id (ที่ต้องเห็นข้อมูลที่เพิ่งเขียน) ใช้ primary เสมอ
+    MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+    MONGO_MAX_STALENESS_SECONDS = int(os.getenv('MONGO_MAX_STALENESS_SECONDS', '-1'))
+
+    # Password hashing: method ของ werkzeug เช่น scrypt:32768:8:1 (ค่าเริ่มต้น) หรือ pbkdf2:sha256:600000
+    # เปลี่ยนได้ทุกเมื่อ hash เดิมจะถูกคำนวณใหม่ด้วยค่าใหม่ตอนผู้ใช้ login สำเร็จครั้งถัดไป
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # จำนวน request ที่คำนวณ hash พร้อมกันได้ต่อ worker (เกินนี้ตอบ 503 ทันที ไม่มีคิวรอ)
+    # ต้องน้อยกว่า GUNICORN_THREADS (ค่าเริ่มต้น 2 < 4) ไม่เช่นนั้น login พร้อมกันจะกิน thread ทั้งหมด
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+
+    # cache ของ access token ที่ตรวจ signature แล้ว (จำนวน token สูงสุดต่อ worker)
+    JWT_CLAIMS_CACHE_SIZE = int(os.getenv('JWT_CLAIMS_CACHE_SIZE', '10000'))
+    # ระยะเวลา (วินาที) ที่แต่ละ worker ดึงรายการ token ที่ถูกยกเลิก (logout) จาก MongoDB
+    JWT_REVOCATION_SYNC_SECONDS = int(os.getenv('JWT_REVOCATION_SYNC_SECONDS', '30'))
+
+    # Pagination ของ list endpoints (?limit=&after=&fields=)
+    # ไม่ระบุ limit จะได้หน้าละ PAGE_DEFAULT_LIMIT รายการ (หน้าถัดไปดูจาก header X-Next-Cursor)
+    # ต้องการทั้ง collection ให้ใช้ ?stream=1 (NDJSON) ซึ่งไม่โหลดทั้งหมดไว้ในหน่วยความจำ
+    PAGE_DEFAULT_LIMIT = int(os.getenv('PAGE_DEFAULT_LIMIT', '100'))
+    PAGE_MAX_LIMIT = int(os.getenv('PAGE_MAX_LIMIT', '1000'))
+
+    # ขนาด batch ของ cursor ตอน export แบบ NDJSON (?stream=1)
+    STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
+
+    # จำนวนแถวต่อ bulk_write ของ POST /students/import และ flask db import-students
+    STUDENT_IMPORT_CHUNK_SIZE = int(os.getenv('STUDENT_IMPORT_CHUNK_SIZE', '1000'))
+
+    # จำนวนรายการสูงสุดต่อ request ของ POST /treatments/bulk
+    BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '1000'))
+
+    # ค้นหายา (GET /medicines/search)
+    SEARCH_DEFAULT_LIMIT = int(os.getenv('SEARCH_DEFAULT_LIMIT', '20'))
+    SEARCH_CANDIDATE_FACTOR = int(os.getenv('SEARCH_CANDIDATE_FACTOR', '5'))
+
+    # Read-through cache ของยาและนักเรียน: memory (ค่าเริ่มต้น), redis หรือ none
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_TTL = int(os.getenv('CACHE_TTL', '60'))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Rate limit แบบ token bucket ปิดไว้เป็นค่าเริ่มต้น: memory (แยกต่อ worker) หรือ redis (ใช้ร่วมกัน)
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '0') == '1'
+    RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'memory')
+    RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', CACHE_REDIS_URL)
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+    # bucket ต่อ IP (request ที่ไม่มี token) และต่อผู้ใช้ (มี access token): ขนาด bucket และ token ที่เติมต่อวินาที
+    RATE_LIMIT_IP_BURST = float(os.getenv('RATE_LIMIT_IP_BURST', '60'))
+    RATE_LIMIT_IP_PER_SECOND = float(os.getenv('RATE_LIMIT_IP_PER_SECOND', '1'))
+    RATE_LIMIT_USER_BURST = float(os.getenv('RATE_LIMIT_USER_BURST', '120'))
+    RATE_LIMIT_USER_PER_SECOND = float(os.getenv('RATE_LIMIT_USER_PER_SECOND', '5'))
+    # เพดานรวมของทุกผู้ใช้ที่มาจาก IP เดียวกัน (กันการสมัครหลายบัญชีเพื่อเพิ่ม limit) ต้องใหญ่กว่า bucket ของผู้ใช้
+    RATE_LIMIT_IP_CEILING_BURST = float(os.getenv('RATE_LIMIT_IP_CEILING_BURST', '600'))
+    RATE_LIMIT_IP_CEILING_PER_SECOND = float(os.getenv('RATE_LIMIT_IP_CEILING_PER_SECOND', '20'))
+    # cost ต่อ request ตาม blueprint หรือ endpoint (ค่าเริ่มต้น 1, 0 = ไม่จำกัด)
+    RATE_LIMIT_COSTS = os.getenv(
+        'RATE_LIMIT_COSTS',
+        'auth.register=10,auth.login=5,auth.get_user=5,medicines.search_medicines=3,'
+        'students.import_students_file=20,treatments.create_treatments_bulk=10,stats=2'
+    )
+    # จำนวน reverse proxy ข้างหน้า (ใช้ IP จาก X-Forwarded-For) 0 = ใช้ IP ที่เชื่อมต่อเข้ามาตรง ๆ
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+
+    # Metrics ระดับ request ที่ /metrics (Prometheus) ปิดไว้เป็นค่าเริ่มต้น
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+    # log request ที่ใช้เวลานานกว่านี้ (มิลลิวินาที) พร้อมคำสั่ง MongoDB ของ request นั้น (ว่างไว้ = ไม่ log)
+    METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', '500')) or None
+    # /metrics ตอบเฉพาะ IP/เครือข่ายในรายการนี้ (คั่นด้วย comma, ใช้ CIDR ได้) หรือ request ที่ส่ง
+    # Authorization: Bearer <METRICS_TOKEN> (ว่างไว้ = ไม่รับ token) ที่เหลือได้ 403
+    METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+
+    # บีบอัด response ตาม Accept-Encoding (br ต้องติดตั้ง brotli, zstd ต้องติดตั้ง zstandard)
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', '1') == '1'
+    # ลำดับที่ server เลือกเมื่อ client รับได้หลายแบบ
+    COMPRESSION_ENCODINGS = os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip')
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+    COMPRESSION_BROTLI_LEVEL = int(os.getenv('COMPRESSION_BROTLI_LEVEL', '4'))
+    COMPRESSION_ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', '3'))
+    # response ที่เล็กกว่านี้ (byte) ไม่บีบอัด
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+    COMPRESSION_MIMETYPES = os.getenv(
+        'COMPRESSION_MIMETYPES', 'application/json,application/x-ndjson,text/plain,text/csv,text/html'
+    ).split(',')
+    # NDJSON stream: flush ข้อมูลที่บีบอัดแล้วให้ client ทุก ๆ กี่ byte ของต้นฉบับ
+    COMPRESSION_STREAM_FLUSH_BYTES = int(os.getenv('COMPRESSION_STREAM_FLUSH_BYTES', '32768'))
+    # ขนาดรวมของ response ที่บีบอัดแล้วที่เก็บไว้ตาม ETag ต่อ worker (0 = ไม่เก็บ)
+    COMPRESSION_CACHE_MAX_BYTES = int(os.getenv('COMPRESSION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+    # อายุ cache ของผลลัพธ์ /stats/* (วินาที)
+    STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '300'))
+
+    # จำนวนรายการต่อหน้าของ /treatment_history/<student_id>
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+
+    # การอัปเดตชื่อนักเรียน/ยาใน Treatment เมื่อมีการแก้ชื่อ: background (ค่าเริ่มต้น) หรือ inline
+    SNAPSHOT_SYNC = os.getenv('SNAPSHOT_SYNC', 'background')
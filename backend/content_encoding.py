@@ -0,0 +1,299 @@
+"""
+บีบอัด response ตาม Accept-Encoding ของ client (zstd, br, gzip)
+
+- gzip ใช้ zlib ของ standard library, br ใช้ brotli และ zstd ใช้ zstandard (อยู่ใน requirements.txt)
+  ถ้าไม่ได้ติดตั้ง encoding นั้นจะถูกข้ามไป เลือกตามลำดับใน COMPRESSION_ENCODINGS เมื่อ client ให้ q เท่ากัน
+- response ที่เล็กกว่า COMPRESSION_MIN_SIZE ไม่บีบอัด (ประหยัดได้น้อยกว่า CPU ที่เสีย)
+- response แบบ generator (NDJSON ?stream=1) บีบอัดทีละ chunk และ flush ทุก COMPRESSION_STREAM_FLUSH_BYTES
+  client จึงได้ข้อมูลเป็นช่วง ๆ ระหว่าง export ไม่ต้องรอจนจบ
+- response ที่มี ETag เก็บผลที่บีบอัดแล้วไว้ตาม (path + query string, ETag, encoding)
+  ใน LRU ขนาด COMPRESSION_CACHE_MAX_BYTES ของแต่ละ worker request ถัดไปที่ได้ข้อมูลเดิมจึงไม่ต้องบีบอัดซ้ำ
+
+response ที่บีบอัดแล้วมี ETag แบบ weak (W/"...") เพราะ byte ไม่ตรงกับต้นฉบับ (แบบเดียวกับ nginx)
+และมี Vary: Accept-Encoding ให้ proxy/cache แยกเก็บตาม encoding
+
+async_app (Quart) ใช้ค่าตั้งและ cache เดียวกันผ่าน compress_async ใน after_request ของตัวเอง
+"""
+import gzip
+import threading
+import zlib
+from collections import Counter, OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # dependency เสริม
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # dependency เสริม
+    zstandard = None
+
+
+def _gzip_compress(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _gzip_stream(level):
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip header
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def _brotli_compress(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _brotli_stream(level):
+    c = brotli.Compressor(quality=level)
+    return c.process, c.flush, c.finish
+
+
+def _zstd_compress(data, level):
+    # ZstdCompressor ใช้ข้าม thread พร้อมกันไม่ได้ จึงสร้างใหม่ทุกครั้ง
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstd_stream(level):
+    c = zstandard.ZstdCompressor(level=level).compressobj()
+    return c.compress, lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+
+
+# encoding -> (บีบอัดทั้งก้อน, สร้างตัวบีบอัดแบบ stream คืนค่า (compress, flush, finish))
+CODECS = {'gzip': (_gzip_compress, _gzip_stream)}
+if brotli is not None:
+    CODECS['br'] = (_brotli_compress, _brotli_stream)
+if zstandard is not None:
+    CODECS['zstd'] = (_zstd_compress, _zstd_stream)
+
+
+class CompressedCache:
+    """LRU ของ body ที่บีบอัดแล้ว จำกัดขนาดรวมเป็น byte (thread-safe)"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._data.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class StreamEncoder:
+    """บีบอัด body แบบ stream ทีละ chunk และ flush ทุก flush_bytes (ใช้ทั้ง generator ของ Flask และ async generator ของ Quart)"""
+
+    def __init__(self, compression, encoding):
+        self.compression = compression
+        self.encoding = encoding
+        self._compress, self._flush, self._finish = CODECS[encoding][1](compression.levels[encoding])
+        self.pending = self.total_in = self.total_out = 0
+
+    def feed(self, chunk):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        self.pending += len(chunk)
+        self.total_in += len(chunk)
+        data = self._compress(chunk)
+        if self.pending >= self.compression.stream_flush_bytes:
+            data += self._flush()
+            self.pending = 0
+        self.total_out += len(data)
+        return data
+
+    def finish(self):
+        data = self._finish()
+        self.total_out += len(data)
+        self.compression._count(self.encoding, self.total_in, self.total_out)
+        return data
+
+
+class Compression:
+    def __init__(self):
+        self.enabled = False
+        self.encodings = []
+        self.levels = {}
+        self.min_size = 1024
+        self.mimetypes = set()
+        self.stream_flush_bytes = 32768
+        self.cache = None
+        self.responses = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """ติดตั้ง after_request ที่บีบอัด response (เฉพาะเมื่อ COMPRESSION_ENABLED)"""
+        self.enabled = bool(app.config.get('COMPRESSION_ENABLED'))
+        if not self.enabled:
+            return
+        wanted = [e.strip() for e in app.config.get('COMPRESSION_ENCODINGS', 'gzip').split(',') if e.strip()]
+        unknown = [e for e in wanted if e not in ('gzip', 'br', 'zstd')]
+        if unknown:
+            raise ValueError(f"COMPRESSION_ENCODINGS: unknown encoding {', '.join(unknown)}")
+        self.encodings = [e for e in wanted if e in CODECS]
+        self.levels = {
+            'gzip': app.config.get('COMPRESSION_GZIP_LEVEL', 6),
+            'br': app.config.get('COMPRESSION_BROTLI_LEVEL', 4),
+            'zstd': app.config.get('COMPRESSION_ZSTD_LEVEL', 3),
+        }
+        self.min_size = app.config.get('COMPRESSION_MIN_SIZE', 1024)
+        self.mimetypes = set(app.config.get('COMPRESSION_MIMETYPES', ()))
+        self.stream_flush_bytes = app.config.get('COMPRESSION_STREAM_FLUSH_BYTES', 32768)
+        max_bytes = app.config.get('COMPRESSION_CACHE_MAX_BYTES', 0)
+        self.cache = CompressedCache(max_bytes) if max_bytes else None
+        app.after_request(self._after_request)
+        app.extensions['compression'] = self
+
+    def negotiate(self, accept_encodings):
+        """encoding ที่ใช้ตอบ (None = ไม่บีบอัด) ตาม Accept-Encoding และลำดับของ server"""
+        if not accept_encodings:
+            return None
+        best = accept_encodings.best_match(self.encodings)
+        return best if best in CODECS else None
+
+    def _compressible(self, response):
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        # direct_passthrough มีเฉพาะ response ของ Flask/Werkzeug
+        if getattr(response, 'direct_passthrough', False) or 'Content-Encoding' in response.headers:
+            return False
+        if 'no-transform' in response.headers.get('Cache-Control', ''):
+            return False
+        return response.mimetype in self.mimetypes
+
+    def _encoding_for(self, response, accept_encodings):
+        """encoding ที่ใช้บีบอัด response นี้ (None = ไม่บีบอัด) และเพิ่ม Vary: Accept-Encoding ให้ response ที่บีบอัดได้"""
+        if not self.enabled or not self._compressible(response):
+            return None
+        response.vary.add('Accept-Encoding')
+        return self.negotiate(accept_encodings)
+
+    def _set_body(self, response, body, encoding, full_path):
+        """แทน body ด้วยผลที่บีบอัดแล้ว คืนค่า False ถ้า body เล็กเกินกว่าจะบีบอัด"""
+        if len(body) < self.min_size:
+            return False
+        response.set_data(self._compress(body, encoding, response.get_etag(), full_path))
+        self._count(encoding, len(body), response.content_length)
+        return True
+
+    @staticmethod
+    def _mark(response, encoding):
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _after_request(self, response):
+        encoding = self._encoding_for(response, request.accept_encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self._stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        elif not self._set_body(response, response.get_data(), encoding, request.full_path):
+            return response
+        return self._mark(response, encoding)
+
+    async def compress_async(self, response, req):
+        """after_request ของ async_app (Quart, req คือ request ของ Quart): body เป็น DataBody หรือ async iterable (NDJSON)"""
+        encoding = self._encoding_for(response, req.accept_encodings)
+        if encoding is None:
+            return response
+        if isinstance(response.response, response.data_body_class):
+            if not self._set_body(response, await response.get_data(), encoding, req.full_path):
+                return response
+        else:
+            response.response = response.iterable_body_class(self._stream_async(response.response, encoding))
+            response.headers.pop('Content-Length', None)
+        return self._mark(response, encoding)
+
+    def _compress(self, body, encoding, etag, full_path):
+        # ETag ไม่จำเป็นต้อง unique ข้าม URL (เช่น version ของเอกสาร) key จึงต้องมี path + query string ด้วย
+        etag, weak = etag
+        key = (full_path, etag, encoding) if self.cache is not None and etag and not weak else None
+        if key is not None:
+            compressed = self.cache.get(key)
+            if compressed is not None:
+                return compressed
+        compressed = CODECS[encoding][0](body, self.levels[encoding])
+        if key is not None:
+            self.cache.set(key, compressed)
+        return compressed
+
+    def _stream(self, source, encoding):
+        encoder = StreamEncoder(self, encoding)
+        try:
+            for chunk in source:
+                data = encoder.feed(chunk)
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            close = getattr(source, 'close', None)
+            if close is not None:
+                close()
+
+    async def _stream_async(self, source, encoding):
+        encoder = StreamEncoder(self, encoding)
+        async with source as chunks:
+            async for chunk in chunks:
+                data = encoder.feed(chunk)
+                if data:
+                    yield data
+        yield encoder.finish()
+
+    def _count(self, encoding, size_in, size_out):
+        with self._lock:
+            self.responses[encoding] += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+
+    def stats(self):
+        stats = {
+            'enabled': self.enabled,
+            'encodings': self.encodings,
+            'responses': dict(self.responses),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+        }
+        if self.cache is not None:
+            stats['cache'] = {'entries': len(self.cache), 'bytes': self.cache.size,
+                              'hits': self.cache.hits, 'misses': self.cache.misses}
+        return stats
+
+
+compression = Compression()
@@ -0,0 +1,146 @@
+import threading
+from collections import Counter
+
+from flask import current_app
+from mongoengine import connect, disconnect
+from mongoengine.connection import get_db
+from pymongo import monitoring
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+from metrics import metrics
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    นับการใช้งาน connection pool ของ MongoClient แยกตาม server (ดูได้ที่ /debug/pool)
+    ใช้ปรับ MONGO_MAX_POOL_SIZE: ถ้า in_use ชน max_pool_size บ่อยหรือ checkout_wait_ms สูง แปลว่า pool เล็กไป
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._servers = {}
+
+    def _server(self, address):
+        key = '%s:%s' % address
+        if key not in self._servers:
+            self._servers[key] = {
+                'open': 0, 'in_use': 0, 'max_in_use': 0, 'checkouts': 0,
+                'checkout_wait_ms': 0.0, 'max_checkout_wait_ms': 0.0,
+                'checkout_failures': Counter(), 'pool_cleared': 0,
+            }
+        return self._servers[key]
+
+    def _checkout_wait(self, server, event):
+        # pymongo >= 4.7 บอกเวลาที่รอ connection (วินาที) มากับ event
+        duration = getattr(event, 'duration', None)
+        if duration is not None:
+            wait_ms = duration * 1000
+            server['checkout_wait_ms'] += wait_ms
+            server['max_checkout_wait_ms'] = max(server['max_checkout_wait_ms'], wait_ms)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._server(event.address)['pool_cleared'] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._server(event.address)['open'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._server(event.address)['open'] -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server['checkout_failures'][event.reason] += 1
+            self._checkout_wait(server, event)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server['in_use'] += 1
+            server['checkouts'] += 1
+            server['max_in_use'] = max(server['max_in_use'], server['in_use'])
+            self._checkout_wait(server, event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._server(event.address)['in_use'] -= 1
+
+    def stats(self):
+        with self._lock:
+            servers = {}
+            for key, server in self._servers.items():
+                attempts = server['checkouts'] + sum(server['checkout_failures'].values())
+                servers[key] = {
+                    **server,
+                    'checkout_failures': dict(server['checkout_failures']),
+                    'avg_checkout_wait_ms': round(server['checkout_wait_ms'] / attempts, 3) if attempts else 0.0,
+                    'checkout_wait_ms': round(server['checkout_wait_ms'], 3),
+                    'max_checkout_wait_ms': round(server['max_checkout_wait_ms'], 3),
+                }
+            return servers
+
+
+pool_metrics = PoolMetrics()
+
+
+def client_options(config):
+    """kwargs ของ MongoClient จาก MONGODB_SETTINGS (ตัดค่าที่ไม่ได้ตั้งออก) ใช้ร่วมกับ Motor ใน async_app"""
+    return {key: value for key, value in config['MONGODB_SETTINGS'].items() if value is not None}
+
+
+def event_listeners():
+    """listener ของ MongoClient: pool_metrics เสมอ และ command monitoring เมื่อเปิด METRICS_ENABLED"""
+    return [pool_metrics, *metrics.event_listeners()]
+
+
+def init_db(app):
+    """
+    เชื่อมต่อ MongoDB ด้วย mongoengine แบบ lazy (connect=False)
+    MongoClient จะเปิด socket และ background thread เมื่อมี query แรกเท่านั้น
+    จึงปลอดภัยเมื่อ gunicorn fork worker หลังจาก import app (preload_app)
+    เรียกซ้ำได้: ปิด client เดิมก่อนแล้วสร้างใหม่ (ใช้ใน post_fork ของ gunicorn)
+    """
+    read_preference(app.config)  # ตรวจค่า MONGO_READ_PREFERENCE ตั้งแต่เริ่ม app
+    disconnect()
+    pool_metrics.reset()
+    return connect(connect=False, event_listeners=event_listeners(), **client_options(app.config))
+
+
+def read_preference(config):
+    """ReadPreference ของ endpoint ที่อ่านอย่างเดียวตาม MONGO_READ_PREFERENCE"""
+    mode = read_pref_mode_from_name(config.get('MONGO_READ_PREFERENCE', 'primary'))
+    max_staleness = config.get('MONGO_MAX_STALENESS_SECONDS', -1)
+    # primary ไม่รับ max_staleness
+    return make_read_preference(mode, None, max_staleness if mode else -1)
+
+
+def for_reads(queryset):
+    """ใช้ MONGO_READ_PREFERENCE กับ queryset ของ endpoint ที่อ่านอย่างเดียว (อาจอ่านจาก secondary)"""
+    return queryset.read_preference(read_preference(current_app.config))
+
+
+def ping():
+    """ตรวจว่า MongoDB ตอบสนอง (ใช้กับ readiness check)"""
+    get_db().client.admin.command('ping')
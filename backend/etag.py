@@ -0,0 +1,141 @@
+import hashlib
+from functools import wraps
+
+from flask import request, g, make_response
+
+from models import CollectionVersion
+from db import for_reads
+from streaming import wants_stream
+
+
+def bump_version(*models):
+    """เพิ่ม version ของ collection หลังการเขียน ทำให้ ETag เดิมของ list endpoints ใช้ไม่ได้"""
+    for model in models:
+        CollectionVersion.objects(name=model._get_collection_name()).update_one(upsert=True, inc__version=1)
+
+
+def collection_versions(*models):
+    """
+    อ่าน version ของหลาย collection ด้วย query เดียว (point read ตาม _id ไม่มีการ scan)
+    ใช้ MONGO_READ_PREFERENCE เดียวกับข้อมูล: ถ้าอ่าน version จาก primary แต่ข้อมูลจาก secondary ที่ตามไม่ทัน
+    ข้อมูลเก่าจะได้ ETag ของ version ใหม่ และ client จะได้ 304 กับข้อมูลเก่าจนกว่าจะมีการเขียนครั้งถัดไป
+    """
+    names = collection_names(*models)
+    return versions_from(names, for_reads(CollectionVersion.objects(name__in=names)).as_pymongo())
+
+
+def collection_names(*models):
+    return [model._get_collection_name() for model in models]
+
+
+def versions_from(names, docs):
+    """[(collection, version)] ตามลำดับของ names จากเอกสาร CollectionVersion (collection ที่ยังไม่มีเอกสาร = 0) ใช้ร่วมกับ async_app"""
+    versions = {doc['_id']: doc.get('version', 0) for doc in docs}
+    return [(name, versions.get(name, 0)) for name in names]
+
+
+def collection_version(model):
+    """
+    version ของ collection สำหรับ key ของ cache ต่อเอกสาร (students/medicines ตาม id)
+    ใช้ค่าที่ @conditional อ่านไว้แล้วใน request นี้ (body จึงตรงกับ ETag ที่ส่ง) ถ้าไม่มีจึงอ่านจาก MongoDB
+    """
+    name = model._get_collection_name()
+    versions = g.get('collection_versions') or {}
+    if name in versions:
+        return versions[name]
+    return collection_versions(model)[0][1]
+
+
+def representation(req=None):
+    """รูปแบบของ body ที่ route จะตอบ (JSON หรือ NDJSON ตาม ?stream=1 / Accept)"""
+    return 'ndjson' if wants_stream(req) else 'json'
+
+
+def etag_for(versions, full_path, representation='json'):
+    """ETag จากรายการ (collection, version), path + query string และรูปแบบของ body"""
+    parts = [f'{name}={version}' for name, version in versions]
+    parts.append(full_path)
+    parts.append(representation)
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def request_etag(versions, req, scope=None):
+    """
+    Strong ETag ของ request (Flask หรือ Quart): version ของ collection ที่ response ขึ้นอยู่ + path และ query string
+    + รูปแบบของ body (JSON/NDJSON เลือกด้วย Accept ได้ URL เดียวกันจึงต้องได้ ETag ต่างกัน)
+    + scope() ถ้ามี: ค่าที่ body ขึ้นอยู่แต่ไม่อยู่ใน URL เช่นช่วงวันค่าเริ่มต้นของ stats ที่เลื่อนทุกวัน
+    """
+    full_path = req.full_path
+    if scope is not None:
+        full_path = f'{full_path}#{scope()}'
+    return etag_for(versions, full_path, representation(req))
+
+
+def make_etag(*models, scope=None):
+    """ETag ของ request ปัจจุบัน (ดู request_etag) และเก็บ version ที่อ่านไว้ใน g ให้ collection_version ใช้"""
+    versions = collection_versions(*models)
+    g.collection_versions = dict(versions)
+    return request_etag(versions, request, scope)
+
+
+def not_modified(req, etag):
+    # เทียบแบบ weak: response ที่ถูกบีบอัดส่ง ETag เป็น W/"..." (content_encoding)
+    return req.if_none_match.contains_weak(etag)
+
+
+def tag_response(response, etag):
+    """แนบ ETag กับ response 200/304 และ Vary: Accept (body และ ETag ขึ้นกับ Accept: proxy ต้องแยกเก็บ JSON กับ NDJSON)"""
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+    response.vary.add('Accept')
+    return response
+
+
+class PreconditionFailed(Exception):
+    """If-Match เป็น ETag ของเอกสารอื่น (ตอบ 412)"""
+
+
+def document_etag(document_id, version):
+    """
+    ETag ของเอกสารเดียว: "<id>-<version>"
+    ใส่ id ด้วยเพราะ version นับแยกต่อเอกสาร นักเรียนสองคนที่ version 3 เท่ากันจะได้ ETag ไม่ซ้ำกัน
+    """
+    return f'{document_id}-{version or 0}'
+
+
+def if_match_version(document_id):
+    """
+    version ของเอกสารจาก header If-Match สำหรับ optimistic concurrency ของ PUT/DELETE
+    รับ ETag ของ GET ("<id>-3" หรือ W/"<id>-3") หรือ version เปล่า ๆ จาก field version ของ JSON ("3")
+    คืนค่า None ถ้าไม่ได้ส่งหรือส่ง * (ไม่ตรวจ version), raise ValueError ถ้ารูปแบบไม่ถูกต้อง
+    และ raise PreconditionFailed ถ้าเป็น ETag ของเอกสารอื่น
+    """
+    value = request.headers.get('If-Match', '').strip()
+    if not value or value == '*':
+        return None
+    if value.startswith('W/'):
+        value = value[2:]
+    owner, _, version = value.strip('"').rpartition('-')
+    if not version.isdigit():
+        raise ValueError('If-Match must be the ETag of the document, e.g. "<id>-3"')
+    if owner and owner != str(document_id):
+        raise PreconditionFailed('If-Match is the ETag of another document')
+    return int(version)
+
+
+def conditional(*models, scope=None):
+    """
+    Decorator สำหรับ GET: ตอบ 304 ทันทีเมื่อ If-None-Match ตรงกับ ETag ปัจจุบัน
+    โดยไม่ต้องดึงข้อมูลหรือ serialise ใหม่ และแนบ ETag กับ response 200
+    scope (ถ้ามี) คือ callable ที่คืนค่าข้อความซึ่งรวมเข้าใน ETag ด้วย (ดู make_etag)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(*models, scope=scope)
+            g.etag = etag
+            if not_modified(request, etag):
+                return tag_response(make_response('', 304), etag)
+            return tag_response(make_response(view(*args, **kwargs)), etag)
+        return wrapper
+    return decorator
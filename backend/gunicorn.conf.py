@@ -0,0 +1,37 @@
+# ตั้งค่า gunicorn สำหรับ production: gunicorn -c gunicorn.conf.py app:app
+# ปรับจำนวน worker/thread ผ่าน environment variables
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# gthread: แต่ละ worker process มีหลาย thread งานส่วนใหญ่รอ MongoDB (I/O) จึงได้ประโยชน์จาก thread
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# เครื่องในห้องพยาบาลเรียก API ซ้ำเป็นระยะผ่าน Wi-Fi ที่ช้า: เก็บ connection ไว้นานขึ้นเพื่อไม่ต้องเปิด TCP/TLS ใหม่
+# gthread พัก connection ที่ว่างไว้ใน poller (ไม่กิน thread) จำนวนรวมจำกัดด้วย worker_connections
+# ถ้ามี load balancer ข้างหน้า ค่านี้ควรมากกว่า idle timeout ของ load balancer
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '15'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# restart worker เป็นระยะ ป้องกันหน่วยความจำโตไม่หยุด (jitter กัน worker restart พร้อมกัน)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+
+# โหลด app ครั้งเดียวใน master แล้ว fork (ประหยัดหน่วยความจำ) MongoClient ถูกสร้างใหม่ใน post_fork
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # MongoClient ไม่ควรใช้ข้าม fork: สร้าง client ใหม่ของ worker นี้
+    from app import app
+    from db import init_db
+    init_db(app)
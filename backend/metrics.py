@@ -0,0 +1,279 @@
+"""
+Metrics ระดับ request (เปิดด้วย METRICS_ENABLED=1)
+
+- latency ของแต่ละ endpoint (histogram)
+- จำนวนและเวลาของคำสั่ง MongoDB ผ่าน pymongo command monitoring (รวมและแยกตาม endpoint)
+- เวลาที่ใช้แปลง response เป็น JSON (jsonify / return dict)
+
+ดูได้ที่ GET /metrics ในรูปแบบ Prometheus text (เฉพาะ IP ใน METRICS_ALLOWED_IPS หรือ Bearer METRICS_TOKEN)
+และ request ที่ช้ากว่า METRICS_SLOW_REQUEST_MS
+จะถูก log พร้อมรายการคำสั่ง MongoDB ของ request นั้น
+ค่าเก็บแยกต่อ process: เมื่อรันด้วย gunicorn หลาย worker แต่ละ worker รายงานเฉพาะ request ที่ตัวเองรับ
+(label worker บอก pid ของ worker)
+"""
+import contextvars
+import hmac
+import ipaddress
+import logging
+import os
+import threading
+import time
+
+from flask import Response, request, jsonify
+from pymongo import monitoring
+
+from serializers import FastJSONProvider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# สถานะของ request ปัจจุบัน (contextvar แยกตาม thread ของ gthread worker และตาม task ของ asyncio)
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestState:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.status = None
+        self.serialize_seconds = 0.0
+        self.mongo_seconds = 0.0
+        self.commands = []
+        self._pending = {}
+
+    def command_started(self, event):
+        entry = {'command': event.command_name, 'collection': event.command.get(event.command_name)}
+        if not isinstance(entry['collection'], str):
+            entry['collection'] = None
+        self._pending[event.request_id] = entry
+        self.commands.append(entry)
+
+    def command_finished(self, event, ok):
+        entry = self._pending.pop(event.request_id, None)
+        seconds = event.duration_micros / 1e6
+        self.mongo_seconds += seconds
+        if entry is not None:
+            entry['ms'] = round(seconds * 1000, 2)
+            if not ok:
+                entry['failed'] = True
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names, values):
+    parts = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Registry:
+    """counter และ histogram แบบมี label (thread-safe) แปลงเป็น Prometheus text format ได้"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # name -> (kind, help, label names, {label values: value})
+
+    def _series(self, kind, name, help_text, labels):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = (kind, help_text, tuple(labels), {})
+        return metric[3]
+
+    def inc(self, name, help_text, labels, amount=1):
+        with self._lock:
+            series = self._series('counter', name, help_text, labels)
+            key = tuple(labels.values())
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, help_text, labels, value):
+        with self._lock:
+            series = self._series('histogram', name, help_text, labels)
+            key = tuple(labels.values())
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def render(self, const_labels=None):
+        const_names = tuple((const_labels or {}).keys())
+        const_values = tuple((const_labels or {}).values())
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, label_names, series) in sorted(self._metrics.items()):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                names = const_names + label_names
+                for key, value in sorted(series.items()):
+                    values = const_values + key
+                    if kind == 'counter':
+                        lines.append(f'{name}{_labels(names, values)} {value}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(names + ("le",), values + (bound,))} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(names + ("le",), values + ("+Inf",))} {value.count}')
+                    lines.append(f'{name}_sum{_labels(names, values)} {value.sum}')
+                    lines.append(f'{name}_count{_labels(names, values)} {value.count}')
+        return '\n'.join(lines) + '\n'
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """นับคำสั่ง MongoDB และเวลาที่ใช้ และผูกกับ request ปัจจุบัน (ถ้ามี) เพื่อใช้ใน slow request log"""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def started(self, event):
+        state = _current.get()
+        if state is not None:
+            state.command_started(event)
+
+    def _finished(self, event, ok):
+        seconds = event.duration_micros / 1e6
+        labels = {'command': event.command_name}
+        self.registry.inc('mongo_commands_total', 'MongoDB commands executed.',
+                          {**labels, 'outcome': 'ok' if ok else 'failed'})
+        self.registry.observe('mongo_command_duration_seconds', 'MongoDB command round-trip time.', labels, seconds)
+        state = _current.get()
+        if state is not None:
+            state.command_finished(event, ok)
+
+    def succeeded(self, event):
+        self._finished(event, True)
+
+    def failed(self, event):
+        self._finished(event, False)
+
+
+class TimedJSONProvider(FastJSONProvider):
+    """JSON provider ของ Flask ที่จับเวลาการแปลง response (jsonify และ route ที่ return dict/list)"""
+
+    def dumps(self, obj, **kwargs):
+        state = _current.get()
+        if state is None:
+            return super().dumps(obj, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            state.serialize_seconds += time.perf_counter() - start
+
+
+class Metrics:
+    def __init__(self):
+        self.registry = Registry()
+        self.command_listener = CommandMetrics(self.registry)
+        self.enabled = False
+        self.slow_request_seconds = None
+        self.allowed_networks = []
+        self.token = None
+
+    def init_app(self, app):
+        """ติดตั้ง middleware, JSON provider และ route /metrics (เฉพาะเมื่อ METRICS_ENABLED)"""
+        self.enabled = bool(app.config.get('METRICS_ENABLED'))
+        if not self.enabled:
+            return
+        slow_ms = app.config.get('METRICS_SLOW_REQUEST_MS')
+        self.slow_request_seconds = slow_ms / 1000 if slow_ms else None
+        self.allowed_networks = [
+            ipaddress.ip_network(value.strip(), strict=False)
+            for value in (app.config.get('METRICS_ALLOWED_IPS') or '').split(',') if value.strip()
+        ]
+        self.token = app.config.get('METRICS_TOKEN')
+
+        json_provider = TimedJSONProvider(app)
+        json_provider.ensure_ascii = app.json.ensure_ascii
+        json_provider.sort_keys = app.json.sort_keys
+        app.json = json_provider
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        app.extensions['metrics'] = self
+
+    def event_listeners(self):
+        """listener ที่ต้องส่งให้ MongoClient ตอนเชื่อมต่อ (ว่างเมื่อปิด metrics)"""
+        return [self.command_listener] if self.enabled else []
+
+    def _before_request(self):
+        request.environ['metrics.token'] = _current.set(RequestState())
+
+    def _after_request(self, response):
+        state = _current.get()
+        if state is not None:
+            state.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        token = request.environ.pop('metrics.token', None)
+        state = _current.get()
+        if token is None or state is None:
+            return
+        _current.reset(token)
+        self.record(state, request.method, request.endpoint or 'unmatched', state.status or 500)
+
+    def record(self, state, method, endpoint, status):
+        seconds = time.perf_counter() - state.started
+        labels = {'method': method, 'endpoint': endpoint}
+        registry = self.registry
+        registry.inc('http_requests_total', 'HTTP requests handled.', {**labels, 'status': str(status)})
+        registry.observe('http_request_duration_seconds', 'Time to produce the response (excludes streamed bodies).',
+                         labels, seconds)
+        registry.observe('http_request_mongo_seconds', 'Time spent waiting on MongoDB per request.',
+                         labels, state.mongo_seconds)
+        registry.inc('http_request_mongo_commands_total', 'MongoDB commands issued by requests.',
+                     labels, len(state.commands))
+        registry.observe('http_response_serialize_seconds', 'Time spent encoding the JSON response.',
+                         labels, state.serialize_seconds)
+
+        if self.slow_request_seconds is not None and seconds >= self.slow_request_seconds:
+            logger.warning(
+                'Slow request %s %s -> %s in %.1fms (mongo: %d commands %.1fms, serialize %.1fms): %s',
+                method, request.full_path.rstrip('?'), status, seconds * 1000,
+                len(state.commands), state.mongo_seconds * 1000, state.serialize_seconds * 1000,
+                state.commands
+            )
+
+    def allowed(self, remote_addr, authorization=None):
+        """
+        ผู้ที่ดู /metrics ได้: token ตรงกับ METRICS_TOKEN หรือ IP อยู่ใน METRICS_ALLOWED_IPS
+        ใช้ remote_addr ของ connection ไม่ใช่ X-Forwarded-For (ปลอมได้) หลัง proxy จึงควรใช้ token
+        """
+        if self.token and authorization and authorization.startswith('Bearer '):
+            if hmac.compare_digest(authorization[len('Bearer '):].encode(), self.token.encode()):
+                return True
+        try:
+            address = ipaddress.ip_address(remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    def export(self):
+        if not self.allowed(request.remote_addr, request.headers.get('Authorization')):
+            return jsonify({'error': 'Forbidden'}), 403
+        return Response(self.registry.render({'worker': os.getpid()}),
+                        mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrics = Metrics()
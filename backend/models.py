@@ -1,28 +1,153 @@
-from mongoengine import Document, StringField, ReferenceField, DateTimeField, IntField, ListField
+from mongoengine import Document, StringField, ReferenceField, DateTimeField, IntField, ListField, ObjectIdField, DictField
 from datetime import datetime
+import re
+import unicodedata
+
+def normalize_search_text(value):
+    """ทำข้อความให้อยู่ในรูปเดียวกันสำหรับค้นหา (NFKC + casefold + ตัดช่องว่างซ้ำ)"""
+    return ' '.join(unicodedata.normalize('NFKC', value or '').casefold().split())
+
+def search_keys_for(*values):
+    """
+    สร้าง key สำหรับค้นหาแบบ prefix: ข้อความเต็มที่ normalize แล้ว และทุกคำในข้อความ
+    เช่น "Paracetamol 500mg" -> ["paracetamol 500mg", "paracetamol", "500mg"]
+    """
+    keys = []
+    for value in values:
+        text = normalize_search_text(value)
+        if not text:
+            continue
+        for key in [text] + re.split(r'[\s\-_/,.()]+', text):
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
+class TrackedDocument(Document):
+    """เอกสารที่เก็บเวลาแก้ไขล่าสุด (updated_at) และเลข version ที่เพิ่มขึ้นทุกครั้งที่บันทึก"""
+    updated_at = DateTimeField(default=datetime.utcnow)
+    version = IntField(default=0)
+
+    meta = {'abstract': True}
+
+    def touch(self):
+        self.updated_at = datetime.utcnow()
+        self.version = (self.version or 0) + 1
+
+    def save(self, *args, **kwargs):
+        self.touch()
+        return super().save(*args, **kwargs)
+
+def touch_update():
+    """kwargs สำหรับ queryset update()/update_one() ให้ updated_at และ version ถูกอัปเดตด้วย"""
+    return {'set__updated_at': datetime.utcnow(), 'inc__version': 1}
+
+# version ของแต่ละ collection (เพิ่มขึ้นทุกครั้งที่มีการเขียน) ใช้สร้าง ETag ของ list endpoints
+class CollectionVersion(Document):
+    name = StringField(primary_key=True)
+    version = IntField(default=0)
 
 # ผู้ดูแลระบบ (แอดมิน)
 class User(Document):
     username = StringField(required=True, unique=True)
     password = StringField(required=True)
 
+# jti ของ access token ที่ถูกยกเลิก (logout) MongoDB ลบให้อัตโนมัติเมื่อ token หมดอายุ (TTL index)
+class RevokedToken(Document):
+    jti = StringField(primary_key=True)
+    expires_at = DateTimeField(required=True)
+    revoked_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},
+            'revoked_at',
+        ],
+        'index_background': True
+    }
+
 # นักเรียน
-class Student(Document):
+class Student(TrackedDocument):
     student_id = StringField(required=True, unique=True)
     name = StringField(required=True)
     age = IntField()
     department = StringField()
     Grade_level = IntField()
 
+    meta = {
+        'indexes': [
+            ('department', 'Grade_level'),
+        ],
+        'index_background': True
+    }
+
 # ยา
-class Medicine(Document):
+class Medicine(TrackedDocument):
     name = StringField(required=True)
     brand = StringField()
     stock = IntField(default=0)
+    # key สำหรับค้นหาแบบ prefix (ตัวพิมพ์เล็ก) สร้างจาก name และ brand ทุกครั้งที่ save
+    search_keys = ListField(StringField())
+    # name ที่ normalize แล้ว ใช้ดึงชื่อที่ตรงกัน/ขึ้นต้นด้วยคำค้นก่อน เรียงตาม index
+    search_name = StringField()
+
+    meta = {
+        'indexes': [
+            'name',
+            'search_keys',
+            'search_name',
+        ],
+        'index_background': True
+    }
+
+    def clean(self):
+        self.search_keys = search_keys_for(self.name, self.brand)
+        self.search_name = normalize_search_text(self.name)
 
 # ใบรับการรักษา
-class Treatment(Document):
+class Treatment(TrackedDocument):
     student = ReferenceField(Student, required=True)
     symptoms = StringField()
     medicines = ListField(ReferenceField(Medicine))
     date = DateTimeField(default=datetime.utcnow)
+    # snapshot ชื่อของ student และยา ณ เวลาที่บันทึก ใช้แสดงผลโดยไม่ต้องอ่าน Student/Medicine
+    # อัปเดตตามเมื่อมีการแก้ชื่อผ่าน snapshots.sync_student / snapshots.sync_medicine
+    student_name = StringField()
+    student_code = StringField()
+    medicine_snapshots = ListField(DictField())  # [{'id': ObjectId, 'name': str}]
+    # แผนกของ student ณ เวลาที่รักษา ใช้เป็น key ของ TreatmentRollup (ไม่เปลี่ยนตามเมื่อแก้แผนกหรือลบนักเรียน)
+    student_department = StringField()
+
+    meta = {
+        'indexes': [
+            ('student', '-date'),  # treatment_history, distinct('student')
+            'date',                # ช่วงวันที่ (dashboard / รายงาน)
+            'medicines',           # fan-out เมื่อแก้ชื่อยา
+        ],
+        'index_background': True
+    }
+
+    def clean(self):
+        # อ่านจาก _data เพื่อไม่ dereference: treatment ที่นักเรียนถูกลบไปแล้วต้องยังแก้ไข/บันทึกได้
+        student = self._data.get('student')
+        if isinstance(student, Student):
+            self.student_name = student.name
+            self.student_code = student.student_id
+            self.student_department = student.department
+        self.medicine_snapshots = [
+            {'id': m.id, 'name': m.name} for m in self.medicines if isinstance(m, Medicine)
+        ]
+
+# สรุปรายวันของการรักษา หนึ่งเอกสารต่อ (วัน, แผนก, ยา) อัปเดตแบบ $inc ทุกครั้งที่มีการเขียน Treatment
+# แถวที่ medicine เป็น None คือจำนวนครั้งที่เข้ารับการรักษา, แถวอื่นคือจำนวนครั้งที่จ่ายยานั้น
+class TreatmentRollup(Document):
+    day = DateTimeField(required=True)
+    department = StringField()
+    medicine = ObjectIdField()
+    count = IntField(default=0)
+
+    meta = {
+        'indexes': [
+            {'fields': ('day', 'department', 'medicine'), 'unique': True},
+        ],
+        'index_background': True
+    }
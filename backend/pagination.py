@@ -0,0 +1,104 @@
+import base64
+import json
+from bson import ObjectId
+from flask import request, jsonify, current_app
+
+
+class PaginationError(ValueError):
+    """พารามิเตอร์ limit / after / fields ไม่ถูกต้อง (ตอบกลับเป็น 400)"""
+
+
+def encode_cursor(value):
+    raw = json.dumps(str(value)).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, key):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if key == 'id':
+        if not ObjectId.is_valid(value):
+            raise PaginationError('Invalid cursor')
+        return ObjectId(value)
+    return value
+
+
+def page_args(field_map, key):
+    """
+    อ่าน limit, after และ fields จาก query string
+    field_map: ชื่อ field ใน JSON -> ชื่อ field ใน model (ใช้กับ .only())
+    คืนค่า (limit, after, fields) โดย limit เป็น None เมื่อไม่ได้ระบุและไม่มีค่า default
+    """
+    return parse_page_args(request.args, current_app.config, field_map, key)
+
+
+def parse_page_args(args, config, field_map, key):
+    """page_args แบบไม่ผูกกับ request ของ Flask (ใช้ร่วมกับ async_app)"""
+    limit = args.get('limit', config.get('PAGE_DEFAULT_LIMIT'))
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise PaginationError('limit must be an integer')
+        if limit <= 0:
+            raise PaginationError('limit must be greater than 0')
+        limit = min(limit, config.get('PAGE_MAX_LIMIT', 1000))
+
+    after = args.get('after')
+    if after:
+        after = decode_cursor(after, key)
+    else:
+        after = None
+
+    fields = args.get('fields')
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in field_map]
+        if unknown:
+            raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        fields = None
+    return limit, after, fields
+
+
+def paginate(queryset, key, field_map, limit=None, after=None, fields=None):
+    """
+    Keyset pagination บน field ที่ unique (id หรือ student_id)
+    คืนค่า (items, next_cursor) โดย next_cursor เป็น None เมื่อไม่มีหน้าถัดไป
+    """
+    if fields:
+        only = {field_map[f] for f in fields} | {key}
+        queryset = queryset.only(*only)
+    if after is not None:
+        queryset = queryset.filter(**{f'{key}__gt': after})
+    queryset = queryset.order_by(key)
+    if limit is None:
+        return queryset, None
+
+    items = list(queryset.limit(limit + 1))
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    last = items[-1]
+    if isinstance(last, dict):
+        value = last['_id' if key == 'id' else key]
+    else:
+        value = getattr(last, key)
+    return items, encode_cursor(value)
+
+
+def project(data, fields):
+    """ตัดผลลัพธ์ให้เหลือเฉพาะ field ที่ร้องขอผ่าน fields="""
+    if not fields:
+        return data
+    return {k: v for k, v in data.items() if k in fields}
+
+
+def page_response(data, next_cursor):
+    response = jsonify(data)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
@@ -0,0 +1,59 @@
+import threading
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """คำนวณ hash พร้อมกันครบจำนวนแล้ว (มีคน login/register พร้อมกันมากเกินไป) ตอบกลับเป็น 503"""
+
+
+_slots = None
+_lock = threading.Lock()
+
+
+def _get_slots():
+    # สร้างเมื่อใช้งานครั้งแรก (หลัง fork ของ worker) ตาม PASSWORD_HASH_WORKERS
+    global _slots
+    with _lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(current_app.config.get('PASSWORD_HASH_WORKERS', 2))
+        return _slots
+
+
+def _run(fn, *args):
+    """
+    จำกัดจำนวน hash ที่คำนวณพร้อมกันต่อ worker (concurrency limit ไม่ใช่การย้ายงานไป thread อื่น)
+    hash ยังคำนวณบน thread ของ request เอง แต่ request ที่ login/register พร้อมกันเกิน PASSWORD_HASH_WORKERS
+    จะได้ 503 ทันทีแทนที่จะถือ thread ของ gunicorn ไว้ทั้งหมด จึงเหลือ thread ให้ request อื่นของ worker นี้เสมอ
+    (hashlib ปล่อย GIL ระหว่างคำนวณ scrypt/pbkdf2 thread อื่นจึงยังทำงานได้)
+    """
+    slots = _get_slots()
+    # ไม่รอคิว (การรอก็ถือ thread ไว้เหมือนกัน) เต็มแล้วตอบ 503 + Retry-After ทันที
+    if not slots.acquire(blocking=False):
+        raise HashingBusy('Too many concurrent logins, try again shortly')
+    try:
+        return fn(*args)
+    finally:
+        slots.release()
+
+
+@lru_cache(maxsize=None)
+def canonical_method(method):
+    """method แบบเต็ม (เช่น "scrypt" -> "scrypt:32768:8:1") ตามที่ werkzeug เขียนไว้หน้า hash"""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt'))
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """hash ถูกสร้างด้วย algorithm หรือ cost ที่ไม่ตรงกับ PASSWORD_HASH_METHOD ปัจจุบัน"""
+    method = canonical_method(current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt'))
+    return pwhash.split('$', 1)[0] != method
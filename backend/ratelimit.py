@@ -0,0 +1,216 @@
+"""
+Rate limit แบบ token bucket (เปิดด้วย RATE_LIMIT_ENABLED=1)
+
+- request ที่มี access token ที่ตรวจแล้วหัก token จาก bucket ของผู้ใช้ (sub ใน JWT)
+  request อื่นหักจาก bucket ของ IP (เครื่องในห้องพยาบาลที่ login แล้วจึงไม่โดนจำกัดเพราะใช้ IP ร่วมกับคนอื่น)
+- request ที่มี token ยังหักจาก bucket เพดานของ IP (RATE_LIMIT_IP_CEILING_*) ที่ใหญ่กว่า bucket ของ IP ปกติ
+  IP เดียวจึงเพิ่ม limit ด้วยการสมัครหลายบัญชีไม่ได้
+- แต่ละ route มีค่าใช้จ่าย (cost) ตาม RATE_LIMIT_COSTS เช่น "auth.register=10,stats=2"
+  ระบุได้ทั้ง blueprint และ endpoint (endpoint มาก่อน) ค่าเริ่มต้น 1, 0 = ไม่จำกัด
+  route ที่ไม่ได้อยู่ใน blueprint (/healthz, /readyz, /metrics, /debug/*) ไม่ถูกจำกัด
+- เกิน limit ตอบ 429 พร้อม Retry-After ก่อนเข้า view จึงไม่แตะ MongoDB หรือ hash รหัสผ่าน
+- RATE_LIMIT_STORAGE=memory (ค่าเริ่มต้น) เก็บ bucket แยกต่อ worker
+  RATE_LIMIT_STORAGE=redis ใช้ bucket ร่วมกันทุก worker/เครื่อง (ต้องติดตั้ง package redis)
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+
+from metrics import metrics
+
+
+class MemoryStore:
+    """bucket ใน process แบบ LRU (จำกัดจำนวน key กันหน่วยความจำโตเมื่อโดนยิงจากหลาย IP)"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, เวลาที่อัปเดตล่าสุด)
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, capacity, rate):
+        """หัก cost จาก bucket คืนค่าวินาทีที่ต้องรอ (0 = ผ่าน)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# อ่าน เติม และหัก token ใน script เดียว (atomic) ใช้เวลาของ Redis ทุก worker จึงเห็นเวลาเดียวกัน
+_TAKE_SCRIPT = """
+local cost, capacity, rate = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisStore:
+    """bucket ที่แชร์กันระหว่าง worker ผ่าน Redis (ต้องติดตั้ง package redis)"""
+
+    def __init__(self, url, prefix='hospital:ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_STORAGE=redis requires the 'redis' package")
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, cost, capacity, rate):
+        return float(self._take(keys=[self.prefix + key], args=[cost, capacity, rate]))
+
+    def clear(self):
+        for key in self._client.scan_iter(f'{self.prefix}*'):
+            self._client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(f'{self.prefix}*'))
+
+
+def parse_costs(value):
+    """"auth.register=10, stats=2" -> {'auth.register': 10, 'stats': 2}"""
+    costs = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        name, sep, cost = (part.strip() for part in item.partition('='))
+        try:
+            cost = float(cost)
+        except ValueError:
+            cost = -1
+        if not sep or not name or cost < 0:
+            raise ValueError(f'RATE_LIMIT_COSTS: invalid entry {item.strip()!r}')
+        costs[name] = cost
+    return costs
+
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = False
+        self.store = None
+        self.costs = {}
+        self.ip_limit = (60, 1.0)
+        self.user_limit = (120, 5.0)
+        self.ip_ceiling = (600, 20.0)
+        self.trusted_proxies = 0
+
+    def init_app(self, app):
+        """ติดตั้ง before_request ที่ตรวจ rate limit (เฉพาะเมื่อ RATE_LIMIT_ENABLED)"""
+        self.enabled = bool(app.config.get('RATE_LIMIT_ENABLED'))
+        if not self.enabled:
+            return
+        if app.config.get('RATE_LIMIT_STORAGE', 'memory') == 'redis':
+            self.store = RedisStore(app.config['RATE_LIMIT_REDIS_URL'])
+        else:
+            self.store = MemoryStore(app.config.get('RATE_LIMIT_MAX_KEYS', 100000))
+        self.costs = parse_costs(app.config.get('RATE_LIMIT_COSTS'))
+        self.ip_limit = (app.config['RATE_LIMIT_IP_BURST'], app.config['RATE_LIMIT_IP_PER_SECOND'])
+        self.user_limit = (app.config['RATE_LIMIT_USER_BURST'], app.config['RATE_LIMIT_USER_PER_SECOND'])
+        self.ip_ceiling = (app.config['RATE_LIMIT_IP_CEILING_BURST'], app.config['RATE_LIMIT_IP_CEILING_PER_SECOND'])
+        self.trusted_proxies = app.config.get('RATE_LIMIT_TRUSTED_PROXIES', 0)
+        app.before_request(self._before_request)
+        app.extensions['ratelimit'] = self
+
+    def cost_for(self, endpoint):
+        """cost ของ endpoint ('blueprint.view') ตาม RATE_LIMIT_COSTS (route นอก blueprint = 0)"""
+        if not endpoint or '.' not in endpoint:
+            return 0
+        if endpoint in self.costs:
+            return self.costs[endpoint]
+        return self.costs.get(endpoint.rsplit('.', 1)[0], 1)
+
+    def client_ip(self, remote_addr, forwarded_for=None):
+        """IP ของ client: ข้าม proxy ที่เชื่อถือได้ RATE_LIMIT_TRUSTED_PROXIES ตัวจากท้าย X-Forwarded-For"""
+        if not self.trusted_proxies or not forwarded_for:
+            return remote_addr
+        chain = [ip.strip() for ip in forwarded_for.split(',') if ip.strip()] + [remote_addr]
+        return chain[max(len(chain) - 1 - self.trusted_proxies, 0)]
+
+    def check(self, endpoint, ip, identity=None):
+        """หัก token ของ request คืนค่าวินาทีที่ต้องรอ (0 = ผ่าน) ใช้ร่วมกับ async_app"""
+        cost = self.cost_for(endpoint)
+        if cost <= 0:
+            return 0.0
+        if identity:
+            buckets = [('user', f'user:{identity}', self.user_limit), ('ip_ceiling', f'ceiling:{ip}', self.ip_ceiling)]
+        else:
+            buckets = [('ip', f'ip:{ip}', self.ip_limit)]
+        for label, key, (capacity, rate) in buckets:
+            # cost ที่มากกว่าขนาด bucket จะไม่มีวันผ่าน: ให้ใช้ได้เมื่อ bucket เต็ม
+            wait = self.store.take(key, min(cost, capacity), capacity, rate)
+            if wait > 0:
+                if metrics.enabled:
+                    metrics.registry.inc('http_rate_limited_total', 'Requests rejected by the rate limiter.',
+                                         {'endpoint': endpoint, 'key': label})
+                return wait
+        return 0.0
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'storage': type(self.store).__name__ if self.store is not None else None,
+            'trusted_proxies': self.trusted_proxies,
+            'keys': len(self.store) if self.store is not None else 0,
+        }
+
+    @staticmethod
+    def retry_after(wait):
+        return {'Retry-After': str(max(1, math.ceil(wait)))}
+
+    def reject(self, endpoint, remote_addr, forwarded_for=None, identity=None):
+        """ตรวจ limit ของ request คืนค่า (body, headers) ของคำตอบ 429 หรือ None ถ้าผ่าน (ใช้ร่วมกับ async_app)"""
+        wait = self.check(endpoint, self.client_ip(remote_addr, forwarded_for), identity)
+        if wait <= 0:
+            return None
+        return {'error': 'Too many requests', 'retry_after': math.ceil(wait)}, self.retry_after(wait)
+
+    def _before_request(self):
+        # CORS preflight และ route ที่ไม่จำกัด ไม่ต้องตรวจ token
+        if request.method == 'OPTIONS' or self.cost_for(request.endpoint) <= 0:
+            return None
+        try:
+            # token ที่ไม่ถูกต้อง/หมดอายุ/ถูกยกเลิก นับตาม IP (view จะตอบ 401 เอง)
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+        rejected = self.reject(request.endpoint, request.remote_addr, request.headers.get('X-Forwarded-For'), identity)
+        if rejected:
+            body, headers = rejected
+            return jsonify(body), 429, headers
+        return None
+
+
+limiter = RateLimiter()
@@ -0,0 +1,119 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from etag import bump_version
+
+from models import Treatment, TreatmentRollup
+
+# ใช้ day เป็นเที่ยงคืน (UTC) ของวันที่รักษา
+DAY_FORMAT = '%Y-%m-%d'
+
+
+def utc_naive(date):
+    """แปลง datetime ที่มี timezone เป็น UTC แบบไม่มี tzinfo ให้ตรงกับที่ Treatment.date เก็บ"""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def _day(date):
+    date = utc_naive(date)
+    return datetime(date.year, date.month, date.day)
+
+
+def contributions(department, date, medicine_ids, sign=1):
+    """ผลของ treatment หนึ่งรายการต่อ rollup: Counter ของ (day, department, medicine) -> จำนวน"""
+    day = _day(date or datetime.utcnow())
+    counts = Counter({(day, department, None): sign})
+    for mid in medicine_ids:
+        if mid is not None:
+            counts[(day, department, mid)] += sign
+    return counts
+
+
+def treatment_contributions(treatment: Treatment, sign=1):
+    """
+    ใช้แผนกที่บันทึกไว้ใน treatment และ id ยาจากเอกสาร ไม่ dereference Student/Medicine
+    จึงใช้ได้กับ treatment ที่นักเรียนหรือยาถูกลบไปแล้ว (เช่นตอนแก้ student_id หรือลบ treatment นั้น)
+    """
+    medicine_ids = treatment.to_mongo().get('medicines', [])
+    return contributions(treatment.student_department, treatment.date, medicine_ids, sign)
+
+
+def apply(counts):
+    """
+    บันทึกการเปลี่ยนแปลงลง rollup ด้วย $inc แบบ upsert ใน bulk_write ครั้งเดียว
+    แล้วลบเฉพาะแถวที่เพิ่งถูกลดค่าจนเหลือ 0 (ค้นด้วย unique index ไม่ต้อง scan ทั้ง collection)
+    """
+    ops = [
+        UpdateOne({'day': day, 'department': department, 'medicine': medicine}, {'$inc': {'count': n}}, upsert=True)
+        for (day, department, medicine), n in counts.items() if n
+    ]
+    if not ops:
+        return
+    collection = TreatmentRollup._get_collection()
+    collection.bulk_write(ops, ordered=False)
+    decremented = [
+        {'day': day, 'department': department, 'medicine': medicine, 'count': {'$lte': 0}}
+        for (day, department, medicine), n in counts.items() if n < 0
+    ]
+    if decremented:
+        collection.delete_many({'$or': decremented})
+
+
+def expected():
+    """
+    คำนวณ rollup ทั้งหมดใหม่จาก Treatment ด้วย aggregation
+    ใช้ student_department ที่บันทึกไว้ใน treatment เหมือนการอัปเดตแบบ $inc จึงไม่ต้อง $lookup Student
+    และผลไม่เปลี่ยนเมื่อแก้แผนกหรือลบนักเรียน
+    """
+    day = {'$dateToString': {'format': DAY_FORMAT, 'date': '$date'}}
+    visits = [
+        {'$group': {'_id': {'day': day, 'department': '$student_department', 'medicine': None}, 'count': {'$sum': 1}}}
+    ]
+    dispensed = [
+        {'$unwind': '$medicines'},
+        {'$group': {'_id': {'day': day, 'department': '$student_department', 'medicine': '$medicines'}, 'count': {'$sum': 1}}}
+    ]
+    counts = Counter()
+    for pipeline in (visits, dispensed):
+        for row in Treatment.objects.aggregate(pipeline, allowDiskUse=True):
+            key = row['_id']
+            counts[(datetime.strptime(key['day'], DAY_FORMAT), key.get('department'), key.get('medicine'))] += row['count']
+    return counts
+
+
+def stored():
+    return Counter({
+        (row['day'], row.get('department'), row.get('medicine')): row['count']
+        for row in TreatmentRollup.objects(count__ne=0).as_pymongo()
+    })
+
+
+def rebuild(batch_size=1000):
+    """ลบ rollup เดิมแล้วเขียนใหม่จาก Treatment ทั้งหมด คืนค่าจำนวนแถว"""
+    counts = expected()
+    collection = TreatmentRollup._get_collection()
+    collection.delete_many({})
+    docs = [
+        {'day': day, 'department': department, 'medicine': medicine, 'count': n}
+        for (day, department, medicine), n in counts.items() if n
+    ]
+    for i in range(0, len(docs), batch_size):
+        collection.insert_many(docs[i:i + batch_size], ordered=False)
+    # stats อ่าน rollup ภายใต้ ETag/cache ของ Treatment จึงต้องเปลี่ยน version ให้ผลเดิมใช้ไม่ได้
+    bump_version(Treatment)
+    return len(docs)
+
+
+def verify():
+    """เปรียบเทียบ rollup ที่เก็บไว้กับค่าที่คำนวณจาก Treatment คืนค่ารายการ (key, stored, expected) ที่ไม่ตรงกัน"""
+    want = expected()
+    have = stored()
+    mismatches = []
+    for key in sorted(set(want) | set(have), key=str):
+        if have.get(key, 0) != want.get(key, 0):
+            mismatches.append((key, have.get(key, 0), want.get(key, 0)))
+    return mismatches
@@ -1,36 +1,63 @@
 from flask import Blueprint, request, jsonify
 from models import User
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt
+from etag import conditional, bump_version
+from pagination import PaginationError, page_args, paginate, project, page_response
+from db import for_reads
+from passwords import HashingBusy, hash_password, verify_password, needs_rehash
+from tokens import user_claims, revoke
 
 auth = Blueprint('auth', __name__)
 
+USER_FIELDS = {'id': 'id', 'username': 'username'}
+
 @auth.route('/register', methods=['POST'])
 def register():
     data = request.json
     if User.objects(username=data['username']):
         return jsonify({'msg': 'Username already exists'}), 400
-    hashed_pw = generate_password_hash(data['password'])
+    try:
+        hashed_pw = hash_password(data['password'])
+    except HashingBusy as e:
+        return jsonify({'msg': str(e)}), 503, {'Retry-After': '1'}
     user = User(username=data['username'], password=hashed_pw).save()
+    bump_version(User)
     return jsonify({'msg': 'Registered successfully'})
 
 @auth.route('/login', methods=['POST'])
 def login():
     data = request.json
     user = User.objects(username=data['username']).first()
-    if not user or not check_password_hash(user.password, data['password']):
-        return jsonify({'msg': 'Invalid credentials'}), 401
-    access_token = create_access_token(identity=str(user.id))
+    try:
+        if not user or not verify_password(user.password, data['password']):
+            return jsonify({'msg': 'Invalid credentials'}), 401
+        # hash ด้วย PASSWORD_HASH_METHOD ปัจจุบัน (อัปเดตเฉพาะเมื่อ hash ยังเป็นค่าเดิม กันการเขียนทับกัน)
+        if needs_rehash(user.password):
+            User.objects(id=user.id, password=user.password).update_one(set__password=hash_password(data['password']))
+    except HashingBusy as e:
+        return jsonify({'msg': str(e)}), 503, {'Retry-After': '1'}
+    access_token = create_access_token(identity=str(user.id), additional_claims=user_claims(user))
     return jsonify(access_token=access_token)
 
+@auth.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    revoke(get_jwt())
+    return jsonify({'msg': 'Logged out'})
+
 @auth.route('/get_user', methods=['GET'])
+@conditional(User)
 def get_user():
-    users = User.objects()
+    try:
+        limit, after, fields = page_args(USER_FIELDS, 'id')
+    except PaginationError as pe:
+        return jsonify({'error': str(pe)}), 400
+    users, next_cursor = paginate(for_reads(User.objects()).only('username'), 'id', USER_FIELDS, limit, after, fields)
     user_list = []
     for user in users:
-        user_list.append({
+        user_list.append(project({
             "id": str(user.id),
             "username": user.username
             # เพิ่ม field อื่นๆ ถ้าต้องการ
-        })
-    return jsonify(user_list), 200
\ No newline at end of file
+        }, fields))
+    return page_response(user_list, next_cursor), 200
\ No newline at end of file
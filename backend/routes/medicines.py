@@ -1,24 +1,88 @@
-from flask import Blueprint, request, jsonify
-from models import Medicine
+from collections import Counter
+from flask import Blueprint, request, jsonify, current_app
+from models import Medicine, normalize_search_text, search_keys_for, touch_update
 from mongoengine import ValidationError
 from flask_jwt_extended import jwt_required
+from pagination import PaginationError, page_args, paginate, project, page_response
+from streaming import wants_stream, stream_queryset, ndjson_response
+from cache import cache, request_key
+from etag import conditional, bump_version, collection_version
+from serializers import medicine_dict
+from db import for_reads
+import snapshots
 
 medicines = Blueprint('medicines', __name__)
 
+MEDICINE_FIELDS = {'_id': 'id', 'name': 'name', 'brand': 'brand', 'stock': 'stock'}
+
 def med_to_dict(m: Medicine):
-    return {
-        "_id": str(m.id),
-        "name": m.name,
-        "brand": m.brand,
-        "stock": m.stock
-    }
+    """Medicine (Document) -> dict ของ API สำหรับ route ที่มี Document อยู่แล้ว (list ใช้ medicine_dict กับ raw document)"""
+    return medicine_dict(m.to_mongo())
+
+def get_medicines_by_id(ids):
+    """ดึงยาหลายตัวตาม id ผ่าน cache (ตัวที่ไม่มีใน cache ดึงด้วย $in ครั้งเดียว) คืนค่า dict id -> med_to_dict"""
+    def load(missing):
+        return {str(doc['_id']): medicine_dict(doc) for doc in for_reads(Medicine.objects(id__in=missing)).as_pymongo()}
+    # key ตาม version ของ collection (เหมือน ETag) ค่าที่ cache ไว้ก่อนการเขียนจาก worker ใดก็ตามจึงไม่ถูกใช้
+    return cache.get_many('medicines', [str(i) for i in ids], load, version=collection_version(Medicine))
+
+def invalidate_medicines():
+    """ล้าง cache ของ list ทั้งหมด และเพิ่ม version ของ collection (cache ต่อ id ที่ key ตาม version จึงใช้ไม่ได้ด้วย)"""
+    cache.invalidate('medicines:list')
+    bump_version(Medicine)
+
+class InsufficientStock(Exception):
+    """ยาในคลังไม่พอสำหรับการจ่ายยา"""
+    def __init__(self, medicine_id):
+        super().__init__(f'Insufficient stock for medicine {medicine_id}')
+        self.medicine_id = medicine_id
+
+def dispense_stock(medicine_ids):
+    """
+    ตัด stock ตามจำนวนครั้งที่ยาแต่ละตัวปรากฏใน medicine_ids ด้วย $inc แบบมีเงื่อนไข
+    (อัปเดตเฉพาะเมื่อ stock >= จำนวนที่จ่าย) จึงไม่มี lost update เมื่อหลาย worker จ่ายยาพร้อมกัน
+    ถ้ายาตัวใดไม่พอ จะคืน stock ที่ตัดไปแล้วและ raise InsufficientStock
+    คืนค่ารายการ (medicine_id, qty) ที่ตัดไปแล้ว สำหรับส่งให้ restock เมื่อบันทึกไม่สำเร็จ
+    """
+    taken = []
+    for mid, qty in Counter(str(mid) for mid in medicine_ids).items():
+        if not Medicine.objects(id=mid, stock__gte=qty).update_one(dec__stock=qty, **touch_update()):
+            restock(taken)
+            raise InsufficientStock(mid)
+        taken.append((mid, qty))
+    if taken:
+        invalidate_medicines()
+    return taken
+
+def restock(taken):
+    """คืน stock ที่ตัดไปโดย dispense_stock"""
+    for mid, qty in taken:
+        Medicine.objects(id=mid).update_one(inc__stock=qty, **touch_update())
+    if taken:
+        invalidate_medicines()
 
 # ✅ อ่านข้อมูลยา (list)
 @medicines.route('/medicines', methods=['GET'])
 @jwt_required()
+@conditional(Medicine)
 def get_medicines():
-    all_meds = Medicine.objects()
-    return jsonify([med_to_dict(m) for m in all_meds])
+    try:
+        limit, after, fields = page_args(MEDICINE_FIELDS, 'id')
+    except PaginationError as pe:
+        return jsonify({'error': str(pe)}), 400
+    if wants_stream():
+        all_meds, _ = paginate(
+            stream_queryset(for_reads(Medicine.objects()).as_pymongo()), 'id', MEDICINE_FIELDS, None, after, fields
+        )
+        return ndjson_response(project(medicine_dict(doc), fields) for doc in all_meds)
+
+    def load():
+        all_meds, next_cursor = paginate(
+            for_reads(Medicine.objects()).as_pymongo(), 'id', MEDICINE_FIELDS, limit, after, fields
+        )
+        return {'items': [project(medicine_dict(doc), fields) for doc in all_meds], 'next_cursor': next_cursor}
+    page = cache.get_or_set('medicines:list', request_key(), load)
+    return page_response(page['items'], page['next_cursor'])
 
 # ✅ เพิ่มยา (create)
 @medicines.route('/medicines', methods=['POST'])
@@ -28,6 +92,7 @@ def create_medicine():
         data = request.get_json() or {}
         allowed = {k: data[k] for k in ('name', 'brand', 'stock') if k in data}
         medicine = Medicine(**allowed).save()
+        invalidate_medicines()
         return jsonify(med_to_dict(medicine)), 201
     except ValidationError as ve:
         return jsonify({"error": ve.to_dict()}), 400
@@ -44,10 +109,14 @@ def update_medicine(id):
         return jsonify({'error': 'Medicine not found'}), 404
 
     # อัปเดตแบบปลอดภัยเฉพาะฟิลด์ที่อนุญาต
+    renamed = 'name' in data and data['name'] != medicine.name
     for field in ('name', 'brand', 'stock'):
         if field in data:
             setattr(medicine, field, data[field])
     medicine.save()
+    invalidate_medicines()
+    if renamed:
+        snapshots.schedule(snapshots.sync_medicine, medicine.id)
 
     return jsonify(med_to_dict(medicine)), 200
 
@@ -59,22 +128,73 @@ def delete_medicine(id):
     if not medicine:
         return jsonify({'error': 'Medicine not found'}), 404
     medicine.delete()
+    invalidate_medicines()
+    snapshots.schedule(snapshots.sync_medicine, medicine.id)
     return jsonify({'msg': 'Medicine deleted', '_id': id}), 200
 
+def _search_rank(doc, q):
+    """ลำดับความเกี่ยวข้อง (doc เป็น raw document): ชื่อตรงกันทั้งหมด > ชื่อขึ้นต้นด้วย q > คำในชื่อขึ้นต้นด้วย q > ยี่ห้อ"""
+    name = normalize_search_text(doc.get('name'))
+    if name == q:
+        return 0
+    if name.startswith(q):
+        return 1
+    if any(key.startswith(q) for key in search_keys_for(doc.get('name'))):
+        return 2
+    return 3
+
+def rank_search_results(docs, q, limit):
+    """เรียง candidate ตาม _search_rank แล้วตามชื่อ คืนค่า limit รายการแรก"""
+    return sorted(docs, key=lambda doc: (_search_rank(doc, q), normalize_search_text(doc.get('name'))))[:limit]
+
 # ✅ ค้นหายาด้วยชื่อหรือยี่ห้อ (search)
+# mode=prefix (ค่าเริ่มต้น) ใช้ index บน search_keys, mode=substring คือการค้นหาแบบ regex เดิม
 @medicines.route('/medicines/search', methods=['GET'])
 @jwt_required()
+@conditional(Medicine)
 def search_medicines():
     query = request.args.get('q', '').strip()
     if not query:
         return jsonify({'error': 'Query parameter "q" is required'}), 400
 
-    results = Medicine.objects.filter(
-        __raw__={
-            "$or": [
-                {"name": {"$regex": query, "$options": "i"}},
-                {"brand": {"$regex": query, "$options": "i"}}
-            ]
-        }
-    )
-    return jsonify([med_to_dict(m) for m in results])
+    mode = request.args.get('mode', 'prefix')
+    if mode not in ('prefix', 'substring'):
+        return jsonify({'error': 'mode must be "prefix" or "substring"'}), 400
+
+    limit = request.args.get('limit')
+    if limit is not None or mode == 'prefix':
+        try:
+            limit = int(limit or current_app.config.get('SEARCH_DEFAULT_LIMIT', 20))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        if limit <= 0:
+            return jsonify({'error': 'limit must be greater than 0'}), 400
+        limit = min(limit, current_app.config.get('PAGE_MAX_LIMIT', 1000))
+
+    def load():
+        if mode == 'substring':
+            results = for_reads(Medicine.objects).filter(
+                __raw__={
+                    "$or": [
+                        {"name": {"$regex": query, "$options": "i"}},
+                        {"brand": {"$regex": query, "$options": "i"}}
+                    ]
+                }
+            ).as_pymongo()
+            if limit:
+                results = results.limit(limit)
+            return [medicine_dict(doc) for doc in results]
+
+        # prefix search: regex แบบ anchored (^q) ใช้ index ได้
+        # ดึงชื่อที่ตรงกัน/ขึ้นต้นด้วย q เรียงตาม search_name ก่อน (ชื่อที่ตรงกันทั้งหมดมาก่อนเสมอ)
+        # ถ้ายังไม่ครบ limit จึงเติม candidate จาก search_keys (คำในชื่อ/ยี่ห้อ) แล้วจัดลำดับในหน่วยความจำ
+        q = normalize_search_text(query)
+        factor = current_app.config.get('SEARCH_CANDIDATE_FACTOR', 5)
+        candidates = list(for_reads(Medicine.objects(search_name__startswith=q)).only('name', 'brand', 'stock')
+                          .order_by('search_name').limit(limit).as_pymongo())
+        if len(candidates) < limit:
+            rest = for_reads(Medicine.objects(search_keys__startswith=q, id__nin=[doc['_id'] for doc in candidates]))
+            candidates += rest.only('name', 'brand', 'stock').limit(limit * factor).as_pymongo()
+        return [medicine_dict(doc) for doc in rank_search_results(candidates, q, limit)]
+
+    return jsonify(cache.get_or_set('medicines:list', request_key(), load))
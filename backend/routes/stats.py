@@ -0,0 +1,220 @@
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app, g
+from flask_jwt_extended import jwt_required
+from models import Treatment, Student, Medicine, TreatmentRollup
+from cache import cache
+from etag import conditional
+from db import for_reads
+
+stats = Blueprint('stats', __name__)
+
+def parse_range():
+    """
+    อ่านช่วงวันที่จาก ?from=YYYY-MM-DD&to=YYYY-MM-DD (รวมวัน to ด้วย)
+    ค่าเริ่มต้นคือ 30 วันล่าสุด คืนค่า (start, end) โดย end เป็นเที่ยงคืนของวันถัดจาก to
+    """
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    try:
+        end_day = datetime.strptime(request.args['to'], '%Y-%m-%d') if 'to' in request.args else today
+        start_day = datetime.strptime(request.args['from'], '%Y-%m-%d') if 'from' in request.args else end_day - timedelta(days=29)
+    except ValueError:
+        raise ValueError('from/to must be dates in YYYY-MM-DD format')
+    if start_day > end_day:
+        raise ValueError('from must not be after to')
+    return start_day, end_day + timedelta(days=1)
+
+def range_scope():
+    """
+    ช่วงวันที่ใช้จริงสำหรับ ETag: ถ้าไม่ส่ง from/to ช่วง 30 วันล่าสุดจะเลื่อนทุกวันทั้งที่ URL เดิม
+    ETag จึงต้องเปลี่ยนตาม ไม่เช่นนั้น client จะได้ 304 กับสถิติของเมื่อวาน (ช่วงวันผิดรูปแบบจะได้ 400 อยู่แล้ว)
+    """
+    try:
+        start, end = parse_range()
+    except ValueError:
+        return ''
+    return f"{start:%Y-%m-%d}/{end:%Y-%m-%d}"
+
+def parse_limit():
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit <= 0:
+        raise ValueError('limit must be greater than 0')
+    return min(limit, 100)
+
+def parse_source():
+    """source=rollup (ค่าเริ่มต้น) อ่านจาก TreatmentRollup แบบ O(วัน), source=raw คำนวณจาก Treatment โดยตรง"""
+    source = request.args.get('source', 'rollup')
+    if source not in ('rollup', 'raw'):
+        raise ValueError('source must be "rollup" or "raw"')
+    return source
+
+def _in_range(start, end):
+    return for_reads(Treatment.objects(date__gte=start, date__lt=end))
+
+def _rollups_in_range(start, end):
+    return for_reads(TreatmentRollup.objects(day__gte=start, day__lt=end))
+
+def visits_per_day(start, end, source='rollup'):
+    if source == 'rollup':
+        pipeline = [
+            {'$match': {'medicine': None}},
+            {'$group': {'_id': '$day', 'count': {'$sum': '$count'}}},
+            {'$sort': {'_id': 1}}
+        ]
+        return [
+            {'date': row['_id'].strftime('%Y-%m-%d'), 'count': row['count']}
+            for row in _rollups_in_range(start, end).aggregate(pipeline)
+        ]
+    pipeline = [
+        {'$group': {'_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$date'}}, 'count': {'$sum': 1}}},
+        {'$sort': {'_id': 1}}
+    ]
+    return [{'date': row['_id'], 'count': row['count']} for row in _in_range(start, end).aggregate(pipeline)]
+
+def top_symptoms(start, end, limit):
+    # symptoms เป็นข้อความคั่นด้วย comma เช่น "fever, headache" จึงแยกเป็นรายอาการก่อนนับ
+    pipeline = [
+        {'$project': {'symptom': {'$split': [{'$ifNull': ['$symptoms', '']}, ',']}}},
+        {'$unwind': '$symptom'},
+        {'$project': {'symptom': {'$toLower': {'$trim': {'input': '$symptom'}}}}},
+        {'$match': {'symptom': {'$ne': ''}}},
+        {'$group': {'_id': '$symptom', 'count': {'$sum': 1}}},
+        {'$sort': {'count': -1, '_id': 1}},
+        {'$limit': limit}
+    ]
+    return [{'symptom': row['_id'], 'count': row['count']} for row in _in_range(start, end).aggregate(pipeline)]
+
+def top_medicines(start, end, limit, source='rollup'):
+    if source == 'rollup':
+        queryset = _rollups_in_range(start, end)
+        pipeline = [
+            {'$match': {'medicine': {'$ne': None}}},
+            {'$group': {'_id': '$medicine', 'count': {'$sum': '$count'}}}
+        ]
+    else:
+        queryset = _in_range(start, end)
+        pipeline = [
+            {'$unwind': '$medicines'},
+            {'$group': {'_id': '$medicines', 'count': {'$sum': 1}}}
+        ]
+    pipeline += [
+        {'$sort': {'count': -1, '_id': 1}},
+        {'$limit': limit},
+        {'$lookup': {
+            'from': Medicine._get_collection_name(),
+            'localField': '_id',
+            'foreignField': '_id',
+            'as': 'medicine'
+        }},
+        {'$project': {'count': 1, 'name': {'$arrayElemAt': ['$medicine.name', 0]}}}
+    ]
+    return [
+        {'id': str(row['_id']), 'name': row.get('name'), 'count': row['count']}
+        for row in queryset.aggregate(pipeline)
+    ]
+
+def visits_by_department(start, end):
+    # รวมตามนักเรียนก่อน แล้วจึง $lookup ครั้งละนักเรียน (ไม่ใช่ครั้งละ treatment)
+    pipeline = [
+        {'$group': {'_id': '$student', 'count': {'$sum': 1}}},
+        {'$lookup': {
+            'from': Student._get_collection_name(),
+            'localField': '_id',
+            'foreignField': '_id',
+            'as': 'student'
+        }},
+        {'$unwind': {'path': '$student', 'preserveNullAndEmptyArrays': True}},
+        {'$group': {
+            '_id': {'department': '$student.department', 'grade_level': '$student.Grade_level'},
+            'count': {'$sum': '$count'}
+        }},
+        {'$sort': {'count': -1}}
+    ]
+    return [
+        {'department': row['_id'].get('department'), 'grade_level': row['_id'].get('grade_level'), 'count': row['count']}
+        for row in _in_range(start, end).aggregate(pipeline)
+    ]
+
+def cached_stats(name, start, end, loader, *extra):
+    """
+    cache ผลลัพธ์แยกตามช่วงวัน (time bucket) และ ETag ของ collection ที่เกี่ยวข้อง
+    จึงคำนวณใหม่เฉพาะเมื่อช่วงวันเปลี่ยนหรือมีการเขียน Treatment/Student/Medicine
+    """
+    key = ':'.join([name, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), *map(str, extra), g.get('etag', '')])
+    data = cache.get_or_set('stats', key, loader, ttl=current_app.config.get('STATS_CACHE_TTL', 300))
+    return {
+        'from': start.strftime('%Y-%m-%d'),
+        'to': (end - timedelta(days=1)).strftime('%Y-%m-%d'),
+        'data': data
+    }
+
+# ✅ จำนวนการเข้ารับการรักษาต่อวัน
+@stats.route('/stats/visits_per_day', methods=['GET'])
+@jwt_required()
+@conditional(Treatment, Student, Medicine, scope=range_scope)
+def get_visits_per_day():
+    try:
+        start, end = parse_range()
+        source = parse_source()
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    return jsonify(cached_stats('visits_per_day', start, end, lambda: visits_per_day(start, end, source), source))
+
+# ✅ อาการที่พบบ่อย
+@stats.route('/stats/top_symptoms', methods=['GET'])
+@jwt_required()
+@conditional(Treatment, Student, Medicine, scope=range_scope)
+def get_top_symptoms():
+    try:
+        start, end = parse_range()
+        limit = parse_limit()
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    return jsonify(cached_stats('top_symptoms', start, end, lambda: top_symptoms(start, end, limit), limit))
+
+# ✅ ยาที่จ่ายมากที่สุด
+@stats.route('/stats/top_medicines', methods=['GET'])
+@jwt_required()
+@conditional(Treatment, Student, Medicine, scope=range_scope)
+def get_top_medicines():
+    try:
+        start, end = parse_range()
+        limit = parse_limit()
+        source = parse_source()
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    return jsonify(cached_stats('top_medicines', start, end, lambda: top_medicines(start, end, limit, source), limit, source))
+
+# ✅ จำนวนการเข้ารับการรักษาแยกตามแผนกและชั้นปี
+@stats.route('/stats/visits_by_department', methods=['GET'])
+@jwt_required()
+@conditional(Treatment, Student, Medicine, scope=range_scope)
+def get_visits_by_department():
+    try:
+        start, end = parse_range()
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    return jsonify(cached_stats('visits_by_department', start, end, lambda: visits_by_department(start, end)))
+
+# ✅ สถิติทั้งหมดสำหรับหน้า dashboard ใน response เดียว
+@stats.route('/stats/dashboard', methods=['GET'])
+@jwt_required()
+@conditional(Treatment, Student, Medicine, scope=range_scope)
+def dashboard():
+    try:
+        start, end = parse_range()
+        limit = parse_limit()
+        source = parse_source()
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+
+    def load():
+        return {
+            'visits_per_day': visits_per_day(start, end, source),
+            'top_symptoms': top_symptoms(start, end, limit),
+            'top_medicines': top_medicines(start, end, limit, source),
+            'visits_by_department': visits_by_department(start, end)
+        }
+    return jsonify(cached_stats('dashboard', start, end, load, limit, source))
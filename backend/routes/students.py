@@ -1,12 +1,35 @@
 # routes/students.py
-from flask import Blueprint, request, jsonify
+import csv
+import io
+import tempfile
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
 from mongoengine import ValidationError
-from models import Student
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from models import Student, touch_update
+from pagination import PaginationError, page_args, paginate, project, page_response
+from serializers import student_dict
+from streaming import wants_stream, stream_queryset, ndjson_response, chunked
+from cache import cache, request_key
+from etag import conditional, bump_version, collection_version, if_match_version, document_etag, PreconditionFailed
+from db import for_reads
+import snapshots
 import re
 
 students = Blueprint('students', __name__)
 
+STUDENT_FIELDS = {
+    'id': 'id',
+    'student_id': 'student_id',
+    'name': 'name',
+    'age': 'age',
+    'department': 'department',
+    'grade_level': 'Grade_level',
+    'version': 'version'
+}
+
 def parse_grade_level(grade_input):
     """
     Parse grade level input to extract integer value.
@@ -33,20 +56,293 @@ def parse_grade_level(grade_input):
     
     return None
 
+def student_to_dict(s: Student):
+    """Student (Document) -> dict ของ API สำหรับ route ที่มี Document อยู่แล้ว (list ใช้ student_dict กับ raw document)"""
+    return student_dict(s.to_mongo())
+
+def get_students_by_id(ids):
+    """ดึงนักเรียนหลายคนตาม id ผ่าน cache (คนที่ไม่มีใน cache ดึงด้วย $in ครั้งเดียว) คืนค่า dict id -> student_to_dict"""
+    def load(missing):
+        return {str(doc['_id']): student_dict(doc) for doc in for_reads(Student.objects(id__in=missing)).as_pymongo()}
+    # key ตาม version ของ collection (เหมือน ETag) ค่าที่ cache ไว้ก่อนการเขียนจาก worker ใดก็ตามจึงไม่ถูกใช้
+    return cache.get_many('students', [str(i) for i in ids], load, version=collection_version(Student))
+
+def students_matching(student_id, expected):
+    """
+    queryset ของนักเรียนตาม id และ version ที่ส่งมาใน If-Match (None = ไม่ตรวจ version)
+    เอกสารเก่าที่ยังไม่มี field version แสดงเป็น version 0 จึงต้องตรงกับ If-Match: "0" ด้วย
+    """
+    if expected is None:
+        return Student.objects(id=student_id)
+    if expected == 0:
+        return Student.objects(id=student_id, version__in=[0, None])
+    return Student.objects(id=student_id, version=expected)
+
+def version_conflict(student_id, expected):
+    """คำตอบเมื่อ findAndModify ไม่พบเอกสาร: 404 ถ้าไม่มีนักเรียนคนนี้ หรือ 412 ถ้า version ไม่ตรงกับ If-Match"""
+    current = Student.objects(id=student_id).only('version').first() if expected is not None else None
+    if not current:
+        return jsonify({"error": "Student not found"}), 404
+    return jsonify({
+        "error": "Student was changed by someone else; reload and try again",
+        "version": current.version
+    }), 412
+
+def invalidate_students():
+    """ล้าง cache ของ list ทั้งหมด และเพิ่ม version ของ collection (cache ต่อ id ที่ key ตาม version จึงใช้ไม่ได้ด้วย)"""
+    cache.invalidate('students:list')
+    bump_version(Student)
+
+# ---------- นำเข้านักเรียนจากไฟล์ CSV / XLSX ----------
+
+# ชื่อคอลัมน์ในไฟล์ (ตัวพิมพ์เล็ก, ช่องว่างเป็น _) -> field ของแถว
+ROSTER_COLUMNS = {
+    'student_id': 'student_id', 'studentid': 'student_id', 'รหัสนักศึกษา': 'student_id', 'รหัสนักเรียน': 'student_id',
+    'name': 'name', 'ชื่อ': 'name', 'ชื่อ-นามสกุล': 'name',
+    'age': 'age', 'อายุ': 'age',
+    'department': 'department', 'แผนก': 'department', 'สาขา': 'department',
+    'grade_level': 'grade_level', 'grade': 'grade_level', 'year': 'grade_level', 'ชั้นปี': 'grade_level',
+}
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+class RosterError(Exception):
+    """ไฟล์นำเข้าอ่านไม่ได้หรือไม่มีคอลัมน์ที่จำเป็น (ตอบ 400)"""
+
+def roster_format(filename=None, mimetype=None, override=None):
+    """ชนิดไฟล์ 'csv' หรือ 'xlsx' จาก ?format=, นามสกุลไฟล์ หรือ Content-Type"""
+    fmt = (override or '').lower()
+    if not fmt and filename:
+        fmt = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if not fmt and mimetype:
+        fmt = 'xlsx' if mimetype == XLSX_MIMETYPE else 'csv' if mimetype in ('text/csv', 'text/plain') else ''
+    if fmt not in ('csv', 'xlsx'):
+        raise RosterError('Upload a .csv or .xlsx file (or pass ?format=csv|xlsx)')
+    return fmt
+
+def spool(stream):
+    """คัดลอก stream ไว้ใน memory ถ้าเล็ก หรือไฟล์ชั่วคราวถ้าใหญ่ (อ่านซ้ำ/seek ได้ และไม่ผูกกับ request)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    while chunk := stream.read(64 * 1024):
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+def _cell(value):
+    # ค่าจาก Excel: ตัวเลขจำนวนเต็มมักมาเป็น float (3.0) ข้อความตัดช่องว่างหัวท้าย
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+def read_roster(stream, fmt):
+    """
+    อ่านแถวหัวตารางทันที (ตรวจคอลัมน์) แล้วคืน generator ของ (เลขแถว, dict) ที่อ่านไฟล์ทีละแถว
+    แถวที่อ่านไม่ได้ได้เป็น (เลขแถว, RosterError) แทน dict
+    CSV อ่านจาก stream โดยตรง XLSX ใช้ openpyxl แบบ read_only (ต้องติดตั้ง openpyxl)
+    """
+    if fmt == 'xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise RosterError("XLSX import requires the 'openpyxl' package; upload a CSV instead")
+        if not stream.seekable():
+            # zip ต้อง seek ได้
+            stream = spool(stream)
+        try:
+            rows = load_workbook(stream, read_only=True, data_only=True).active.iter_rows(values_only=True)
+        except Exception as e:
+            raise RosterError(f'Cannot read XLSX file: {e}')
+    else:
+        if isinstance(stream, io.RawIOBase):
+            stream = io.BufferedReader(stream)
+        rows = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+    try:
+        header = next(rows, None)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise RosterError(f'Cannot read CSV file: {e}')
+    if not header:
+        raise RosterError('The file is empty')
+    columns = [ROSTER_COLUMNS.get(str(h or '').strip().lower().replace(' ', '_')) for h in header]
+    if 'student_id' not in columns or 'name' not in columns:
+        raise RosterError('The first row must name the student_id and name columns')
+
+    def generate():
+        # error ระหว่างอ่านแถว (หลังหัวตาราง) รายงานเป็น error ของแถวนั้นแทนการหยุด import ทั้งไฟล์
+        number = 1
+        while True:
+            number += 1
+            try:
+                values = next(rows, None)
+            except csv.Error as e:
+                yield number, RosterError(f'Cannot read row: {e}')
+                continue
+            except UnicodeDecodeError as e:
+                # decoder ของ stream อ่านต่อไม่ได้แล้ว: แถวที่เหลือถูกข้าม
+                yield number, RosterError(f'File is not UTF-8 from this row on, remaining rows skipped: {e}')
+                return
+            if values is None:
+                return
+            row = {}
+            for column, value in zip(columns, values):
+                value = _cell(value)
+                if column and value not in (None, ''):
+                    row[column] = value
+            if row:
+                yield number, row
+    return generate()
+
+def roster_fields(row):
+    """แปลงแถวเป็น (student_id, field ของ Student) ค่าที่ไม่ถูกต้อง raise ValueError"""
+    student_id = str(row.get('student_id', '')).strip()
+    name = str(row.get('name', '')).strip()
+    if not student_id or not name:
+        raise ValueError('student_id and name are required')
+    fields = {'name': name}
+    if 'age' in row:
+        try:
+            fields['age'] = int(row['age'])
+        except (TypeError, ValueError):
+            raise ValueError(f"age must be a number, got {row['age']!r}")
+    if 'department' in row:
+        fields['department'] = str(row['department'])
+    if 'grade_level' in row:
+        grade_level = parse_grade_level(row['grade_level'] if isinstance(row['grade_level'], int) else str(row['grade_level']))
+        if grade_level is None:
+            raise ValueError(f"Cannot parse grade_level {row['grade_level']!r}")
+        fields['Grade_level'] = grade_level
+    return student_id, fields
+
+def import_students(rows, chunk_size=1000):
+    """
+    upsert นักเรียนตาม student_id ครั้งละ chunk_size แถวด้วย bulk_write แบบ unordered
+    แถวที่ข้อมูลเหมือนเดิมจะไม่ถูกเขียน แถวที่ผิดพลาดถูกรายงานโดยไม่ยกเลิกแถวอื่น
+    yield ความคืบหน้าหลังแต่ละ chunk (ยอดสะสม + errors ของ chunk นั้น) และสรุปสุดท้ายที่มี done=True
+    """
+    collection = Student._get_collection()
+    totals = {'processed': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+    first_row = {}
+    for chunk in chunked(rows, chunk_size):
+        errors = []
+        parsed = []
+        for number, row in chunk:
+            totals['processed'] += 1
+            try:
+                if isinstance(row, RosterError):
+                    raise row
+                student_id, fields = roster_fields(row)
+            except (ValueError, RosterError) as e:
+                errors.append({'row': number, 'error': str(e)})
+                continue
+            if student_id in first_row:
+                errors.append({'row': number, 'error': f'Duplicate student_id {student_id} (first on row {first_row[student_id]})'})
+                continue
+            first_row[student_id] = number
+            parsed.append((number, student_id, fields))
+
+        # อ่านนักเรียนที่มีอยู่แล้วของทั้ง chunk ด้วย $in ครั้งเดียว เพื่อข้ามแถวที่ไม่เปลี่ยนและหาคนที่เปลี่ยนชื่อ
+        existing = {
+            doc['student_id']: doc for doc in collection.find(
+                {'student_id': {'$in': [student_id for _, student_id, _ in parsed]}},
+                {'student_id': 1, 'name': 1, 'age': 1, 'department': 1, 'Grade_level': 1}
+            )
+        } if parsed else {}
+        ops = []
+        op_rows = []
+        renamed = []
+        now = datetime.utcnow()
+        for number, student_id, fields in parsed:
+            current = existing.get(student_id)
+            if current and all(current.get(key) == value for key, value in fields.items()):
+                totals['unchanged'] += 1
+                continue
+            if current and current.get('name') != fields['name']:
+                renamed.append(current['_id'])
+            ops.append(UpdateOne(
+                {'student_id': student_id},
+                {'$set': {**fields, 'updated_at': now}, '$inc': {'version': 1}},
+                upsert=True
+            ))
+            op_rows.append(number)
+
+        if ops:
+            failed = set()
+            try:
+                upserted = len(collection.bulk_write(ops, ordered=False).upserted_ids)
+            except BulkWriteError as bwe:
+                upserted = len(bwe.details.get('upserted', []))
+                for write_error in bwe.details.get('writeErrors', []):
+                    failed.add(write_error['index'])
+                    errors.append({'row': op_rows[write_error['index']], 'error': write_error.get('errmsg', 'Write failed')})
+            totals['created'] += upserted
+            totals['updated'] += len(ops) - len(failed) - upserted
+            invalidate_students()
+            for student in renamed:
+                snapshots.schedule(snapshots.sync_student, student)
+
+        totals['failed'] += len(errors)
+        errors.sort(key=lambda e: e['row'])
+        yield {**totals, 'errors': errors}
+    yield {**totals, 'done': True}
+
+# ✅ นำเข้านักเรียนจากไฟล์ CSV / XLSX (สร้างใหม่หรืออัปเดตตาม student_id)
+@students.route('/students/import', methods=['POST'])
+@jwt_required()
+def import_students_file():
+    """
+    รับไฟล์แบบ multipart (field "file") หรือส่งเนื้อไฟล์เป็น body ตรง ๆ (Content-Type: text/csv)
+    ?stream=1 ส่งความคืบหน้าหลังแต่ละ chunk เป็น NDJSON ระหว่างนำเข้า
+    """
+    upload = request.files.get('file')
+    if upload:
+        stream, filename, mimetype = upload.stream, upload.filename, upload.mimetype
+        if wants_stream():
+            # Flask ปิดไฟล์ที่ upload เมื่อ view คืนค่า ก่อน NDJSON จะอ่านไฟล์เสร็จ จึงคัดลอกไว้ก่อน
+            stream = spool(stream)
+    else:
+        stream, filename, mimetype = request.stream, None, request.mimetype
+    try:
+        rows = read_roster(stream, roster_format(filename, mimetype, request.args.get('format')))
+    except RosterError as e:
+        return jsonify({'error': str(e)}), 400
+
+    progress = import_students(rows, current_app.config.get('STUDENT_IMPORT_CHUNK_SIZE', 1000))
+    if wants_stream():
+        return ndjson_response(progress)
+
+    errors = []
+    try:
+        for result in progress:
+            errors.extend(result.get('errors', []))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    result['errors'] = errors
+    del result['done']
+    return jsonify(result), 200 if not errors else 207
+
 # ✅ ดึงนักเรียนทั้งหมด
 @students.route('/students', methods=['GET'])
 @jwt_required()
+@conditional(Student)
 def get_students():
     try:
-        all_students = Student.objects().order_by('student_id')
-        return jsonify([{
-            "id": str(s.id),
-            "student_id": s.student_id,
-            "name": s.name,
-            "age": s.age,
-            "department": s.department,
-            "grade_level": s.Grade_level  # Note: Capital G to match your model
-        } for s in all_students])
+        limit, after, fields = page_args(STUDENT_FIELDS, 'student_id')
+        if wants_stream():
+            all_students, _ = paginate(
+                stream_queryset(for_reads(Student.objects()).as_pymongo()), 'student_id', STUDENT_FIELDS, None, after, fields
+            )
+            return ndjson_response(project(student_dict(doc), fields) for doc in all_students)
+
+        def load():
+            all_students, next_cursor = paginate(
+                for_reads(Student.objects()).as_pymongo(), 'student_id', STUDENT_FIELDS, limit, after, fields
+            )
+            return {'items': [project(student_dict(doc), fields) for doc in all_students], 'next_cursor': next_cursor}
+        page = cache.get_or_set('students:list', request_key(), load)
+        return page_response(page['items'], page['next_cursor'])
+    except PaginationError as pe:
+        return jsonify({"error": str(pe)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -70,17 +366,11 @@ def create_student():
             Grade_level=grade_level
         )
         student.save()
+        invalidate_students()
         
         return jsonify({
             "msg": "Student created!",
-            "student": {
-                "id": str(student.id),
-                "student_id": student.student_id,
-                "name": student.name,
-                "age": student.age,
-                "department": student.department,
-                "grade_level": student.Grade_level
-            }
+            "student": student_to_dict(student)
         }), 201
     
     except ValidationError as ve:
@@ -93,19 +383,15 @@ def create_student():
 @students.route('/students/<student_id>', methods=['GET'])
 @jwt_required()
 def get_student(student_id):
+    """ETag คือ "<id>-<version>" ของเอกสาร ใช้ส่งกลับเป็น If-Match ของ PUT/DELETE และ If-None-Match ได้"""
     try:
-        student = Student.objects(id=student_id).first()
+        student = get_students_by_id([student_id]).get(student_id)
         if not student:
             return jsonify({"error": "Student not found"}), 404
         
-        return jsonify({
-            "id": str(student.id),
-            "student_id": student.student_id,
-            "name": student.name,
-            "age": student.age,
-            "department": student.department,
-            "grade_level": student.Grade_level  # Note: Capital G to match your model
-        })
+        response = jsonify(student)
+        response.set_etag(document_etag(student['id'], student['version']))
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -113,16 +399,18 @@ def get_student(student_id):
 @students.route('/students/<student_id>', methods=['PUT'])
 @jwt_required()
 def update_student(student_id):
+    """
+    แก้ไขและอ่านค่าใหม่กลับมาด้วย findAndModify ครั้งเดียว
+    ส่ง If-Match: "<id>-<version>" (ETag ของ GET /students/<id>) เพื่อแก้เฉพาะเมื่อยังเป็น version ที่อ่านไป (ไม่ตรงตอบ 412)
+    """
     try:
         data = request.get_json()
-        
-        # Find student first
-        student = Student.objects(id=student_id).first()
-        if not student:
-            return jsonify({"error": "Student not found"}), 404
-        
-        # Parse grade level if provided
-        grade_level = parse_grade_level(data.get('grade_level')) if 'grade_level' in data else student.Grade_level
+        try:
+            expected = if_match_version(student_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except PreconditionFailed as e:
+            return jsonify({"error": str(e)}), 412
         
         # Prepare update data
         update_data = {}
@@ -135,23 +423,19 @@ def update_student(student_id):
         if 'department' in data:
             update_data['department'] = data['department']
         if 'grade_level' in data:
-            update_data['Grade_level'] = grade_level  # Note: Capital G to match your model
+            update_data['Grade_level'] = parse_grade_level(data.get('grade_level'))  # Note: Capital G to match your model
         
-        # Update student
-        Student.objects(id=student_id).update_one(**update_data)
+        # Update student and return the new document
+        updated_student = students_matching(student_id, expected).modify(new=True, **update_data, **touch_update())
+        if not updated_student:
+            return version_conflict(student_id, expected)
+        invalidate_students()
+        if 'name' in update_data or 'student_id' in update_data:
+            snapshots.schedule(snapshots.sync_student, updated_student.id)
         
-        # Return updated student
-        updated_student = Student.objects(id=student_id).first()
         return jsonify({
             "msg": "Student updated!",
-            "student": {
-                "id": str(updated_student.id),
-                "student_id": updated_student.student_id,
-                "name": updated_student.name,
-                "age": updated_student.age,
-                "department": updated_student.department,
-                "grade_level": updated_student.Grade_level  # Note: Capital G to match your model
-            }
+            "student": student_to_dict(updated_student)
         })
         
     except Exception as e:
@@ -161,12 +445,20 @@ def update_student(student_id):
 @students.route('/students/<student_id>', methods=['DELETE'])
 @jwt_required()
 def delete_student(student_id):
+    """ลบด้วย findAndModify ครั้งเดียว รองรับ If-Match: "<id>-<version>" เหมือน PUT"""
     try:
-        student = Student.objects(id=student_id).first()
-        if not student:
-            return jsonify({"error": "Student not found"}), 404
+        try:
+            expected = if_match_version(student_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except PreconditionFailed as e:
+            return jsonify({"error": str(e)}), 412
         
-        Student.objects(id=student_id).delete()
+        student = students_matching(student_id, expected).modify(remove=True)
+        if not student:
+            return version_conflict(student_id, expected)
+        invalidate_students()
+        snapshots.schedule(snapshots.sync_student, student.id)
         return jsonify({"msg": "Student deleted!"})
         
     except Exception as e:
@@ -1,36 +1,110 @@
-from flask import Blueprint, request, jsonify
+from collections import Counter
+from flask import Blueprint, request, jsonify, current_app
 from models import Treatment, Student, Medicine
 from flask_jwt_extended import jwt_required
 from mongoengine import ValidationError
 from datetime import datetime
 from bson import ObjectId # เพิ่มบรรทัดนี้
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
+from pagination import PaginationError, page_args, paginate, project, page_response, encode_cursor, decode_cursor
+from streaming import wants_stream, stream_queryset, chunked, ndjson_response
+from routes.medicines import InsufficientStock, dispense_stock, restock, get_medicines_by_id
+from routes.students import get_students_by_id
+from etag import conditional, bump_version
+from db import for_reads
+import rollups
+import snapshots
 
 treatments = Blueprint('treatments', __name__)
 
+TREATMENT_FIELDS = {
+    '_id': 'id',
+    'student': 'student',
+    'symptoms': 'symptoms',
+    'medicines': 'medicines',
+    'date': 'date'
+}
+
 def treatment_to_dict(t: Treatment):
     """
     แปลง object Treatment ให้เป็น dictionary เพื่อใช้ในการส่งคืนเป็น JSON
     """
-    return {
-        '_id': str(t.id),
-        'student': {
-            'id': str(t.student.id),
-            'name': t.student.name,
-            'student_id': t.student.student_id
-        } if t.student else None,
-        'symptoms': t.symptoms,
-        'medicines': [
-            {'id': str(m.id), 'name': m.name} for m in t.medicines if m is not None
-        ],
-        'date': t.date.isoformat() if t.date else None
+    return treatments_to_dicts([t.to_mongo().to_dict()])[0]
+
+def medicine_names(t, medicines_by_id):
+    """รายชื่อยาของ treatment จาก medicine_snapshots หรือจาก medicines_by_id ถ้ายังไม่มี snapshot"""
+    if 'medicine_snapshots' in t:
+        return [{'id': str(m['id']), 'name': m.get('name')} for m in t['medicine_snapshots']]
+    return [
+        {'id': str(mid), 'name': medicines_by_id[str(mid)]['name']}
+        for mid in t.get('medicines', []) if str(mid) in medicines_by_id
+    ]
+
+def snapshot_misses(raw_treatments):
+    """id ของ Student และ Medicine ที่ต้องดึงเพิ่ม เพราะเอกสารยังไม่มี snapshot"""
+    student_ids = {t['student'] for t in raw_treatments if t.get('student') and 'student_name' not in t}
+    medicine_ids = {
+        mid for t in raw_treatments if 'medicine_snapshots' not in t
+        for mid in t.get('medicines', []) if mid
     }
+    return student_ids, medicine_ids
+
+def treatments_to_dicts(raw_treatments, students_by_id=None, medicines_by_id=None):
+    """
+    แปลง Treatment หลายรายการ (raw document จาก as_pymongo) ให้เป็น dictionary
+    ใช้ snapshot ชื่อที่เก็บไว้ใน Treatment เป็นหลัก จึงไม่ต้องอ่าน collection อื่น
+    เฉพาะเอกสารเก่าที่ยังไม่มี snapshot จะดึง Student และ Medicine ผ่าน cache (ที่ไม่มีใน cache ดึงด้วย $in)
+    หรือใช้ students_by_id / medicines_by_id ที่ผู้เรียกดึงมาให้แล้ว
+    """
+    raw_treatments = list(raw_treatments)
+    if students_by_id is None or medicines_by_id is None:
+        student_ids, medicine_ids = snapshot_misses(raw_treatments)
+        students_by_id = get_students_by_id(student_ids) if student_ids else {}
+        medicines_by_id = get_medicines_by_id(medicine_ids) if medicine_ids else {}
+
+    result = []
+    for t in raw_treatments:
+        if 'student_name' in t:
+            student = {'id': str(t['student']), 'name': t['student_name'], 'student_id': t.get('student_code')}
+        else:
+            student = students_by_id.get(str(t.get('student')))
+        result.append({
+            '_id': str(t['_id']),
+            'student': {
+                'id': student['id'],
+                'name': student['name'],
+                'student_id': student['student_id']
+            } if student else None,
+            'symptoms': t.get('symptoms'),
+            'medicines': medicine_names(t, medicines_by_id),
+            'date': t['date'].isoformat() if t.get('date') else None
+        })
+    return result
 
 # ✅ ค้นหาการรักษาและนักเรียนที่ได้รับการรักษา (list)
 @treatments.route('/treatments', methods=['GET'])
 @jwt_required()
+@conditional(Treatment, Student, Medicine)
 def get_treatments():
-    all_treatments = Treatment.objects()
-    return jsonify([treatment_to_dict(t) for t in all_treatments])
+    try:
+        limit, after, fields = page_args(TREATMENT_FIELDS, 'id')
+    except PaginationError as pe:
+        return jsonify({'error': str(pe)}), 400
+    if wants_stream():
+        all_treatments, _ = paginate(
+            stream_queryset(for_reads(Treatment.objects()).as_pymongo()), 'id', TREATMENT_FIELDS, None, after, fields
+        )
+        batch_size = current_app.config.get('STREAM_BATCH_SIZE', 500)
+        return ndjson_response(
+            project(t, fields)
+            for chunk in chunked(all_treatments, batch_size)
+            for t in treatments_to_dicts(chunk)
+        )
+    all_treatments, next_cursor = paginate(
+        for_reads(Treatment.objects()).as_pymongo(), 'id', TREATMENT_FIELDS, limit, after, fields
+    )
+    return page_response([project(t, fields) for t in treatments_to_dicts(all_treatments)], next_cursor)
 
 # ✅ สร้างการรักษาใหม่ (create)
 @treatments.route('/treatments', methods=['POST'])
@@ -54,7 +128,22 @@ def create_treatment():
             symptoms=data.get('symptoms', ''),
             medicines=medicine_objs,
             date=datetime.utcnow()
-        ).save()
+        )
+        treatment.validate()
+
+        # ตัด stock ยาที่จ่าย ถ้าไม่พอให้ตอบ 409
+        try:
+            taken = dispense_stock(m.id for m in medicine_objs)
+        except InsufficientStock as e:
+            return jsonify({'error': str(e)}), 409
+        try:
+            treatment.save()
+        except Exception:
+            restock(taken)
+            raise
+        rollups.apply(rollups.treatment_contributions(treatment))
+        bump_version(Treatment)
+        snapshots.refresh([treatment])
 
         return jsonify(treatment_to_dict(treatment)), 201
     except ValidationError as ve:
@@ -62,48 +151,224 @@ def create_treatment():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def bulk_item_error(item):
+    """ตรวจชนิดข้อมูลของแต่ละรายการใน bulk ก่อน query (คืนข้อความ error หรือ None)"""
+    if not isinstance(item, dict):
+        return 'Treatment must be an object'
+    if not isinstance(item.get('student_id'), str):
+        return 'student_id must be a string'
+    medicine_ids = item.get('medicine_ids', [])
+    if not isinstance(medicine_ids, list) or not all(isinstance(mid, str) for mid in medicine_ids):
+        return 'medicine_ids must be an array of id strings'
+    return None
+
+# ✅ สร้างการรักษาหลายรายการพร้อมกัน (bulk create)
+@treatments.route('/treatments/bulk', methods=['POST'])
+@jwt_required()
+def create_treatments_bulk():
+    """
+    รับ array ของ {student_id, symptoms, medicine_ids} แล้วตรวจสอบ Student และ Medicine
+    ทั้งหมดด้วย $in อย่างละครั้ง จากนั้นบันทึกด้วย insert_many ครั้งเดียว
+    รายการที่ผิดพลาดจะถูกรายงานใน errors โดยไม่ยกเลิกรายการอื่น
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return jsonify({'error': 'Request body must be an array of treatments'}), 400
+    max_items = current_app.config.get('BULK_MAX_ITEMS', 1000)
+    if len(data) > max_items:
+        return jsonify({'error': f'At most {max_items} treatments per request'}), 400
+
+    invalid = {index: error for index, error in enumerate(map(bulk_item_error, data)) if error}
+    items = [None if index in invalid else item for index, item in enumerate(data)]
+    student_codes = {item['student_id'] for item in items if item and item['student_id']}
+    medicine_ids = {
+        str(mid) for item in items if item
+        for mid in item.get('medicine_ids', []) if ObjectId.is_valid(mid)
+    }
+    students_by_code = {
+        s.student_id: s for s in Student.objects(student_id__in=list(student_codes))
+    } if student_codes else {}
+    medicines_by_id = {
+        str(m.id): m for m in Medicine.objects(id__in=[ObjectId(mid) for mid in medicine_ids])
+    } if medicine_ids else {}
+
+    errors = []
+    pending = []
+    for index, item in enumerate(items):
+        if item is None:
+            errors.append({'index': index, 'error': invalid[index]})
+            continue
+        student = students_by_code.get(item.get('student_id'))
+        if not student:
+            errors.append({'index': index, 'error': 'Student not found'})
+            continue
+        missing = [mid for mid in item.get('medicine_ids', []) if str(mid) not in medicines_by_id]
+        if missing:
+            errors.append({'index': index, 'error': f'Medicine with id {missing[0]} not found'})
+            continue
+
+        treatment = Treatment(
+            student=student,
+            symptoms=item.get('symptoms', ''),
+            medicines=[medicines_by_id[str(mid)] for mid in item.get('medicine_ids', [])],
+            date=datetime.utcnow()
+        )
+        try:
+            treatment.validate()
+        except ValidationError as ve:
+            errors.append({'index': index, 'error': ve.to_dict()})
+            continue
+        try:
+            taken = dispense_stock(m.id for m in treatment.medicines)
+        except InsufficientStock as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        treatment.touch()
+        pending.append((index, treatment, treatment.to_mongo().to_dict(), taken))
+
+    failed = set()
+    if pending:
+        try:
+            # insert_many เติม _id ลงใน document ที่ส่งเข้าไปให้เอง
+            Treatment._get_collection().insert_many([doc for _, _, doc, _ in pending], ordered=False)
+        except BulkWriteError as bwe:
+            for write_error in bwe.details.get('writeErrors', []):
+                index, _, _, taken = pending[write_error['index']]
+                restock(taken)
+                failed.add(index)
+                errors.append({'index': index, 'error': write_error.get('errmsg', 'Insert failed')})
+        except Exception:
+            for _, _, _, taken in pending:
+                restock(taken)
+            raise
+
+    created = []
+    for index, treatment, doc, _ in pending:
+        if index in failed:
+            continue
+        treatment.id = doc['_id']
+        created.append(treatment_to_dict(treatment))
+
+    if created:
+        inserted = [treatment for index, treatment, _, _ in pending if index not in failed]
+        counts = Counter()
+        for treatment in inserted:
+            counts.update(rollups.treatment_contributions(treatment))
+        rollups.apply(counts)
+        bump_version(Treatment)
+        snapshots.refresh(inserted)
+
+    errors.sort(key=lambda e: e['index'])
+    status = 201 if not errors else 207
+    return jsonify({'created': created, 'errors': errors}), status
+
 # ✅ ค้นหาจากนักเรียนที่ได้รับการรักษา (distinct list)
 @treatments.route('/treated_students', methods=['GET'])
 @jwt_required()
+@conditional(Treatment, Student)
 def get_treated_students():
-    treated_students = Treatment.objects().distinct('student')
-    students = []
-    for student in treated_students:
-        students.append({
+    # อ่านเป็น raw document (ไม่ dereference เป็น Student ทีละตัว) เหมือน async_app
+    student_ids = for_reads(Treatment.objects()).no_dereference().distinct('student')
+    students_by_id = {
+        doc['_id']: doc
+        for doc in for_reads(Student.objects(id__in=student_ids)).only('name', 'student_id').as_pymongo()
+    }
+    students = [
+        {'id': str(sid), 'name': students_by_id[sid].get('name'), 'student_id': students_by_id[sid].get('student_id')}
+        for sid in student_ids if sid in students_by_id
+    ]
+    return jsonify(students), 200
+
+def history_query(args, config):
+    """
+    อ่าน limit / after ของ treatment_history แล้วสร้าง aggregation pipeline ของหน้าปัจจุบัน
+    เรียงจากใหม่ไปเก่า แบ่งหน้าด้วย cursor (date, _id) ของรายการสุดท้ายในหน้าก่อน
+    keyset $match + $sort + $limit ใช้ index (student, -date) อ่านเฉพาะ limit + 1 เอกสาร ไม่ว่าประวัติจะยาวเท่าไร
+    คืนค่า (limit, pipeline)
+    """
+    try:
+        limit = int(args.get('limit', config.get('HISTORY_PAGE_SIZE', 50)))
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit <= 0:
+        raise PaginationError('limit must be greater than 0')
+    limit = min(limit, config.get('PAGE_MAX_LIMIT', 1000))
+
+    pipeline = []
+    if args.get('after'):
+        cursor = decode_cursor(args['after'], 'history')
+        try:
+            if not isinstance(cursor, str):
+                raise TypeError(cursor)
+            last_date, last_id = cursor.split('|')
+            last_date = datetime.fromisoformat(last_date)
+            last_id = ObjectId(last_id)
+        except (ValueError, TypeError, InvalidId):
+            raise PaginationError('Invalid cursor')
+        pipeline.append({'$match': {'$or': [
+            {'date': {'$lt': last_date}},
+            {'date': last_date, '_id': {'$lt': last_id}}
+        ]}})
+
+    pipeline += [
+        {'$sort': {'date': -1, '_id': -1}},
+        {'$limit': limit + 1},
+        {'$project': {'symptoms': 1, 'medicines': 1, 'medicine_snapshots': 1, 'date': 1}}
+    ]
+    return limit, pipeline
+
+def history_page(rows, limit):
+    """ตัดแถวที่เกินมา (limit + 1) คืนค่า (rows, next_cursor)"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(f"{last['date'].isoformat()}|{last['_id']}")
+    return rows, next_cursor
+
+def history_to_dict(student, count, rows, next_cursor, medicines_by_id):
+    return {
+        'student': {
             'id': str(student.id),
             'name': student.name,
             'student_id': student.student_id
-        })
-    return jsonify(students), 200
+        },
+        'treatment_count': count,  # จำนวนทั้งหมดของนักเรียน มีทุกหน้า
+        'history': [{
+            'id': str(t['_id']),
+            'symptoms': t.get('symptoms'),
+            'medicines': medicine_names(t, medicines_by_id),
+            'date': t['date'].isoformat() if t.get('date') else None
+        } for t in rows],
+        'next_cursor': next_cursor
+    }
 
 # ✅ ค้นหาประวัติการรักษาของนักเรียนเฉพาะเจาะจง (history)
 @treatments.route('/treatment_history/<student_id>', methods=['GET'])
 @jwt_required()
+@conditional(Treatment, Student, Medicine)
 def treatment_history(student_id):
+    """
+    ประวัติการรักษาใหม่ไปเก่า หน้าละ limit รายการ ส่ง after=<next_cursor> เพื่อขอหน้าถัดไป
+    treatment_count คือจำนวน treatment ทั้งหมดของนักเรียน มีค่าในทุกหน้า
+    (นับด้วย count แยกบน index (student, -date) ไม่ใช้ $facet เพราะจะทำให้หน้า keyset ต้อง sort ประวัติทั้งหมด)
+    """
     student = Student.objects(student_id=student_id).first()
     if not student:
         return jsonify({'error': 'Student not found'}), 404
 
-    treatments_qs = Treatment.objects(student=student)
-    history = []
-    for t in treatments_qs:
-        history.append({
-            'id': str(t.id),
-            'symptoms': t.symptoms,
-            'medicines': [
-                {'id': str(m.id), 'name': m.name} for m in t.medicines if m is not None
-            ],
-            'date': t.date.isoformat() if t.date else None
-        })
-    return jsonify({
-        'student': {
-            'id': str(student.id),
-            'name': student.name,
-            'student_id': student.student_id
-        },
-        'treatment_count': treatments_qs.count(),
-        'history': history
-    }), 200
+    try:
+        limit, pipeline = history_query(request.args, current_app.config)
+    except PaginationError as pe:
+        return jsonify({'error': str(pe)}), 400
+    history = for_reads(Treatment.objects(student=student.id))
+    rows, next_cursor = history_page(list(history.aggregate(pipeline)), limit)
+    count = history.count()
+
+    # ชื่อยามาจาก medicine_snapshots, เอกสารเก่าที่ยังไม่มี snapshot ดึงชื่อยาด้วย lookup ครั้งเดียวทั้งหน้า
+    _, medicine_ids = snapshot_misses(rows)
+    medicines_by_id = get_medicines_by_id(medicine_ids) if medicine_ids else {}
+    return jsonify(history_to_dict(student, count, rows, next_cursor, medicines_by_id)), 200
 
 # ✅ แก้ไขข้อมูลการรักษาตาม id (update)
 @treatments.route('/treatments/<id>', methods=['PUT'])
@@ -118,6 +383,7 @@ def update_treatment(id):
     treatment = Treatment.objects(id=ObjectId(id)).first()
     if not treatment:
         return jsonify({'error': 'Treatment not found'}), 404
+    before = rollups.treatment_contributions(treatment, sign=-1)
 
     if 'student_id' in data:
         student = Student.objects(student_id=data['student_id']).first()
@@ -143,20 +409,29 @@ def update_treatment(id):
 
     if 'date' in data:
         try:
-            treatment.date = datetime.fromisoformat(data['date'])
+            treatment.date = rollups.utc_naive(datetime.fromisoformat(data['date']))
         except Exception:
             return jsonify({'error': 'Invalid date format'}), 400
 
     treatment.save()
+    changes = rollups.treatment_contributions(treatment)
+    changes.update(before)
+    rollups.apply(changes)
+    bump_version(Treatment)
     return jsonify(treatment_to_dict(treatment)), 200
 
 # ✅ ลบการรักษาตาม id (delete)
-@treatments.route('/treatments/<_id>', methods=['DELETE'])
+@treatments.route('/treatments/<id>', methods=['DELETE'])
 @jwt_required()
 def delete_treatment(id):
+    if not ObjectId.is_valid(id):
+        return jsonify({'error': 'Invalid treatment ID format'}), 400
     treatment = Treatment.objects(id=id).first()
     if not treatment:
         return jsonify({'error': 'Treatment not found'}), 404
+    removed = rollups.treatment_contributions(treatment, sign=-1)
     treatment.delete()
+    rollups.apply(removed)
+    bump_version(Treatment)
     return jsonify({'msg': 'Treatment deleted', '_id': id}), 200
 #
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""
+แปลงข้อมูลเป็น JSON แบบเร็ว
+
+- student_dict / medicine_dict แปลง raw document (dict จาก as_pymongo() หรือ pymongo/Motor โดยตรง)
+  เป็น dict ของ API จึงไม่ต้องสร้าง mongoengine Document สำหรับทุกแถวของ list
+- FastJSONMixin ใช้ orjson (ถ้าติดตั้งไว้) แทน json ของ standard library ใน JSON provider ของ Flask/Quart
+  ผลลัพธ์มีชนิดข้อมูลเหมือนเดิม (datetime เป็น HTTP date, key เรียงตาม sort_keys)
+  ต่างกันเพียงตัวอักษรที่ไม่ใช่ ASCII ถูกส่งเป็น UTF-8 ตรง ๆ แทน \\uXXXX
+  ถ้าไม่มี orjson, มีการส่ง argument ของ json.dumps/json.loads (เช่น indent ตอน debug) หรือ orjson
+  แปลงไม่ได้ (เช่น int เกิน 64 บิต) จะกลับไปใช้ json ของ standard library
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson เป็น dependency เสริม
+    orjson = None
+
+if orjson is not None:
+    # datetime ส่งต่อให้ default ของ provider เพื่อให้ได้รูปแบบเดียวกับ json ของ Flask
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def student_dict(doc):
+    """raw document ของ Student -> dict ของ API (field ที่ไม่ได้ projection มาเป็น None)"""
+    return {
+        "id": str(doc['_id']),
+        "student_id": doc.get('student_id'),
+        "name": doc.get('name'),
+        "age": doc.get('age'),
+        "department": doc.get('department'),
+        "grade_level": doc.get('Grade_level'),
+        "version": doc.get('version', 0)  # ส่งกลับใน If-Match ตอนแก้ไข/ลบ
+    }
+
+
+def medicine_dict(doc):
+    """raw document ของ Medicine -> dict ของ API"""
+    return {
+        "_id": str(doc['_id']),
+        "name": doc.get('name'),
+        "brand": doc.get('brand'),
+        "stock": doc.get('stock', 0)
+    }
+
+
+class FastJSONMixin:
+    """ใช้ร่วมกับ DefaultJSONProvider ของ Flask หรือ Quart (ต้องมี default และ sort_keys)"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        option = _OPTIONS | orjson.OPT_SORT_KEYS if self.sort_keys else _OPTIONS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # NaN, int ที่ใหญ่มาก หรือ JSON ที่ผิดจริง (ให้ json ของ standard library raise error เดิม)
+            return super().loads(s)
+
+
+class FastJSONProvider(FastJSONMixin, DefaultJSONProvider):
+    """JSON provider ของ Flask app"""
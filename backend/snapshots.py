@@ -0,0 +1,184 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
+from flask import current_app
+from pymongo import UpdateOne
+
+from models import Student, Medicine, Treatment
+from etag import bump_version
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # สร้างเมื่อใช้งานครั้งแรก (หลัง fork ของ worker) และใช้ thread เดียว งานจึงทำตามลำดับที่ส่งเข้ามา
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot-sync')
+        return _executor
+
+
+def _run(job, *args):
+    try:
+        return job(*args)
+    except Exception:
+        logger.exception('Snapshot sync %s%r failed', job.__name__, args)
+
+
+def schedule(job, *args):
+    """
+    ส่งงาน fan-out ไปทำใน background thread (SNAPSHOT_SYNC=background, ค่าเริ่มต้น)
+    หรือทำทันทีใน request (SNAPSHOT_SYNC=inline)
+    งานอ่านชื่อล่าสุดจากฐานข้อมูลเองทุกครั้ง ถ้ามีการแก้ชื่อหลายครั้งติดกันผลสุดท้ายจึงถูกต้องเสมอ
+    """
+    if current_app.config.get('SNAPSHOT_SYNC', 'background') == 'inline':
+        return _run(job, *args)
+    return _get_executor().submit(_run, job, *args)
+
+
+def drain(timeout=10):
+    """รอให้งานที่ส่งเข้า background thread ก่อนหน้านี้ทำเสร็จ (thread เดียว งานจึงเสร็จตามลำดับ)"""
+    if _executor is not None:
+        _executor.submit(lambda: None).result(timeout=timeout)
+
+
+def _guarded(load, write):
+    """
+    เขียน snapshot ด้วยค่าที่ load() อ่านได้ แล้วอ่านซ้ำ (version guard): ถ้าเอกสารถูกแก้ระหว่างนั้น
+    เช่นงาน sync ของ worker อื่นที่อ่านชื่อเก่าไว้เขียนทับชื่อใหม่ ให้เขียนอีกรอบด้วยค่าล่าสุด
+    """
+    current = load()
+    updated = 0
+    while True:
+        updated += write(current)
+        latest = load()
+        if latest == current:
+            return updated
+        current = latest
+
+
+def _student_state(student_id):
+    student = Student.objects(id=student_id).only('name', 'student_id', 'version').first()
+    return (student.version, student.name, student.student_id) if student else None
+
+
+def sync_student(student_id):
+    """อัปเดต student_name/student_code ใน Treatment ของนักเรียนคนนี้ที่ยังเป็นชื่อเก่า (ลบ snapshot ถ้านักเรียนถูกลบ)"""
+    def write(state):
+        treatments = Treatment.objects(student=student_id)
+        if state is None:
+            return treatments.filter(student_name__exists=True).update(unset__student_name=True, unset__student_code=True)
+        _, name, code = state
+        stale = treatments.filter(__raw__={'$or': [{'student_name': {'$ne': name}}, {'student_code': {'$ne': code}}]})
+        return stale.update(set__student_name=name, set__student_code=code)
+
+    updated = _guarded(lambda: _student_state(student_id), write)
+    if updated:
+        bump_version(Treatment)
+    return updated
+
+
+def _medicine_state(medicine_id):
+    medicine = Medicine.objects(id=medicine_id).only('name', 'version').first()
+    return (medicine.version, medicine.name) if medicine else None
+
+
+def sync_medicine(medicine_id):
+    """อัปเดตชื่อยาใน medicine_snapshots ของ Treatment ที่จ่ายยานี้และยังเป็นชื่อเก่า (เอาออกถ้ายาถูกลบ)"""
+    medicine_id = ObjectId(medicine_id)
+    collection = Treatment._get_collection()
+
+    def write(state):
+        if state is None:
+            return collection.update_many(
+                {'medicines': medicine_id, 'medicine_snapshots.id': medicine_id},
+                {'$pull': {'medicine_snapshots': {'id': medicine_id}}}
+            ).modified_count
+        _, name = state
+        return collection.update_many(
+            {'medicines': medicine_id, 'medicine_snapshots': {'$elemMatch': {'id': medicine_id, 'name': {'$ne': name}}}},
+            {'$set': {'medicine_snapshots.$[m].name': name}},
+            array_filters=[{'m.id': medicine_id}]
+        ).modified_count
+
+    updated = _guarded(lambda: _medicine_state(medicine_id), write)
+    if updated:
+        bump_version(Treatment)
+    return updated
+
+
+def refresh(treatments):
+    """
+    ตรวจซ้ำหลัง insert Treatment: ชื่อที่ request อ่านไว้อาจถูกแก้ก่อน insert เสร็จ และงาน sync
+    ของการแก้ชื่อนั้นอาจทำไปแล้วก่อนที่ treatment นี้จะมีอยู่ จึงอ่านชื่อปัจจุบันด้วย $in
+    แล้ว sync เฉพาะนักเรียน/ยาที่ snapshot ไม่ตรง (ปกติไม่มีการเขียนเพิ่ม)
+    """
+    student_ids = {t.student.id for t in treatments}
+    medicine_ids = {m['id'] for t in treatments for m in t.medicine_snapshots}
+    students = {
+        s['_id']: (s.get('name'), s.get('student_id'))
+        for s in Student.objects(id__in=list(student_ids)).only('name', 'student_id').as_pymongo()
+    }
+    medicines = {
+        m['_id']: m.get('name') for m in Medicine.objects(id__in=list(medicine_ids)).only('name').as_pymongo()
+    } if medicine_ids else {}
+    stale_students = {t.student.id for t in treatments if students.get(t.student.id) != (t.student_name, t.student_code)}
+    stale_medicines = {
+        m['id'] for t in treatments for m in t.medicine_snapshots
+        if m['id'] not in medicines or medicines[m['id']] != m['name']
+    }
+    for student_id in stale_students:
+        sync_student(student_id)
+    for medicine_id in stale_medicines:
+        sync_medicine(medicine_id)
+
+
+def backfill(batch_size=1000, only_missing=True):
+    """
+    เติม snapshot ให้ Treatment ที่บันทึกก่อนมีฟิลด์เหล่านี้ (หรือทั้งหมดถ้า only_missing=False)
+    อ่าน Student และ Medicine ด้วย $in ครั้งละ batch แล้วเขียนด้วย bulk_write
+    """
+    collection = Treatment._get_collection()
+    query = {'$or': [
+        {'student_name': {'$exists': False}}, {'student_department': {'$exists': False}}
+    ]} if only_missing else {}
+    updated = 0
+    batch = []
+
+    def flush(batch):
+        student_ids = {doc['student'] for doc in batch if doc.get('student')}
+        medicine_ids = {mid for doc in batch for mid in doc.get('medicines', []) if mid}
+        students = {
+            s['_id']: s for s in Student.objects(id__in=list(student_ids)).only('name', 'student_id', 'department').as_pymongo()
+        } if student_ids else {}
+        medicines = {
+            m['_id']: m.get('name') for m in Medicine.objects(id__in=list(medicine_ids)).only('name').as_pymongo()
+        } if medicine_ids else {}
+        ops = []
+        for doc in batch:
+            student = students.get(doc.get('student'))
+            snapshot = {'medicine_snapshots': [
+                {'id': mid, 'name': medicines[mid]} for mid in doc.get('medicines', []) if mid in medicines
+            ]}
+            if student:
+                snapshot.update(student_name=student.get('name'), student_code=student.get('student_id'),
+                                student_department=student.get('department'))
+            ops.append(UpdateOne({'_id': doc['_id']}, {'$set': snapshot}))
+        return collection.bulk_write(ops, ordered=False).modified_count if ops else 0
+
+    for doc in collection.find(query, {'student': 1, 'medicines': 1}).batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            updated += flush(batch)
+            batch = []
+    if batch:
+        updated += flush(batch)
+    if updated:
+        bump_version(Treatment)
+    return updated
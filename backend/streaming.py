@@ -0,0 +1,40 @@
+from itertools import islice
+from flask import Response, request, current_app, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_stream(req=None):
+    """ผู้เรียกขอผลลัพธ์แบบ NDJSON (?stream=1 หรือ Accept: application/x-ndjson)"""
+    req = request if req is None else req
+    if req.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    best = req.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def stream_queryset(queryset):
+    """
+    เปิด server-side cursor แบบไม่เก็บผลลัพธ์ไว้ใน queryset cache
+    และดึงข้อมูลจาก MongoDB ครั้งละ STREAM_BATCH_SIZE เอกสาร
+    """
+    return queryset.no_cache().batch_size(current_app.config.get('STREAM_BATCH_SIZE', 500))
+
+
+def chunked(iterable, size):
+    # ห่อด้วย generator เพราะ iter() ของ queryset จะ rewind cursor ทุกครั้งที่ถูกเรียก
+    iterator = (item for item in iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ndjson_response(rows):
+    """ส่งผลลัพธ์ทีละบรรทัด (หนึ่งเอกสารต่อบรรทัด) ผ่าน generator response"""
+    def generate():
+        dumps = current_app.json.dumps
+        for row in rows:
+            yield dumps(row) + '\n'
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
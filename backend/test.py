@@ -5,9 +5,12 @@ Hospital Room API Tests using pytest
 """
 
 import os
+import sys
+import json
 import pytest
 import requests
 import pymongo
+import subprocess
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -90,6 +93,19 @@ def authenticated_session(api_session):
     return api_session
 
 
+def get_all(session, url):
+    """ดึง list endpoint ทุกหน้าตาม header X-Next-Cursor (ไม่ระบุ limit จะได้หน้าละ PAGE_DEFAULT_LIMIT รายการ)"""
+    items = []
+    cursor = None
+    while True:
+        response = session.get(url, params={"after": cursor} if cursor else None)
+        assert response.status_code == 200, f"Get {url} failed: {response.text}"
+        items.extend(response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return items
+
+
 @pytest.fixture
 def sample_student_id(authenticated_session):
     """Create a sample student and return its ID"""
@@ -158,6 +174,69 @@ class TestMongoDB:
             print(f"   ✓ {collection}: {count} documents")
 
 
+class TestHealth:
+    """Test health and readiness endpoints"""
+
+    def test_health_and_readiness(self, api_session):
+        """ทดสอบ /healthz (liveness) และ /readyz (เชื่อมต่อ MongoDB ได้)"""
+        root = TestConfig.BASE_URL.rsplit('/api', 1)[0]
+        response = api_session.get(f"{root}/healthz")
+        assert response.status_code == 200
+        assert response.json()['status'] == 'ok'
+
+        response = api_session.get(f"{root}/readyz")
+        assert response.status_code == 200, f"Readiness failed: {response.text}"
+        assert response.json()['status'] == 'ready'
+        print("✅ Health and readiness endpoints OK")
+
+    def test_pool_stats(self, authenticated_session):
+        """ทดสอบ /debug/pool แสดงการใช้งาน connection pool ของ MongoDB"""
+        authenticated_session.get(f"{TestConfig.BASE_URL}/students")
+        root = TestConfig.BASE_URL.rsplit('/api', 1)[0]
+        stats = requests.get(f"{root}/debug/pool").json()
+        assert stats['max_pool_size'] > 0
+        for server in stats['servers'].values():
+            assert server['in_use'] <= stats['max_pool_size']
+        print(f"✅ Pool stats: {len(stats['servers'])} servers")
+
+    def test_metrics(self, authenticated_session):
+        """ทดสอบ /metrics (Prometheus text) เมื่อเปิด METRICS_ENABLED"""
+        authenticated_session.get(f"{TestConfig.BASE_URL}/students")
+        root = TestConfig.BASE_URL.rsplit('/api', 1)[0]
+        # /metrics ตอบเฉพาะ METRICS_ALLOWED_IPS (ค่าเริ่มต้น localhost) หรือ Bearer METRICS_TOKEN
+        token = os.getenv('METRICS_TOKEN')
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = requests.get(f"{root}/metrics", headers=headers)
+        if response.status_code == 404:
+            pytest.skip("METRICS_ENABLED is off")
+        assert response.status_code == 200
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert 'http_request_duration_seconds_bucket{' in response.text
+        assert 'endpoint="students.get_students"' in response.text
+        print("✅ Metrics exported")
+
+    def test_compression(self, authenticated_session):
+        """ทดสอบการบีบอัด gzip ตาม Accept-Encoding ทั้ง response ปกติและ NDJSON stream"""
+        root = TestConfig.BASE_URL.rsplit('/api', 1)[0]
+        response = requests.get(f"{root}/debug/routes", headers={"Accept-Encoding": "gzip"})
+        if 'Content-Encoding' not in response.headers:
+            pytest.skip("COMPRESSION_ENABLED is off")
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert response.json()['routes']
+
+        response = requests.get(f"{root}/debug/routes", headers={"Accept-Encoding": "identity"})
+        assert 'Content-Encoding' not in response.headers
+
+        response = authenticated_session.get(
+            f"{TestConfig.BASE_URL}/students", params={"stream": 1}, headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers['Content-Encoding'] == 'gzip'
+        rows = [json.loads(line) for line in response.text.splitlines() if line]
+        assert all('student_id' in row for row in rows)
+        print(f"✅ Compression: {len(rows)} streamed rows over gzip")
+
+
 class TestAuthentication:
     """Test user authentication endpoints"""
     
@@ -203,7 +282,61 @@ class TestAuthentication:
         response = api_session.post(f"{TestConfig.BASE_URL}/login", json=invalid_user)
         assert response.status_code == 401
         assert 'Invalid credentials' in response.json().get('msg', '')
-    
+
+    def test_login_rehashes_password(self, api_session, mongodb_client):
+        """ทดสอบ login สำเร็จด้วย hash แบบเก่า (pbkdf2) แล้ว hash ถูกคำนวณใหม่ด้วย PASSWORD_HASH_METHOD"""
+        from werkzeug.security import generate_password_hash
+        user = {"username": f"rehash_{datetime.now().microsecond}", "password": "rehash-password"}
+        assert api_session.post(f"{TestConfig.BASE_URL}/register", json=user).status_code == 200
+        db = mongodb_client[os.getenv('MONGO_DB', 'hospital_room')]
+        old_hash = generate_password_hash(user['password'], 'pbkdf2:sha256:1000')
+        db.user.update_one({"username": user['username']}, {"$set": {"password": old_hash}})
+
+        response = requests.post(f"{TestConfig.BASE_URL}/login", json=user)
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        new_hash = db.user.find_one({"username": user['username']})['password']
+        assert new_hash != old_hash and not new_hash.startswith('pbkdf2:sha256:1000$')
+        assert requests.post(f"{TestConfig.BASE_URL}/login", json=user).status_code == 200
+        print(f"✅ Password rehashed with {new_hash.split('$', 1)[0]}")
+
+    def test_login_busy_returns_503(self, api_session):
+        """ทดสอบ login พร้อมกันเกินจำนวนที่ password hashing รับได้ ตอบ 503 + Retry-After ทันที (ไม่ถือ thread รอ)"""
+        from concurrent.futures import ThreadPoolExecutor
+        api_session.post(f"{TestConfig.BASE_URL}/register", json=TestConfig.TEST_USER)
+
+        def login(_):
+            return requests.post(f"{TestConfig.BASE_URL}/login", json=TestConfig.TEST_USER)
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            responses = list(pool.map(login, range(16)))
+        statuses = [r.status_code for r in responses]
+        assert set(statuses) <= {200, 503}, statuses
+        assert 200 in statuses
+        busy = [r for r in responses if r.status_code == 503]
+        if not busy:
+            pytest.skip("Server has enough hashing capacity for 16 concurrent logins")
+        assert all(r.headers.get('Retry-After') for r in busy)
+        print(f"✅ {len(busy)} of {len(responses)} concurrent logins got 503")
+
+    def test_logout_revokes_token(self, api_session):
+        """ทดสอบ logout แล้ว token เดิมใช้ไม่ได้อีก"""
+        api_session.post(f"{TestConfig.BASE_URL}/register", json=TestConfig.TEST_USER)
+        response = requests.post(f"{TestConfig.BASE_URL}/login", json=TestConfig.TEST_USER)
+        assert response.status_code == 200
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        # เรียกซ้ำสองครั้ง (ครั้งที่สองใช้ claims จาก cache)
+        for _ in range(2):
+            assert requests.get(f"{TestConfig.BASE_URL}/students", headers=headers).status_code == 200
+
+        response = requests.post(f"{TestConfig.BASE_URL}/logout", headers=headers)
+        assert response.status_code == 200
+
+        response = requests.get(f"{TestConfig.BASE_URL}/students", headers=headers)
+        assert response.status_code == 401
+        assert 'ถูกยกเลิก' in response.json().get('error', '')
+        print("✅ Logout revokes token")
+
     def test_get_users(self, api_session):
         """ทดสอบการดึงรายชื่อ users"""
         response = api_session.get(f"{TestConfig.BASE_URL}/get_user")
@@ -245,7 +378,146 @@ class TestStudentsAPI:
             required_fields = ['id', 'student_id', 'name', 'age', 'department', 'grade_level']
             for field in required_fields:
                 assert field in student, f"Missing field: {field}"
-    
+
+    def test_paginate_students(self, authenticated_session):
+        """ทดสอบ keyset pagination และ fields projection ของรายชื่อนักเรียน"""
+        for i in range(3):
+            authenticated_session.post(f"{TestConfig.BASE_URL}/students", json={
+                **TestConfig.TEST_STUDENT,
+                "student_id": f"PAGE_{i}_{datetime.now().microsecond}"
+            })
+
+        seen = []
+        cursor = None
+        while True:
+            url = f"{TestConfig.BASE_URL}/students?limit=2&fields=student_id,name"
+            if cursor:
+                url += f"&after={cursor}"
+            response = authenticated_session.get(url)
+            assert response.status_code == 200, f"Get students page failed: {response.text}"
+
+            page = response.json()
+            assert len(page) <= 2
+            for student in page:
+                assert set(student.keys()) == {'student_id', 'name'}
+            seen.extend(s['student_id'] for s in page)
+
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+
+        assert seen == sorted(seen), "Pages should be ordered by student_id"
+        assert len(seen) == len(set(seen)), "Pages should not overlap"
+        print(f"✅ Paginated through {len(seen)} students")
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/students?fields=password")
+        assert response.status_code == 400
+
+    def test_default_page_limit(self, authenticated_session):
+        """ทดสอบว่าไม่ระบุ limit ได้หน้าแรกที่จำกัดขนาด และตาม X-Next-Cursor แล้วได้ครบเท่ากับ ?stream=1"""
+        for i in range(3):
+            authenticated_session.post(f"{TestConfig.BASE_URL}/students", json={
+                **TestConfig.TEST_STUDENT,
+                "student_id": f"DEFAULT_PAGE_{i}_{datetime.now().microsecond}"
+            })
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/students")
+        assert response.status_code == 200
+        first_page = response.json()
+        assert len(first_page) <= 1000, "List endpoints must not return the whole collection by default"
+
+        listed = [s['student_id'] for s in get_all(authenticated_session, f"{TestConfig.BASE_URL}/students")]
+        streamed = authenticated_session.get(f"{TestConfig.BASE_URL}/students?stream=1&fields=student_id")
+        assert listed == [json.loads(line)['student_id'] for line in streamed.text.splitlines() if line]
+        if response.headers.get('X-Next-Cursor'):
+            assert len(first_page) < len(listed)
+        print(f"✅ First page has {len(first_page)} of {len(listed)} students")
+
+    def test_import_students_csv(self, authenticated_session):
+        """ทดสอบนำเข้านักเรียนจากไฟล์ CSV (upsert ตาม student_id และรายงานแถวที่ผิด)"""
+        student_id = f"IMPORT_{datetime.now().microsecond}"
+        roster = f"Student ID,Name,Age,Department,Grade\n{student_id},Imported Student,20,Nursing,Year 2\n,Missing Id,,,\n"
+        # ส่งแบบ multipart จึงใช้ requests ตรง ๆ (session ตั้ง Content-Type เป็น JSON ไว้)
+        headers = {"Authorization": authenticated_session.headers["Authorization"]}
+        response = requests.post(f"{TestConfig.BASE_URL}/students/import", headers=headers,
+                                 files={"file": ("roster.csv", roster, "text/csv")})
+        assert response.status_code == 207, f"Import failed: {response.text}"
+        result = response.json()
+        assert result['processed'] == 2
+        assert result['created'] == 1
+        assert [e['row'] for e in result['errors']] == [3]
+
+        page = get_all(authenticated_session, f"{TestConfig.BASE_URL}/students")
+        imported = next(s for s in page if s['student_id'] == student_id)
+        assert imported['grade_level'] == 2
+        assert imported['department'] == 'Nursing'
+
+        # นำเข้าซ้ำ: ไม่มีอะไรเปลี่ยน
+        response = requests.post(f"{TestConfig.BASE_URL}/students/import", headers=headers,
+                                 files={"file": ("roster.csv", roster.splitlines()[0] + "\n" + roster.splitlines()[1], "text/csv")})
+        assert response.status_code == 200
+        assert response.json()['unchanged'] == 1
+        print("✅ Student CSV import works")
+
+    def test_import_students_bad_encoding(self, authenticated_session):
+        """ทดสอบไฟล์ที่มี byte ที่ไม่ใช่ UTF-8 หลังหัวตาราง: รายงานเป็น error ของแถว ไม่ใช่ 500 หรือ stream ขาด"""
+        prefix = f"BADENC_{datetime.now().microsecond}"
+        # ให้ byte ที่ผิดอยู่หลัง buffer แรกของ TextIOWrapper (8 KB) หัวตารางจึงอ่านได้ปกติ
+        rows = "".join(f"{prefix}_{i},Encoding Test Student {i},20,Nursing,Year 1\n" for i in range(300))
+        roster = b"student_id,name,age,department,grade\n" + rows.encode() + b"\xff\xfe broken\n"
+        headers = {"Authorization": authenticated_session.headers["Authorization"]}
+
+        response = requests.post(f"{TestConfig.BASE_URL}/students/import", headers=headers,
+                                 files={"file": ("roster.csv", roster, "text/csv")})
+        assert response.status_code == 207, f"Import failed: {response.text}"
+        assert 'UTF-8' in response.json()['errors'][-1]['error']
+
+        response = requests.post(f"{TestConfig.BASE_URL}/students/import?stream=1", headers=headers,
+                                 files={"file": ("roster.csv", roster, "text/csv")})
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[-1]['done'] is True
+        assert any('UTF-8' in e['error'] for line in lines for e in line.get('errors', []))
+        print("✅ Undecodable rows reported as row errors")
+
+    def test_student_cache_invalidation(self, authenticated_session):
+        """ทดสอบว่าการแก้ไขนักเรียนล้าง cache ทำให้อ่านได้ข้อมูลใหม่ทันที"""
+        student_data = {**TestConfig.TEST_STUDENT, "student_id": f"CACHE_{datetime.now().microsecond}"}
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json=student_data)
+        assert response.status_code in [200, 201]
+        student_obj_id = response.json()['student']['id']
+
+        # อ่านสองครั้งเพื่อให้ข้อมูลอยู่ใน cache
+        for _ in range(2):
+            response = authenticated_session.get(f"{TestConfig.BASE_URL}/students/{student_obj_id}")
+            assert response.json()['name'] == student_data['name']
+
+        authenticated_session.put(f"{TestConfig.BASE_URL}/students/{student_obj_id}", json={"name": "Cache Renamed"})
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/students/{student_obj_id}")
+        assert response.json()['name'] == "Cache Renamed"
+
+        stats = requests.get(TestConfig.BASE_URL.replace('/api', '/debug/cache')).json()
+        assert stats['hits'] >= 1
+        print(f"✅ Cache stats: {stats['hits']} hits, {stats['misses']} misses")
+
+    def test_student_serialization(self, authenticated_session):
+        """ทดสอบว่า list (raw document) และ create (Document) ให้ JSON รูปแบบเดียวกัน รวมถึงชื่อภาษาไทย"""
+        student_data = {**TestConfig.TEST_STUDENT, "student_id": f"SER_{datetime.now().microsecond}", "name": "สมชาย ใจดี"}
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json=student_data)
+        assert response.status_code in [200, 201]
+        created = response.json()['student']
+        assert created['grade_level'] == 3 and created['version'] == 1
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/students/{created['id']}")
+        assert response.json() == created
+
+        response = authenticated_session.get(
+            f"{TestConfig.BASE_URL}/students", params={"fields": "name,version", "limit": 1000}
+        )
+        assert response.status_code == 200
+        assert {"name": "สมชาย ใจดี", "version": created['version']} in response.json()
+        assert all(set(s) <= {"name", "version"} for s in response.json())
+        print("✅ Student serialization is consistent")
+
     def test_update_student(self, authenticated_session, sample_student_id):
         """ทดสอบการแก้ไขข้อมูลนักเรียน"""
         # ดึงข้อมูล student ก่อน
@@ -269,7 +541,95 @@ class TestStudentsAPI:
         )
         assert response.status_code == 200, f"Update student failed: {response.text}"
         print("✅ Student updated successfully")
-    
+
+    def test_update_student_if_match(self, authenticated_session):
+        """ทดสอบ If-Match: แก้ไข/ลบได้เฉพาะเมื่อ version ตรงกับที่อ่านไป (ไม่ตรงตอบ 412)"""
+        student_data = {**TestConfig.TEST_STUDENT, "student_id": f"IFMATCH_{datetime.now().microsecond}"}
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json=student_data)
+        assert response.status_code in [200, 201]
+        student = response.json()['student']
+        url = f"{TestConfig.BASE_URL}/students/{student['id']}"
+
+        response = authenticated_session.put(url, json={"age": 30}, headers={"If-Match": f'"{student["version"]}"'})
+        assert response.status_code == 200, f"Update failed: {response.text}"
+        updated = response.json()['student']
+        assert updated['age'] == 30
+        assert updated['version'] == student['version'] + 1
+
+        # แก้ด้วย version เก่า (มีคนแก้ไปก่อนแล้ว)
+        response = authenticated_session.put(url, json={"age": 31}, headers={"If-Match": f'"{student["version"]}"'})
+        assert response.status_code == 412
+        assert response.json()['version'] == updated['version']
+
+        response = authenticated_session.delete(url, headers={"If-Match": f'"{student["version"]}"'})
+        assert response.status_code == 412
+        response = authenticated_session.delete(url, headers={"If-Match": f'"{updated["version"]}"'})
+        assert response.status_code == 200
+        assert authenticated_session.put(url, json={"age": 32}).status_code == 404
+        print("✅ If-Match prevents lost updates")
+
+    def test_if_match_with_get_etag(self, authenticated_session):
+        """ทดสอบ ETag ของ GET /students/<id> ใช้เป็น If-Match ของ PUT ได้ และตอบ 304 เมื่อไม่เปลี่ยน"""
+        student_data = {**TestConfig.TEST_STUDENT, "student_id": f"ETAGMATCH_{datetime.now().microsecond}"}
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json=student_data)
+        assert response.status_code in [200, 201]
+        url = f"{TestConfig.BASE_URL}/students/{response.json()['student']['id']}"
+        other = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json={
+            **student_data, "student_id": f"{student_data['student_id']}_OTHER"
+        }).json()['student']
+
+        response = authenticated_session.get(url)
+        etag = response.headers.get('ETag')
+        assert etag == f'"{response.json()["id"]}-{response.json()["version"]}"'
+        assert authenticated_session.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+        # ETag ของนักเรียนอีกคนที่ version เท่ากันใช้แก้คนนี้ไม่ได้
+        other_etag = authenticated_session.get(f"{TestConfig.BASE_URL}/students/{other['id']}").headers['ETag']
+        assert other_etag != etag
+        assert authenticated_session.put(url, json={"age": 39}, headers={"If-Match": other_etag}).status_code == 412
+
+        response = authenticated_session.put(url, json={"age": 40}, headers={"If-Match": etag})
+        assert response.status_code == 200, f"Update failed: {response.text}"
+        assert authenticated_session.put(url, json={"age": 41}, headers={"If-Match": etag}).status_code == 412
+        print("✅ GET ETag works as If-Match")
+
+    def test_compressed_student_not_shared(self, authenticated_session):
+        """ทดสอบนักเรียนสองคนที่มี version เท่ากัน: body ที่บีบอัดแล้วต้องไม่ถูกใช้ข้ามกัน (cache ของ compression)"""
+        suffix = datetime.now().microsecond
+        ids = []
+        for name in ["Alice", "Bob"]:
+            response = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json={
+                **TestConfig.TEST_STUDENT,
+                "student_id": f"GZIP_{name}_{suffix}",
+                # ยาวกว่า COMPRESSION_MIN_SIZE จึงถูกบีบอัด
+                "name": f"{name} " + "x" * 2000
+            })
+            assert response.status_code in [200, 201]
+            ids.append(response.json()['student']['id'])
+
+        for student_id, name in zip(ids, ["Alice", "Bob"]):
+            response = authenticated_session.get(f"{TestConfig.BASE_URL}/students/{student_id}",
+                                                 headers={"Accept-Encoding": "gzip"})
+            assert response.status_code == 200
+            assert response.json()['id'] == student_id
+            assert response.json()['name'].startswith(name)
+        print("✅ Compressed responses are cached per URL")
+
+    def test_update_legacy_student_if_match(self, authenticated_session, mongodb_client):
+        """ทดสอบนักเรียนที่บันทึกก่อนมี field version (แสดงเป็น version 0) แก้ไขด้วย If-Match: "<id>-0" ได้"""
+        db = mongodb_client[os.getenv('MONGO_DB', 'hospital_room')]
+        student_id = db.student.insert_one({
+            "student_id": f"LEGACY_{datetime.now().microsecond}", "name": "Legacy Student", "age": 20
+        }).inserted_id
+        url = f"{TestConfig.BASE_URL}/students/{student_id}"
+
+        response = authenticated_session.get(url)
+        assert response.json()['version'] == 0
+        response = authenticated_session.put(url, json={"age": 21}, headers={"If-Match": response.headers['ETag']})
+        assert response.status_code == 200, f"Update failed: {response.text}"
+        assert response.json()['student']['version'] == 1
+        print("✅ Legacy students match If-Match: \"<id>-0\"")
+
     def test_delete_student(self, authenticated_session):
         """ทดสอบการลบนักเรียน"""
         # สร้าง student สำหรับลบ
@@ -283,8 +643,7 @@ class TestStudentsAPI:
             pytest.skip("Cannot create student for delete test")
         
         # ดึง ID ของ student ที่สร้าง
-        get_response = authenticated_session.get(f"{TestConfig.BASE_URL}/students")
-        students = get_response.json()
+        students = get_all(authenticated_session, f"{TestConfig.BASE_URL}/students")
         
         target_student = next((s for s in students if s['student_id'] == student_data['student_id']), None)
         if not target_student:
@@ -344,6 +703,74 @@ class TestMedicinesAPI:
         assert response.status_code == 400
         assert 'required' in response.json().get('error', '').lower()
     
+    def test_medicines_etag(self, authenticated_session):
+        """ทดสอบ ETag / If-None-Match: ได้ 304 เมื่อข้อมูลไม่เปลี่ยน และ 200 หลังจากมีการเขียน"""
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/medicines")
+        assert response.status_code == 200
+        etag = response.headers.get('ETag')
+        assert etag, "Missing ETag header"
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/medicines", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b''
+
+        authenticated_session.post(f"{TestConfig.BASE_URL}/medicines", json={
+            **TestConfig.TEST_MEDICINE,
+            "name": f"ETag Test {datetime.now().microsecond}"
+        })
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/medicines", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers.get('ETag') != etag
+        print("✅ Conditional GET returns 304 until the collection changes")
+
+    def test_etag_depends_on_accept(self, authenticated_session):
+        """ทดสอบ URL เดียวกันที่ขอ JSON และ NDJSON (Accept) ได้ ETag ต่างกันและมี Vary: Accept"""
+        url = f"{TestConfig.BASE_URL}/medicines"
+        response = authenticated_session.get(url)
+        assert response.status_code == 200
+        assert 'accept' in response.headers.get('Vary', '').lower()
+        etag = response.headers.get('ETag')
+
+        response = authenticated_session.get(url, headers={"Accept": "application/x-ndjson", "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers['Content-Type'].startswith('application/x-ndjson')
+        assert response.headers.get('ETag') != etag
+        assert 'accept' in response.headers.get('Vary', '').lower()
+        print("✅ JSON and NDJSON representations get different ETags")
+
+    def test_search_medicines_prefix(self, authenticated_session):
+        """ทดสอบการค้นหาแบบ prefix (มีการจัดลำดับและ limit) และ mode=substring แบบเดิม"""
+        suffix = datetime.now().microsecond
+        for name in [f"Zyxprefix {suffix}", f"Other Zyxprefix {suffix}"]:
+            authenticated_session.post(f"{TestConfig.BASE_URL}/medicines", json={**TestConfig.TEST_MEDICINE, "name": name})
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/medicines/search?q=ZYXPREFIX&limit=50")
+        assert response.status_code == 200, f"Search medicines failed: {response.text}"
+        names = [m['name'] for m in response.json()]
+        assert f"Zyxprefix {suffix}" in names
+        assert names.index(f"Zyxprefix {suffix}") < names.index(f"Other Zyxprefix {suffix}")
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/medicines/search?q=xprefix {suffix}&mode=substring")
+        assert response.status_code == 200
+        assert len(response.json()) >= 2
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/medicines/search?q=Zyx&mode=fuzzy")
+        assert response.status_code == 400
+        print(f"✅ Prefix search ranked {len(names)} medicines")
+
+    def test_search_exact_match_first(self, authenticated_session):
+        """ทดสอบว่าชื่อที่ตรงกันทั้งหมดถูกส่งกลับเสมอ แม้มียาที่ตรงแค่ยี่ห้อมากกว่าจำนวน candidate"""
+        word = f"Exactq{datetime.now().microsecond}"
+        for i in range(8):
+            authenticated_session.post(f"{TestConfig.BASE_URL}/medicines",
+                                       json={**TestConfig.TEST_MEDICINE, "name": f"Brand Only {i}", "brand": word})
+        authenticated_session.post(f"{TestConfig.BASE_URL}/medicines", json={**TestConfig.TEST_MEDICINE, "name": word})
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/medicines/search?q={word.lower()}&limit=1")
+        assert response.status_code == 200, f"Search medicines failed: {response.text}"
+        assert [m['name'] for m in response.json()] == [word]
+        print("✅ Exact name match ranks first")
+
     def test_update_medicine(self, authenticated_session, sample_medicine_id):
         """ทดสอบการแก้ไขยา"""
         update_data = {
@@ -405,6 +832,62 @@ class TestTreatmentsAPI:
         assert result['student']['id'] is not None
         print(f"✅ Treatment created: {result['_id']}")
     
+    def test_treatment_dispenses_stock(self, authenticated_session, sample_student_id):
+        """ทดสอบว่าการสร้าง treatment ตัด stock ยา และตอบ 409 เมื่อ stock ไม่พอ"""
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/medicines", json={
+            **TestConfig.TEST_MEDICINE,
+            "name": f"Stock Test {datetime.now().microsecond}",
+            "stock": 2
+        })
+        assert response.status_code in [200, 201]
+        medicine_id = response.json()['_id']
+
+        treatment_data = {"student_id": sample_student_id, "symptoms": "Pytest stock", "medicine_ids": [medicine_id, medicine_id]}
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json=treatment_data)
+        assert response.status_code in [200, 201], f"Create treatment failed: {response.text}"
+
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json=treatment_data)
+        assert response.status_code == 409
+        assert 'stock' in response.json().get('error', '').lower()
+
+        medicines = get_all(authenticated_session, f"{TestConfig.BASE_URL}/medicines")
+        medicine = next(m for m in medicines if m['_id'] == medicine_id)
+        assert medicine['stock'] == 0
+        print("✅ Stock decremented and over-dispense rejected")
+
+    def test_create_treatments_bulk(self, authenticated_session, sample_student_id, sample_medicine_id):
+        """ทดสอบการสร้าง treatments หลายรายการ โดยรายการที่ผิดไม่ทำให้ทั้ง batch ล้มเหลว"""
+        batch = [
+            {"student_id": sample_student_id, "symptoms": "Pytest bulk 1", "medicine_ids": [sample_medicine_id]},
+            {"student_id": "NONEXISTENT_STUDENT_ID", "symptoms": "Pytest bulk 2"},
+            {"student_id": sample_student_id, "symptoms": "Pytest bulk 3", "medicine_ids": []}
+        ]
+
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments/bulk", json=batch)
+        assert response.status_code == 207, f"Bulk create failed: {response.text}"
+
+        result = response.json()
+        assert [t['symptoms'] for t in result['created']] == ["Pytest bulk 1", "Pytest bulk 3"]
+        assert [e['index'] for e in result['errors']] == [1]
+        print(f"✅ Bulk created {len(result['created'])} treatments, {len(result['errors'])} errors")
+
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments/bulk", json={"student_id": sample_student_id})
+        assert response.status_code == 400
+
+        # ชนิดข้อมูลผิดรายงานเป็น error ของรายการนั้น (ไม่ใช่ 500)
+        batch = [
+            {"student_id": sample_student_id, "symptoms": "Pytest bulk types", "medicine_ids": None},
+            {"student_id": ["not", "hashable"], "symptoms": "Pytest bulk types"},
+            {"student_id": sample_student_id, "symptoms": "Pytest bulk types", "medicine_ids": sample_medicine_id},
+            "not an object",
+            {"student_id": sample_student_id, "symptoms": "Pytest bulk types ok"}
+        ]
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments/bulk", json=batch)
+        assert response.status_code == 207, f"Bulk create failed: {response.text}"
+        result = response.json()
+        assert [e['index'] for e in result['errors']] == [0, 1, 2, 3]
+        assert [t['symptoms'] for t in result['created']] == ["Pytest bulk types ok"]
+
     def test_get_all_treatments(self, authenticated_session):
         """ทดสอบการดึงข้อมูล treatments ทั้งหมด"""
         response = authenticated_session.get(f"{TestConfig.BASE_URL}/treatments")
@@ -419,7 +902,59 @@ class TestTreatmentsAPI:
             required_fields = ['_id', 'student', 'symptoms', 'medicines', 'date']
             for field in required_fields:
                 assert field in treatment, f"Missing field: {field}"
-    
+
+    def test_get_treatments_query_count(self, authenticated_session, mongodb_client, sample_student_id, sample_medicine_id):
+        """ทดสอบว่าจำนวน query ต่อ request ของ /treatments คงที่ ไม่เพิ่มตามจำนวน treatments (ไม่มี N+1)"""
+        mongo_db = os.getenv('MONGO_DB', 'hospital_room')
+        db = mongodb_client[mongo_db]
+        namespaces = [f"{mongo_db}.treatment", f"{mongo_db}.student", f"{mongo_db}.medicine"]
+
+        def count_queries():
+            # ใช้ database profiler นับ query ที่ API server ส่งไปยัง MongoDB ระหว่าง request
+            db.command('profile', 0)
+            db.system.profile.drop()
+            db.command('profile', 2)
+            try:
+                response = authenticated_session.get(f"{TestConfig.BASE_URL}/treatments")
+            finally:
+                db.command('profile', 0)
+            assert response.status_code == 200, f"Get treatments failed: {response.text}"
+            return db.system.profile.count_documents({'op': 'query', 'ns': {'$in': namespaces}})
+
+        before = count_queries()
+        for i in range(5):
+            response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json={
+                "student_id": sample_student_id,
+                "symptoms": f"Pytest query count {i}",
+                "medicine_ids": [sample_medicine_id, sample_medicine_id]
+            })
+            assert response.status_code in [200, 201], f"Create treatment failed: {response.text}"
+        after = count_queries()
+
+        # อาจน้อยลงได้เมื่อ Student/Medicine อยู่ใน cache แล้ว แต่ต้องไม่เพิ่มตามจำนวน treatments
+        assert after <= before, f"Query count grew with collection size: {before} -> {after}"
+        print(f"✅ /treatments uses {after} queries per request")
+
+    def test_stream_treatments(self, authenticated_session):
+        """ทดสอบการ export treatments แบบ NDJSON (หนึ่งเอกสารต่อบรรทัด)"""
+        response = authenticated_session.get(
+            f"{TestConfig.BASE_URL}/treatments",
+            headers={"Accept": "application/x-ndjson"},
+            stream=True
+        )
+        assert response.status_code == 200, f"Stream treatments failed: {response.text}"
+        assert response.headers['Content-Type'].startswith('application/x-ndjson')
+
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+        for row in rows:
+            for field in ['_id', 'student', 'symptoms', 'medicines', 'date']:
+                assert field in row, f"Missing field: {field}"
+
+        listed = authenticated_session.get(f"{TestConfig.BASE_URL}/treatments?stream=1&fields=_id")
+        assert listed.status_code == 200
+        assert len([line for line in listed.text.splitlines() if line]) == len(rows)
+        print(f"✅ Streamed {len(rows)} treatments")
+
     def test_get_treated_students(self, authenticated_session):
         """ทดสอบการดึงรายชื่อนักเรียนที่ได้รับการรักษา"""
         response = authenticated_session.get(f"{TestConfig.BASE_URL}/treated_students")
@@ -441,6 +976,225 @@ class TestTreatmentsAPI:
         assert isinstance(result['history'], list)
         print(f"✅ Treatment history: {result['treatment_count']} treatments")
 
+    def test_treatment_history_pagination(self, authenticated_session, sample_student_id):
+        """ทดสอบการแบ่งหน้าประวัติการรักษา (ใหม่ไปเก่า) ด้วย next_cursor"""
+        for i in range(3):
+            response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json={
+                "student_id": sample_student_id,
+                "symptoms": f"Pytest history {i}"
+            })
+            assert response.status_code in [200, 201]
+
+        url = f"{TestConfig.BASE_URL}/treatment_history/{sample_student_id}"
+        first = authenticated_session.get(url, params={"limit": 2}).json()
+        assert len(first['history']) == 2
+        assert first['treatment_count'] >= 3
+        assert first['next_cursor']
+        dates = [t['date'] for t in first['history']]
+        assert dates == sorted(dates, reverse=True)
+
+        second = authenticated_session.get(url, params={"limit": 2, "after": first['next_cursor']}).json()
+        first_ids = {t['id'] for t in first['history']}
+        assert second['history'] and not first_ids & {t['id'] for t in second['history']}
+        assert second['treatment_count'] == first['treatment_count']  # มีจำนวนทั้งหมดทุกหน้า
+
+        # cursor ที่ decode ได้แต่ไม่ใช่ string (เช่น [1, 2]) ต้องได้ 400 ไม่ใช่ 500
+        import base64
+        bad_cursor = base64.urlsafe_b64encode(b'[1, 2]').decode('ascii').rstrip('=')
+        for after in ("not-a-cursor", bad_cursor):
+            response = authenticated_session.get(url, params={"after": after})
+            assert response.status_code == 400, f"{after}: {response.status_code}"
+        print("✅ Treatment history paginated newest first")
+
+    def test_treatment_name_snapshots(self, authenticated_session):
+        """ทดสอบว่าชื่อนักเรียนใน treatment ตามการแก้ชื่อผ่าน PUT /students (ผ่าน background job)"""
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json={
+            **TestConfig.TEST_STUDENT,
+            "student_id": f"SNAP{datetime.now().strftime('%H%M%S%f')}",
+            "name": "Snapshot Before"
+        })
+        assert response.status_code in [200, 201]
+        student = response.json()['student']
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json={
+            "student_id": student['student_id'],
+            "symptoms": "Pytest snapshot"
+        })
+        assert response.status_code in [200, 201]
+        assert response.json()['student']['name'] == "Snapshot Before"
+        treatment_id = response.json()['_id']
+
+        authenticated_session.put(f"{TestConfig.BASE_URL}/students/{student['id']}", json={"name": "Snapshot After"})
+        # รอให้งาน sync ที่ส่งเข้า background thread ทำเสร็จ แทนการ poll ด้วย sleep
+        assert requests.get(TestConfig.BASE_URL.replace('/api', '/debug/snapshots')).status_code == 200
+
+        treatments = get_all(authenticated_session, f"{TestConfig.BASE_URL}/treatments")
+        treatment = next(t for t in treatments if t['_id'] == treatment_id)
+        assert treatment['student']['name'] == "Snapshot After"
+        print("✅ Treatment snapshot follows student rename")
+
+
+    def test_delete_treatment(self, authenticated_session, sample_student_id):
+        """ทดสอบการลบ treatment"""
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json={
+            "student_id": sample_student_id,
+            "symptoms": "Pytest delete"
+        })
+        assert response.status_code in [200, 201], f"Create treatment failed: {response.text}"
+        treatment_id = response.json()['_id']
+
+        response = authenticated_session.delete(f"{TestConfig.BASE_URL}/treatments/{treatment_id}")
+        assert response.status_code == 200, f"Delete treatment failed: {response.text}"
+        assert response.json()['_id'] == treatment_id
+
+        response = authenticated_session.delete(f"{TestConfig.BASE_URL}/treatments/{treatment_id}")
+        assert response.status_code == 404
+        print("✅ Treatment deleted successfully")
+
+
+class TestStatsAPI:
+    """Test dashboard statistics endpoints"""
+
+    def test_dashboard_stats(self, authenticated_session, sample_student_id, sample_medicine_id):
+        """ทดสอบสถิติสำหรับ dashboard ที่คำนวณด้วย aggregation ฝั่ง server"""
+        authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json={
+            "student_id": sample_student_id,
+            "symptoms": "Pytest Stats Fever, pytest stats cough",
+            "medicine_ids": [sample_medicine_id]
+        })
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/stats/dashboard")
+        assert response.status_code == 200, f"Get dashboard stats failed: {response.text}"
+
+        result = response.json()
+        for field in ['from', 'to', 'data']:
+            assert field in result, f"Missing field: {field}"
+        data = result['data']
+        for field in ['visits_per_day', 'top_symptoms', 'top_medicines', 'visits_by_department']:
+            assert field in data, f"Missing field: {field}"
+
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        assert any(day['date'] == today and day['count'] >= 1 for day in data['visits_per_day'])
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/stats/top_symptoms?limit=100")
+        symptoms = [s['symptom'] for s in response.json()['data']]
+        assert 'pytest stats fever' in symptoms
+        print(f"✅ Dashboard stats: {len(data['visits_per_day'])} days, {len(symptoms)} symptoms")
+
+    def test_rollup_tracks_writes(self, authenticated_session, sample_student_id, sample_medicine_id):
+        """ทดสอบว่า rollup เพิ่ม/ลดตามการสร้าง แก้วันที่ (มี timezone) และลบ treatment และตรงกับการคำนวณจากข้อมูลดิบ"""
+        url = f"{TestConfig.BASE_URL}/stats/visits_per_day?from=2001-01-01&to=2001-01-03"
+
+        def both():
+            rollup = authenticated_session.get(url).json()['data']
+            raw = authenticated_session.get(f"{url}&source=raw").json()['data']
+            assert rollup == raw, f"Rollup {rollup} differs from raw {raw}"
+            return {day['date']: day['count'] for day in rollup}
+
+        before = both()
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json={
+            "student_id": sample_student_id,
+            "symptoms": "Pytest rollup",
+            "medicine_ids": [sample_medicine_id]
+        })
+        assert response.status_code in [200, 201], f"Create treatment failed: {response.text}"
+        treatment_id = response.json()['_id']
+
+        # 22:00 ที่ UTC-5 คือ 03:00 UTC ของวันถัดไป
+        response = authenticated_session.put(f"{TestConfig.BASE_URL}/treatments/{treatment_id}",
+                                             json={"date": "2001-01-01T22:00:00-05:00"})
+        assert response.status_code == 200, f"Update treatment failed: {response.text}"
+        assert response.json()['date'].startswith('2001-01-02T03:00:00')
+        after_update = both()
+        assert after_update.get('2001-01-02', 0) == before.get('2001-01-02', 0) + 1
+        assert after_update.get('2001-01-01', 0) == before.get('2001-01-01', 0)
+
+        response = authenticated_session.delete(f"{TestConfig.BASE_URL}/treatments/{treatment_id}")
+        assert response.status_code == 200
+        assert both() == before
+        print("✅ Rollup follows create, update and delete")
+
+    def test_rebuild_rollups(self, authenticated_session, mongodb_client):
+        """ทดสอบ flask db rebuild-rollups: แก้ rollup ที่ผิดให้ตรงข้อมูลดิบ และเปลี่ยน ETag ของ stats"""
+        db = mongodb_client[os.getenv('MONGO_DB', 'hospital_room')]
+        url = f"{TestConfig.BASE_URL}/stats/visits_per_day"
+        etag = authenticated_session.get(url).headers['ETag']
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        db.treatment_rollup.update_one({'day': today, 'department': 'Pytest Rollup', 'medicine': None},
+                                       {'$inc': {'count': 5}}, upsert=True)
+
+        result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', 'rebuild-rollups'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert db.treatment_rollup.count_documents({'department': 'Pytest Rollup'}) == 0
+
+        response = authenticated_session.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200, "Rebuild must invalidate the stats ETag"
+        assert response.json()['data'] == authenticated_session.get(f"{url}?source=raw").json()['data']
+        print("✅ Rollup rebuild matches raw treatments")
+
+    def test_rollup_orphaned_treatment(self, authenticated_session, sample_student_id):
+        """ทดสอบ treatment ที่นักเรียนถูกลบไปแล้ว: ย้ายไปนักเรียนคนอื่นและลบได้ (ไม่ตอบ 500) และ rollup ยังตรงกับข้อมูลดิบ"""
+        url = f"{TestConfig.BASE_URL}/stats/visits_per_day?from=2001-02-01&to=2001-02-02"
+
+        def both():
+            rollup = authenticated_session.get(url).json()['data']
+            raw = authenticated_session.get(f"{url}&source=raw").json()['data']
+            assert rollup == raw, f"Rollup {rollup} differs from raw {raw}"
+            return rollup
+
+        before = both()
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json={
+            **TestConfig.TEST_STUDENT, "student_id": f"ORPHAN_{datetime.now().microsecond}", "department": "Pytest Orphan"
+        })
+        assert response.status_code in [200, 201]
+        student = response.json()['student']
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json={
+            "student_id": student['student_id'], "symptoms": "Pytest orphan"
+        })
+        assert response.status_code in [200, 201], f"Create treatment failed: {response.text}"
+        treatment_url = f"{TestConfig.BASE_URL}/treatments/{response.json()['_id']}"
+        assert authenticated_session.put(treatment_url, json={"date": "2001-02-01T10:00:00"}).status_code == 200
+
+        authenticated_session.put(f"{TestConfig.BASE_URL}/students/{student['id']}", json={"department": "Pytest Moved"})
+        assert authenticated_session.delete(f"{TestConfig.BASE_URL}/students/{student['id']}").status_code == 200
+
+        response = authenticated_session.put(treatment_url, json={"student_id": sample_student_id})
+        assert response.status_code == 200, f"Reassigning an orphaned treatment failed: {response.text}"
+        both()
+        response = authenticated_session.delete(treatment_url)
+        assert response.status_code == 200, f"Delete failed: {response.text}"
+        assert both() == before
+        print("✅ Orphaned treatments can be reassigned and deleted")
+
+    def test_rollup_department_change(self, authenticated_session, mongodb_client):
+        """ทดสอบแก้แผนกของนักเรียน: rollup ใช้แผนก ณ เวลาที่รักษา จึงยังตรงกับ rebuild-rollups --verify"""
+        db = mongodb_client[os.getenv('MONGO_DB', 'hospital_room')]
+        department = f"Pytest Dept {datetime.now().microsecond}"
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/students", json={
+            **TestConfig.TEST_STUDENT, "student_id": f"DEPT_{datetime.now().microsecond}", "department": department
+        })
+        assert response.status_code in [200, 201]
+        student = response.json()['student']
+        response = authenticated_session.post(f"{TestConfig.BASE_URL}/treatments", json={
+            "student_id": student['student_id'], "symptoms": "Pytest department"
+        })
+        assert response.status_code in [200, 201], f"Create treatment failed: {response.text}"
+
+        response = authenticated_session.put(f"{TestConfig.BASE_URL}/students/{student['id']}",
+                                             json={"department": f"{department} moved"})
+        assert response.status_code == 200
+        assert db.treatment_rollup.count_documents({'department': department, 'medicine': None, 'count': 1}) == 1
+
+        result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', 'rebuild-rollups', '--verify'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        assert result.returncode == 0, result.stdout + result.stderr
+        print("✅ Rollups keep the department at treatment time")
+
+    def test_stats_invalid_range(self, authenticated_session):
+        """ทดสอบช่วงวันที่ไม่ถูกต้อง"""
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/stats/visits_per_day?from=2024-02-01&to=2024-01-01")
+        assert response.status_code == 400
+
 
 class TestAPIErrors:
     """Test API error handling"""
@@ -500,6 +1254,28 @@ class TestAPIErrors:
         response = authenticated_session.post(f"{TestConfig.BASE_URL}/medicines", json=invalid_medicine)
         assert response.status_code == 400
 
+    def test_rate_limit(self, authenticated_session):
+        """ทดสอบ rate limit: request ที่ไม่มี token ได้ 429 + Retry-After แต่ผู้ใช้ที่ login แล้วใช้ bucket ของตัวเอง"""
+        root = TestConfig.BASE_URL.rsplit('/api', 1)[0]
+        stats = requests.get(f"{root}/debug/ratelimit").json()
+        if not stats['enabled']:
+            pytest.skip("RATE_LIMIT_ENABLED is off")
+        if not stats['trusted_proxies']:
+            pytest.skip("Needs RATE_LIMIT_TRUSTED_PROXIES >= 1 to test with its own client IP")
+        # IP สมมติของ test นี้ผ่าน X-Forwarded-For: bucket ของ IP อื่น (รวมถึงของ test อื่น) ไม่ถูกใช้
+        headers = {"X-Forwarded-For": f"198.51.100.{datetime.now().microsecond % 250 + 1}"}
+        for _ in range(200):
+            response = requests.get(f"{TestConfig.BASE_URL}/get_user", headers=headers)
+            if response.status_code == 429:
+                break
+        else:
+            pytest.fail("No 429 after 200 anonymous requests from one IP")
+        assert int(response.headers['Retry-After']) >= 1
+        assert response.json()['error'] == 'Too many requests'
+
+        response = authenticated_session.get(f"{TestConfig.BASE_URL}/medicines", headers=headers)
+        assert response.status_code == 200
+        print("✅ Rate limit returns 429 with Retry-After")
 
 if __name__ == "__main__":
     """รัน tests ด้วย pytest"""
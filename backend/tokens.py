@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from flask_jwt_extended import JWTManager
+
+from cache import MemoryBackend, MISSING
+from models import RevokedToken
+
+# ผู้ใช้ปัจจุบันที่สร้างจาก claims ของ token (current_user) ไม่ต้อง query User ทุก request
+TokenUser = namedtuple('TokenUser', ['id', 'username'])
+
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class ClaimsCache:
+    """
+    cache ของ token ที่ตรวจ signature แล้ว -> claims (LRU จำกัดจำนวน)
+    แต่ละ entry หมดอายุพร้อมกับ exp ของ token หลังจากนั้นจะถูกตรวจใหม่ (และได้ error หมดอายุตามปกติ)
+    """
+
+    def __init__(self, max_entries=10000):
+        self._backend = MemoryBackend(max_entries)
+
+    def configure(self, max_entries):
+        self._backend = MemoryBackend(max_entries)
+
+    def get(self, token):
+        claims = self._backend.get(token)
+        return None if claims is MISSING else claims
+
+    def get_or_decode(self, token, decode):
+        """claims จาก cache หรือ decode(token) แล้วเก็บไว้ (ใช้ทั้ง TokenManager และ async_app)"""
+        claims = self.get(token)
+        if claims is None:
+            claims = decode(token)
+            self.set(token, claims)
+        return claims
+
+    def set(self, token, claims):
+        # token ที่ไม่มี exp ไม่ cache (ตรวจใหม่ทุกครั้ง)
+        exp = claims.get('exp')
+        if exp is None:
+            return
+        ttl = exp - time.time()
+        if ttl > 0:
+            self._backend.set(token, claims, ttl)
+
+    def clear(self):
+        self._backend.clear()
+
+    def __len__(self):
+        return len(self._backend)
+
+
+class RevocationList:
+    """
+    jti ของ token ที่ถูกยกเลิก (POST /logout) เก็บไว้ใน memory ของแต่ละ worker
+    ดึงรายการที่เพิ่มใหม่จาก collection RevokedToken ทุก interval วินาที (ไม่ query ทุก request)
+    worker ที่รับ logout เห็นผลทันที worker อื่นเห็นภายใน interval วินาที
+    """
+
+    def __init__(self, interval=30):
+        self.interval = interval
+        self._revoked = {}  # jti -> exp (unix time)
+        self._synced_at = None
+        self._syncing = False
+        self._lock = threading.Lock()
+
+    def configure(self, interval):
+        with self._lock:
+            self.interval = interval
+            self._revoked.clear()
+            self._synced_at = None
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._revoked[jti] = exp
+
+    def __contains__(self, jti):
+        return jti in self._revoked
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def begin_sync(self):
+        """
+        จองการ sync ถ้าถึงเวลา คืนเวลาที่ต้องดึงรายการตั้งแต่นั้น (None = ดึงทั้งหมด)
+        คืน MISSING ถ้ายังไม่ถึงเวลาหรือมี thread อื่นกำลัง sync อยู่
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._syncing or (self._synced_at is not None and now - self._synced_at[0] < self.interval):
+                return MISSING
+            self._syncing = True
+            # ดึงซ้อนช่วงเวลาเล็กน้อย เผื่อเอกสารที่เขียนระหว่าง sync ครั้งก่อนหรือนาฬิกาแต่ละเครื่องไม่ตรงกัน
+            return self._synced_at and self._synced_at[1] - SYNC_OVERLAP
+
+    def finish_sync(self, rows, started):
+        """rows = [(jti, expires_at), ...] ที่ดึงมาตั้งแต่ begin_sync, started = datetime ก่อนเริ่ม query"""
+        now = time.time()
+        with self._lock:
+            for jti, expires_at in rows:
+                self._revoked[jti] = expires_at.replace(tzinfo=timezone.utc).timestamp()
+            # token ที่หมดอายุแล้วถูกปฏิเสธด้วย exp อยู่แล้ว ไม่ต้องจำ jti ต่อ
+            self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+            self._synced_at = (time.monotonic(), started)
+            self._syncing = False
+
+    def abort_sync(self):
+        with self._lock:
+            self._syncing = False
+
+    @staticmethod
+    def sync_query(since):
+        """filter ของ RevokedToken ที่ต้องดึงตั้งแต่ since (จาก begin_sync) และ projection ใช้ร่วมกับ async_app"""
+        return ({'revoked_at': {'$gte': since}} if since else {}), {'expires_at': 1}
+
+    def sync(self):
+        """sync กับ MongoDB ถ้าถึงเวลา (ใช้ใน Flask app; async_app ใช้ begin_sync/finish_sync กับ Motor)"""
+        since = self.begin_sync()
+        if since is MISSING:
+            return
+        started = datetime.utcnow()
+        try:
+            query, projection = self.sync_query(since)
+            rows = [(doc['_id'], doc['expires_at']) for doc in RevokedToken._get_collection().find(query, projection)]
+        except Exception:
+            self.abort_sync()
+            raise
+        self.finish_sync(rows, started)
+
+    def is_revoked(self, jti):
+        self.sync()
+        return jti in self
+
+
+claims_cache = ClaimsCache()
+revocations = RevocationList()
+
+
+class TokenRevoked(jwt.InvalidTokenError):
+    """token ที่ logout แล้ว (jti อยู่ใน revocations)"""
+
+
+def access_claims(token, config):
+    """
+    claims ของ access token สำหรับ async_app (เทียบเท่าการตรวจของ flask_jwt_extended + TokenManager)
+    ใช้ claims_cache และ revocations เดียวกัน raise jwt.ExpiredSignatureError, TokenRevoked
+    หรือ jwt.InvalidTokenError ถ้าใช้ไม่ได้ (revocations ต้อง sync ไว้ก่อนโดยผู้เรียก)
+    """
+    claims = claims_cache.get_or_decode(token, lambda t: jwt.decode(
+        t, config['JWT_SECRET_KEY'], algorithms=[config.get('JWT_ALGORITHM', 'HS256')]
+    ))
+    if claims.get('type') != 'access':
+        raise jwt.InvalidTokenError('Not an access token')
+    if claims.get('jti') in revocations:
+        raise TokenRevoked('Token has been revoked')
+    return claims
+
+
+class TokenManager(JWTManager):
+    """
+    JWTManager ที่ cache claims ของ token ที่ตรวจแล้ว (ไม่ต้องตรวจ HMAC ซ้ำทุก request)
+    การตรวจ type, fresh และ blocklist ของ flask_jwt_extended ยังทำทุก request ตามปกติ
+    """
+
+    def init_app(self, app, add_context_processor=False):
+        super().init_app(app, add_context_processor)
+        claims_cache.configure(app.config.get('JWT_CLAIMS_CACHE_SIZE', 10000))
+        revocations.configure(app.config.get('JWT_REVOCATION_SYNC_SECONDS', 30))
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        # token แบบ cookie (มี csrf) และการ decode แบบยอมรับ token หมดอายุ ไม่ผ่าน cache
+        if csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        return claims_cache.get_or_decode(encoded_token, super()._decode_jwt_from_config)
+
+
+def user_claims(user):
+    """claims เพิ่มเติมที่ใส่ใน access token ตอน login (ใช้สร้าง current_user โดยไม่ query User)"""
+    return {'username': user.username}
+
+
+def revoke(claims):
+    """ยกเลิก token (logout) บันทึก jti ลง RevokedToken ซึ่งถูกลบอัตโนมัติเมื่อ token หมดอายุ"""
+    exp = claims.get('exp') or time.time() + 86400
+    RevokedToken(jti=claims['jti'], expires_at=datetime.utcfromtimestamp(exp)).save()
+    revocations.add(claims['jti'], exp)
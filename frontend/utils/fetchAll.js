@@ -0,0 +1,11 @@
+// โหลด list endpoint ทุกหน้า: API ส่งหน้าละ PAGE_DEFAULT_LIMIT รายการ และบอกหน้าถัดไปใน header X-Next-Cursor
+export async function fetchAll(axiosInstance, url) {
+  const items = []
+  let after = null
+  do {
+    const res = await axiosInstance.get(url, { params: after ? { after } : {} })
+    items.push(...res.data)
+    after = res.headers['x-next-cursor']
+  } while (after)
+  return items
+}